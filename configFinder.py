@@ -5,99 +5,241 @@ Author: William Heidorn, Iowa State University
 About: This program takes a thermal image of an ATLAS Itk Stave Support, and
   finds the stave and produces 4 points that contain the stave
 
-Requires: pyROOT, Python 2.7, OpenCV
+Requires: pyROOT (for the plots only), Python 2.7, OpenCV (for Canny and Hough only)
+  The image may be a root or npy frame, see frameStorage.py
+  The pixel loops are numpy array operations; the diagnostic plots
+  (AllFoundLines.pdf/.root) are filled in bulk and only made with bolPlot.
+
+  Geometry cache (strCacheDir, off unless given, frameanal.py -gc): the
+  stave lines found with Hough are stored in strCacheDir/geometry.json with
+  a fingerprint of the frame, the row and column projections of
+  |T - median T| (64 bins, standardised). A later frame of the same shape
+  whose fingerprint is within GEOMETRY_TOLERANCE (RMS of the differences)
+  reuses the lines and skips Canny and Hough, if VerifyGeometry confirms
+  them on the new frame: every edge must be within GEOMETRY_EDGE_TOLERANCE
+  (1) pixel of the strongest step of the temperature projection around it,
+  i.e. on one of the two pixels of the step or next to them. A stave moved
+  by 2 pixels or more is found again with Hough.
+  The cut fractions, the stave side and the temperatures are always
+  computed from the new frame.
+
+  Hough (HoughLines) runs with the angular resolutions of a schedule
+  (HOUGH_SCHEDULES). The default "full" schedule is the original passes on
+  the whole image. "strips" and "fast" (opt-in) run coarse to fine: the
+  stave band is located from the row projection of the Canny edges (at
+  least BAND_MIN_EDGES edge pixels per row), then both Hough passes search
+  only that band, "fast" with coarser angles for about an order of
+  magnitude less time.
+
+  Projection engine (strEngine "projection"): the stave is the axis-aligned
+  rectangle of largest contrast, its edges are the strongest steps of the
+  row and column projections of |T - median T|, interpolated to sub-pixel
+  with a parabola. O(pixels), no Canny or Hough parameters. Hough is only
+  run if a step is ambiguous (the next strongest step is above
+  PROJECTION_AMBIGUITY of it) or the stave length is not the expected one.
+
+  Stability study: python configFinder.py roo/ [-n N] [-j N] runs FindPoints
+  on all (or N evenly spaced) single frames of a recording in a process
+  pool, writes plot/stability.csv, prints the distribution and the jitter of
+  the pipe region edges and writes the consensus config_frame. The exit
+  status is 1 if an edge jitters more than -mj pixels (RMS), a frame fails or
+  the stave side changes: a quick check of the camera alignment.
 
 '''
 
+import os
+import re
+import sys
+import json
+import time
+import shutil
+import tempfile
+import collections
+import multiprocessing
 import numpy as np
-import cv2
-import ROOT
 
-def FindPoints(strImageFile,strOutputFile,outdir,bol14ModCore = False,xPixels = 640,yPixels = 480,fltxPercentCutL=0.05,fltxPercentCutR=0.023,fltyPercentCut=0.20):
+import frameLoader as fl
+import frameCache as fc
+from lazyRoot import ROOT
+
+def OpenRange(fltLow,fltHigh):
   """
-  This function takes an input root stave image and finds all of the appropriate
-  locations on the stave and creates a config file.
+  Returns the slice of the pixel indexes i with fltLow < i < fltHigh
   """
+  return slice(max(0,int(np.floor(fltLow))+1),max(0,int(np.ceil(fltHigh))))
 
-  try:
-    #Load in the file
-    imageFile = ROOT.TFile(strImageFile,"read")
-  except:
-    print("Failed to Load ImageFile")
-    return
-  Tree = imageFile.Get("atree")
-  _temperature = np.zeros(1,dtype=float)
-  Tree.SetBranchAddress("temperature",_temperature)
-
-  #Load the image from TTree
-  image = np.full((xPixels,yPixels),-999.) #A tree full of -999 used as a placeholder
-
-  bolAvgFrame = False
-  if "frame_average.root" in strImageFile:
-    bolAvgFrame = True
-  
-  if bolAvgFrame == True:  
-    for i in range(xPixels):
-      for j in range(yPixels):
-        Tree.GetEntry(i*yPixels + j)      #Reading from an average frame
-        image[i][j] = _temperature[0] 
+def FillHist2D(hist,image):
+  """
+  Fills a TH2 with an image[x][y] in one call, pixel (x,y) in bin (x+1,y+1)
+  """
+  xPixels,yPixels = image.shape
+  x,y = np.meshgrid(np.arange(xPixels,dtype=float)+0.5,np.arange(yPixels,dtype=float)+0.5,indexing="ij")
+  hist.FillN(image.size,x.ravel(),y.ravel(),np.ascontiguousarray(image,dtype=float).ravel())
 
-  else:  
-    for i in range(xPixels):
-      for j in range(yPixels):
-        Tree.GetEntry(j*xPixels + i) #Reading from a single frame
-        image[i][j] = _temperature[0] 
+def DrawLine(canvas,x1,y1,x2,y2,intColor,intWidth):
+  """
+  Draws a line on the canvas and keeps it in canvas.lines, nothing without a canvas
+  """
+  if canvas is None:
+    return
+  lineObj = ROOT.TLine(x1,y1,x2,y2)
+  lineObj.SetLineColor(intColor)
+  lineObj.SetLineWidth(intWidth)
+  canvas.lines += [lineObj]
+  lineObj.Draw()
 
+def BestWindow(image,lstPoints,fltOffset0,fltOffset1,lstRows,fltTRoom = 20.):
+  """
+  Returns the point P of lstPoints whose window of x pixels
+  [int(P+fltOffset0), int(P+fltOffset1)) has the largest contrast to room
+  temperature, sum of |image[x][y] - fltTRoom| over the rows lstRows. The
+  first point wins a tie, 0 is returned if no window has any contrast. The
+  windows are clipped to the image. All the window sums come from one
+  cumulative sum over x, O(N) instead of O(N*StaveLength).
+  """
+  if len(lstPoints) == 0:
+    return 0
+  contrast = np.abs(image[:,lstRows] - fltTRoom).sum(axis=1)
+  cumulative = np.concatenate(([0.],np.cumsum(contrast)))
+  xPixels = len(contrast)
+  lows = np.array([int(Point+fltOffset0) for Point in lstPoints])
+  highs = np.array([int(Point+fltOffset1) for Point in lstPoints])
+  lows = np.clip(lows,0,xPixels)
+  highs = np.clip(highs,lows,xPixels)
+  scores = cumulative[highs] - cumulative[lows]
+  iBest = int(np.argmax(scores))
+  if not scores[iBest] > 0.0:
+    return 0
+  return lstPoints[iBest]
+
+def MakeCanvas(image,image2 = None):
+  """
+  Makes the canvas of the found lines: the Canny image (if given) that can be
+  checked, then the original image on which the lines are drawn
+  """
+  xPixels,yPixels = image.shape
+  orighist = ROOT.TH2F("originalplot","OriginalPlot;xPixel;yPixel",xPixels,0,xPixels,yPixels,0,yPixels)
+  FillHist2D(orighist,image)
 
+  c2 = ROOT.TCanvas("c2")
+  c2.cd()
+  c2.hists = [orighist]  #The histograms live as long as the canvas
+  if image2 is not None:
+    histcanny = ROOT.TH2F("cannyplot","Canny Plot;xPixel;yPixel",xPixels,0,xPixels,yPixels,0,yPixels)
+    FillHist2D(histcanny,image2)
+    histcanny.Draw("colz")
+    c2.Update()
+    c2.hists += [histcanny]
+  c2.lines = []  #The lines stored in the canvas to show the buildup
+  orighist.Draw("colz")
+  return c2
 
-  # Make The Canny Image
+def StaveLengthCut(bol14ModCore):
+  """
+  Returns (stave core length in pixels, tolerated fraction of it)
+  """
+  if bol14ModCore == False:
+    return (548.2,0.05) #13 module stave core length in pixels
+  return (580,0.02) #~14 module stave core length (This is approximated from a Yale thermal image from Rec-000110)
+
+#Hough resolution schedules: (theta of the long horizontal lines, theta of the
+#short vertical lines, half width in pixels of the strip searched around the
+#stave band found from the edge rows, None to search the whole image)
+HOUGH_SCHEDULES = {
+  "full":   (np.pi/1000,np.pi/10000,None), #the original passes on the whole image
+  "strips": (np.pi/1000,np.pi/10000,10),   #the same resolution in the stave band
+  "fast":   (np.pi/500,np.pi/2000,10),     #coarser angles in the stave band
+}
+#edge pixels (over 5 rows) of a row of the stave band, see StaveBand
+BAND_MIN_EDGES = 100
+
+def StaveBand(image2,intStrip,intCentre = 50,intMinEdges = BAND_MIN_EDGES):
+  """
+  Returns the rows [Y0, Y1) of the Canny image image2[x][y] around the stave:
+  the rows within intCentre of the middle with at least intMinEdges edge
+  pixels (over 5 rows, for tilted edges), plus intStrip rows on each side.
+  The whole image if there are none.
+  """
+  xPixels,yPixels = image2.shape
+  counts = np.convolve((image2 > 0).sum(axis=0).astype(float),np.ones(5),mode="same")
+  low = max(0,yPixels//2-intCentre)
+  high = min(yPixels,yPixels//2+intCentre+1)
+  rows = low + np.nonzero(counts[low:high] >= intMinEdges)[0]
+  if len(rows) == 0:
+    return (0,yPixels)
+  return (max(0,int(rows.min())-intStrip),min(yPixels,int(rows.max())+intStrip+1))
+
+def HoughSegments(image2,fltTheta,intThreshold,intMinLength,intMaxGap,intY0 = 0,intY1 = None):
+  """
+  Returns the line segments [y1, x1, y2, x2] (cv2 order) found with the
+  probabilistic Hough transform in the rows intY0 <= y < intY1 of the Canny
+  image image2[x][y], an empty list if there are none
+  """
+  import cv2 #OpenCV only where Canny and Hough run, not for the projection engine
+  strip = np.ascontiguousarray(image2[:,intY0:intY1])
+  lines = cv2.HoughLinesP(strip,rho = 1,theta = fltTheta,threshold = intThreshold,minLineLength = intMinLength,maxLineGap = intMaxGap)
+  if lines is None:
+    return []
+  lines = lines.reshape(-1,4)
+  lines[:,0] += intY0
+  lines[:,2] += intY0
+  return list(lines)
+
+def CannyImage(image,fltSigma = 0.33):
+  """
+  Returns the Canny edges of image[x][y], thresholds (1 -+ fltSigma) of the
+  median temperature
+  """
+  import cv2
   v = np.median(image)
 
-  sigma = 0.33
-  lower = int(max(0,(1-sigma)*v))
-  upper = int(min(255,(1+sigma)*v))
+  lower = int(max(0,(1-fltSigma)*v))
+  upper = int(min(255,(1+fltSigma)*v))
 
   laplacian = cv2.Canny(np.uint8(image),lower,upper)
   image2 = laplacian
+  image2[image2 <= 100] = 0 #Replace any small numbers with 0
+  return image2
 
-  #Makes a Canny Image that can be checked
-  histcanny = ROOT.TH2F("cannyplot","Canny Plot;xPixel;yPixel",xPixels,0,xPixels,yPixels,0,yPixels)
-  orighist = ROOT.TH2F("originalplot","OriginalPlot;xPixel;yPixel",xPixels,0,xPixels,yPixels,0,yPixels)
-  for i in range(xPixels):
-    for j in range(yPixels):
-      orighist.Fill(i,j,image[i][j])
-      if image2[i][j] > 100:
-        histcanny.Fill(i,j,image2[i][j])
-      else:
-        histcanny.Fill(i,j,0)
-        image2[i][j] = 0 #Replace any small numbers with 0
+def HoughLines(image,xPixels,yPixels,bol14ModCore,lstRows,bolPlot,strHough = "full",image2 = None,intLongThreshold = 100,intShortThreshold = 20,fltStaveLength = None,intBandEdges = BAND_MIN_EDGES):
+  """
+  Finds the stave lines of image[x][y] with Canny edges and Hough transforms,
+  with the resolution schedule strHough (see HOUGH_SCHEDULES). The Canny
+  image image2 (CannyImage) is made if not given. The Hough vote thresholds
+  of the long and short lines and the stave length in pixels (default from
+  StaveLengthCut) can be changed, e.g. by configSweep.py. intBandEdges is
+  the edge count of the stave band rows (StaveBand) of "strips" and "fast".
+  Returns ([y1, y0, x1, x0], canvas of the lines or None without bolPlot)
+  """
+  # Make The Canny Image
+  if image2 is None:
+    image2 = CannyImage(image)
 
-  c2 = ROOT.TCanvas("c2")
-  c2.cd()
-  histcanny.Draw("colz")
-  c2.Update()
+  c2 = None
+  if bolPlot:
+    c2 = MakeCanvas(image,image2)
+
+  #Coarse to fine: the stave band from the row projection of the edges, then
+  #the Hough passes with the angular resolutions of the schedule in it only
+  fltLongTheta,fltShortTheta,intStrip = HOUGH_SCHEDULES[strHough]
+  intBand0,intBand1 = 0,yPixels
+  if intStrip is not None:
+    intBand0,intBand1 = StaveBand(image2,intStrip,intMinEdges = intBandEdges)
 
 
   # Find the Four Corners of the Pipe Area
 
-  c2.lines = []  #The lines stored in the canvas to show the buildup
   lineData = []  #This will be the four points
   HorData  = []  #The average y value of each horizontal line
   VertData = []  #The average x value of each vertical line
   ShortHorData = []
-
-  orighist.Draw("colz")
  
 #------------------------------------------------------------------------------
   try:
     #Find Long Horiz Lines
-    findLongLines = cv2.HoughLinesP(image2,rho = 1,theta = 1*np.pi/1000,threshold = 100,minLineLength = 200,maxLineGap = 175)
-
-    findLongLines = findLongLines.flatten()
-    nlines = len(findLongLines)/4
-    findLongLines = np.split(findLongLines,nlines)
+    findLongLines = HoughSegments(image2,fltLongTheta,intLongThreshold,200,175,intBand0,intBand1)
 
-    LengthHoriz = nlines
+    LengthHoriz = len(findLongLines)
     for line in range(int(LengthHoriz)):
       x1 = findLongLines[line][1]
       y1 = findLongLines[line][0]
@@ -108,21 +250,17 @@ def FindPoints(strImageFile,strOutputFile,outdir,bol14ModCore = False,xPixels =
       intercept =y1-x1*(slope)
 
       HorData += [(y1+y2)/2]
-      lineObj = ROOT.TLine(x1,y1,x2,y2)
-      lineObj.SetLineColor(3)
-      lineObj.SetLineWidth(3)
-      c2.lines += [lineObj]
-      lineObj.Draw()
+      DrawLine(c2,x1,y1,x2,y2,3,3)
 
     HorData = np.sort(HorData) 
-    CentSep = np.amax(abs(HorData-240))
+    CentSep = np.amax(abs(HorData-yPixels/2))
     while CentSep > 50:
       lenHor = np.size(HorData)
-      if abs(HorData[0]-240)> 50:
+      if abs(HorData[0]-yPixels/2)> 50:
         HorData = np.delete(HorData,0)
       else:
         HorData = np.delete(HorData,lenHor-1)
-      CentSep = np.amax(abs(HorData-240))
+      CentSep = np.amax(abs(HorData-yPixels/2))
 
     lineData += [np.amax(HorData)]
     lineData += [np.amin(HorData)]
@@ -130,25 +268,18 @@ def FindPoints(strImageFile,strOutputFile,outdir,bol14ModCore = False,xPixels =
     
   except:
     print("Failed to Find Long Horizontal Lines. Using standard value for centered stave core")
-    lineData += [265]
-    lineData += [215]
+    lineData += [yPixels/2+25]
+    lineData += [yPixels/2-25]
 
 #------------------------------------------------------------------------------   
 #Find Short Vert Lines
-  if bol14ModCore == False:
-    StaveLength = 548.2 #13 module stave core length in pixels
-    cutPercent= 0.05
-  else:
-    StaveLength = 580 #~14 module stave core length (This is approximated from a Yale thermal image from Rec-000110)
-    cutPercent= 0.02
+  StaveLength,cutPercent = StaveLengthCut(bol14ModCore)
+  if fltStaveLength is not None:
+    StaveLength = fltStaveLength
   try:
-    findShortLines = cv2.HoughLinesP(image2,rho = 1,theta = 1*np.pi/10000,threshold = 20,minLineLength = 10, maxLineGap = 5)
+    findShortLines = HoughSegments(image2,fltShortTheta,intShortThreshold,10,5,intBand0,intBand1)
 
-    findShortLines = findShortLines.flatten()
-    nlines = len(findShortLines)/4
-    findShortLines = np.split(findShortLines,nlines)
-
-    LengthVert = nlines
+    LengthVert = len(findShortLines)
     for line in range(int(LengthVert)):
       x1 = findShortLines[line][1]
       y1 = findShortLines[line][0]
@@ -159,11 +290,7 @@ def FindPoints(strImageFile,strOutputFile,outdir,bol14ModCore = False,xPixels =
 
       if slope > 1: #Since this fit will find many short line segments we want to remove all horiztal lines
         VertData += [(x1+x2)/2]
-        lineObj = ROOT.TLine(x1,y1,x2,y2)
-        lineObj.SetLineColor(2)
-        lineObj.SetLineWidth(4)
-        c2.lines += [lineObj]
-        lineObj.Draw()
+        DrawLine(c2,x1,y1,x2,y2,2,4)
 
     VertData = np.sort(VertData)
     VertData = np.unique(VertData)
@@ -177,24 +304,16 @@ def FindPoints(strImageFile,strOutputFile,outdir,bol14ModCore = False,xPixels =
       maxPoint = np.amax(VertData)
 
       #Found a line at the EOS stave end
-      if minPoint + StaveLength < 640:
+      if minPoint + StaveLength < xPixels:
         #Find the best 
         while len(VertData) > 0:
           #Remove outside possible
-          if maxPoint + StaveLength > 640:
+          if maxPoint + StaveLength > xPixels:
             VertData = np.delete(VertData,-1)
             maxPoint = np.amax(VertData)
           #Get best point
           else:
-            bestPoint = 0
-            bestLineTemp = 0.0
-            for Point in VertData:
-              avgLineTemp=0.0
-              for i in range(int(Point),int(Point+StaveLength)):
-                avgLineTemp += abs(image[i][yPixels/2] - 20.)
-              if avgLineTemp > bestLineTemp:
-                bestPoint = Point
-                bestLineTemp = avgLineTemp
+            bestPoint = BestWindow(image,VertData,0.,StaveLength,lstRows)
             newX = bestPoint + int(StaveLength)
             VertData=[bestPoint,newX] 
             skipConfining = True
@@ -205,20 +324,12 @@ def FindPoints(strImageFile,strOutputFile,outdir,bol14ModCore = False,xPixels =
         #Find the best 
         while len(VertData) > 0:
           #Remove outside possible
-          if minPoint - StaveLength > 640-StaveLength:
+          if minPoint - StaveLength > xPixels-StaveLength:
             VertData = np.delete(VertData,0)
             minPoint = np.amin(VertData)
           #Get best point
           else:
-            bestPoint = 0
-            bestLineTemp = 0.0
-            for Point in VertData:
-              avgLineTemp=0.0
-              for i in range(int(Point-StaveLength),int(Point)):
-                avgLineTemp += abs(image[i][yPixels/2] - 20.)
-              if avgLineTemp > bestLineTemp:
-                bestPoint = Point
-                bestLineTemp = avgLineTemp
+            bestPoint = BestWindow(image,VertData,-StaveLength,0.,lstRows)
             newX = int(bestPoint-StaveLength)
             VertData=[newX,bestPoint]        
             skipConfining = True
@@ -237,7 +348,7 @@ def FindPoints(strImageFile,strOutputFile,outdir,bol14ModCore = False,xPixels =
         else:
           print("Found poor separation of "+ str(VertSep))
           raise("Crud")
-      print VertSep
+      print(VertSep)
       VertDataFrontRemoved = np.delete(VertData,0) 
       VertDataBackRemoved = np.delete(VertData,-1)
       VertSepFR = np.amax(VertDataFrontRemoved)-np.amin(VertDataFrontRemoved)     
@@ -255,43 +366,212 @@ def FindPoints(strImageFile,strOutputFile,outdir,bol14ModCore = False,xPixels =
   except:
     print("Failed to find Short Vertical Lines. Using different method assuming 13 module stave core length")
     VertData = [i for i in range(int(xPixels-StaveLength))]
-    bestPoint = 0
-    bestLineTemp = 0.0
-    for Point in VertData:
-      avgLineTemp=0.0
-      for i in range(int(Point),int(Point+StaveLength)):
-        avgLineTemp += abs(image[i][yPixels/2] - 20.)
-      if avgLineTemp > bestLineTemp:
-        bestPoint = Point
-        bestLineTemp = avgLineTemp
+    bestPoint = BestWindow(image,VertData,0.,StaveLength,lstRows)
     newX = bestPoint + int(StaveLength)        
     lineData+= [newX]
-    lineData+= [bestPoint]  
+    lineData+= [bestPoint]
+
+  return (lineData,c2)
+
 #------------------------------------------------------------------------------
-  #Put the found area on the plot 
-  for i in range(2):
-    lineObj = ROOT.TLine(lineData[2],lineData[i],lineData[3],lineData[i])
-    lineObj2 = ROOT.TLine(lineData[i+2],lineData[0],lineData[i+2],lineData[1])
-    lineObj.SetLineColor(1)
-    lineObj2.SetLineColor(1)
-    lineObj.SetLineWidth(1)
-    lineObj2.SetLineWidth(1)
-    c2.lines += [lineObj]
-    lineObj.Draw()
-    c2.lines += [lineObj2]
-    lineObj2.Draw()
+PROJECTION_AMBIGUITY = 0.5
+
+def ProfileStep(steps,intLow,intHigh,intGuard = 3):
+  """
+  Returns (sub-pixel position, ratio of the next strongest step) of the
+  largest step of steps[intLow:intHigh], steps[i] between the pixels i and
+  i+1 being at i+0.5. The next strongest step is searched further than
+  intGuard pixels from it. The position is refined with a parabola through
+  the step and its neighbours.
+  """
+  intLow = max(0,intLow)
+  intHigh = min(len(steps),intHigh)
+  if intHigh <= intLow:
+    return (None,1.)
+  window = steps[intLow:intHigh]
+  i = int(np.argmax(window))
+  peak = window[i]
+  if not peak > 0.:
+    return (None,1.)
+  others = np.concatenate((window[:max(0,i-intGuard)],window[i+intGuard+1:]))
+  fltRatio = float(max(0.,others.max())/peak) if len(others) > 0 else 0.
+  i += intLow
+  fltDelta = 0.
+  if 0 < i < len(steps)-1:
+    fltCurve = steps[i-1] - 2*steps[i] + steps[i+1]
+    if fltCurve < 0.:
+      fltDelta = float(np.clip(0.5*(steps[i-1] - steps[i+1])/fltCurve,-0.5,0.5))
+  return (i + 0.5 + fltDelta,fltRatio)
+
+def ProjectionEdges(image,bol14ModCore,fltAmbiguity = PROJECTION_AMBIGUITY):
+  """
+  Finds the stave rectangle of image[x][y] from the steps of the row and
+  column projections of |T - median T|: the stave is the largest contrast to
+  the background. Returns the sub-pixel stave boundaries (y1, y0, x1, x0),
+  or None if a step is ambiguous (next strongest step above fltAmbiguity of
+  it) or the stave length is not the expected one. The rows are searched
+  within 50 pixels of the middle as for the Hough lines.
+  """
+  xPixels,yPixels = image.shape
+  deviation = np.abs(image - np.median(image))
+  StaveLength,cutPercent = StaveLengthCut(bol14ModCore)
+
+  #Rows over the full width first, again over the stave columns once found
+  xLow,xHigh = 0,xPixels
+  for iPass in range(2):
+    steps = np.diff(deviation[xLow:xHigh,:].mean(axis=0))
+    y0,fltRatio0 = ProfileStep(steps,yPixels//2-50,yPixels//2+50)
+    if y0 is None:
+      return None
+    y1,fltRatio1 = ProfileStep(-steps,int(y0)+2,yPixels//2+50)
+    if y1 is None or max(fltRatio0,fltRatio1) > fltAmbiguity:
+      return None
+
+    steps = np.diff(deviation[:,int(np.ceil(y0)):int(y1)+1].mean(axis=1))
+    x0,fltRatio0 = ProfileStep(steps,0,xPixels)
+    if x0 is None:
+      return None
+    x1,fltRatio1 = ProfileStep(-steps,int(x0)+2,xPixels)
+    if x1 is None or max(fltRatio0,fltRatio1) > fltAmbiguity:
+      return None
+    xLow,xHigh = int(np.ceil(x0)),int(x1)+1
+
+  if abs((x1-x0) - StaveLength) > StaveLength*cutPercent:
+    return None
+  return (y1,y0,x1,x0)
+
+def ProjectionLines(image,bol14ModCore):
+  """
+  Returns the stave lines [y1, y0, x1, x0] of image[x][y] found from the row
+  and column projections (ProjectionEdges), the pixels just outside the
+  stave as the Hough lines, None if the projections are ambiguous
+  """
+  edges = ProjectionEdges(image,bol14ModCore)
+  if edges is None:
+    return None
+  y1,y0,x1,x0 = edges
+  return [int(round(y1+0.5)),int(round(y0-0.5)),int(round(x1+0.5)),int(round(x0-0.5))]
+
+#------------------------------------------------------------------------------
+GEOMETRY_TOLERANCE = 0.1
+#largest distance in pixels of a cached edge to the step of the new frame
+GEOMETRY_EDGE_TOLERANCE = 1
 
+def Fingerprint(image,nBins = 64):
+  """
+  Returns the fingerprint of the stave position in image[x][y]: the column and
+  row projections of |T - median T|, averaged in nBins bins and standardised
+  """
+  deviation = np.abs(image - np.median(image))
+  fingerprint = []
+  for profile in [deviation.mean(axis=1),deviation.mean(axis=0)]:
+    edges = np.linspace(0,len(profile),min(nBins,len(profile))+1).astype(int)
+    binned = np.add.reduceat(profile,edges[:-1])/np.diff(edges)
+    std = binned.std()
+    fingerprint.append(list((binned - binned.mean())/std if std > 0 else binned*0.))
+  return fingerprint
+
+def FingerprintDistance(fingerprint1,fingerprint2):
+  """
+  Returns the largest RMS of the differences of the projections, inf if the
+  fingerprints do not have the same bins
+  """
+  fltDistance = 0.
+  for profile1,profile2 in zip(fingerprint1,fingerprint2):
+    if len(profile1) != len(profile2):
+      return float("inf")
+    fltDistance = max(fltDistance,float(np.sqrt(np.mean((np.array(profile1) - np.array(profile2))**2))))
+  return fltDistance
+
+def VerifyGeometry(image,lineData,intWindow = 10,intTolerance = GEOMETRY_EDGE_TOLERANCE):
+  """
+  Checks stave lines [y1, y0, x1, x0] on image[x][y]: each edge must be within
+  intTolerance pixels of the pixel just outside the strongest step of the
+  temperature projection (along the stave) within intWindow pixels around
+  it, as the Hough and projection lines are
+  """
+  y1,y0,x1,x0 = [int(round(val)) for val in lineData]
+  xPixels,yPixels = image.shape
+  if not (0 <= x0 < x1 < xPixels and 0 <= y0 < y1 < yPixels):
+    return False
+  rows = image[x0:x1+1,:].mean(axis=0)
+  cols = image[:,y0:y1+1].mean(axis=1)
+  #the outside pixel is i for a low edge, i+1 for a high edge
+  for profile,edge,intOutside in [(rows,y0,0),(rows,y1,1),(cols,x0,0),(cols,x1,1)]:
+    steps = np.abs(np.diff(profile)) #steps[i] between pixels i and i+1
+    low = max(0,edge-intWindow)
+    high = min(len(steps),edge+intWindow+1)
+    peak = low + int(np.argmax(steps[low:high]))
+    if abs(peak+intOutside-edge) > intTolerance:
+      return False
+  return True
+
+def ReadGeometryCache(strCacheDir):
+  strCacheFile = strCacheDir+"/geometry.json"
+  if not os.path.isfile(strCacheFile):
+    return []
+  f_cache = open(strCacheFile,"r")
+  entries = json.load(f_cache)
+  f_cache.close()
+  return entries
+
+def LookUpGeometry(strCacheDir,fingerprint,image,bol14ModCore):
+  """
+  Returns the cached stave lines of the closest matching frame if they are
+  confirmed on this frame, else None
+  """
+  best = None
+  fltBest = GEOMETRY_TOLERANCE
+  for entry in ReadGeometryCache(strCacheDir):
+    if entry["shape"] != list(image.shape) or entry["14ModCore"] != bool(bol14ModCore):
+      continue
+    fltDistance = FingerprintDistance(fingerprint,entry["fingerprint"])
+    if fltDistance <= fltBest:
+      best = entry
+      fltBest = fltDistance
+  if best is None:
+    return None
+  if not VerifyGeometry(image,best["lines"]):
+    print("Geometry cache: matching frame (distance %.3f) but the cached lines are not confirmed, finding them again" % fltBest)
+    return None
+  print("Geometry cache: reusing the stave lines "+str(best["lines"])+" (distance %.3f), Hough skipped" % fltBest)
+  return best["lines"]
+
+def StoreGeometry(strCacheDir,fingerprint,image,lineData,bol14ModCore,intMaxEntries = 50):
+  """
+  Stores stave lines found with Hough in the cache, if they are confirmed on
+  their own frame. Replaces the entries they match, keeps the last
+  intMaxEntries.
+  """
+  lines = [int(val) if float(val).is_integer() else float(val) for val in lineData]
+  if not VerifyGeometry(image,lines):
+    print("Geometry cache: stave lines "+str(lines)+" not confirmed by the frame projections, not cached")
+    return
+  entries = [entry for entry in ReadGeometryCache(strCacheDir)
+    if not (entry["shape"] == list(image.shape) and entry["14ModCore"] == bool(bol14ModCore)
+            and FingerprintDistance(fingerprint,entry["fingerprint"]) <= GEOMETRY_TOLERANCE)]
+  entries.append({"shape":list(image.shape),"14ModCore":bool(bol14ModCore),"fingerprint":fingerprint,"lines":lines})
+  if not os.path.isdir(strCacheDir):
+    os.makedirs(strCacheDir)
+  f_cache = open(strCacheDir+"/geometry.json","w")
+  json.dump(entries[-intMaxEntries:],f_cache)
+  f_cache.close()
+
+#------------------------------------------------------------------------------
+def PipeRegion(image,lineData,yPixels,fltxPercentCutL = 0.05,fltxPercentCutR = 0.023,fltyPercentCut = 0.20):
+  """
+  Returns the stave and pipe regions of the stave lines [y1, y0, x1, x0] of
+  image[x][y]: a dictionary of x0, x1, y0EOS, y1EOS (stave with the end of
+  stave card), x0Cut, x1Cut, y0Cut, y1Cut (pipe region, the stave less the
+  cut fractions), StaveSideL and avgStaveTemp. The y values of an L side
+  stave are mirrored.
+  """
   x0=lineData[3]
   x1=lineData[2]
   y0=lineData[1]
   y1=lineData[0]
   Dx = x1-x0 
   Dy = y1-y0
- 
-  #Print all of the Fit Lines
-  c2.Update()
-  c2.Print(outdir+"/AllFoundLines.pdf")
-  c2.Print(outdir+"/AllFoundLines.root")
 
   #Get Corrected Zoomed Figure
   DxcutL = int(fltxPercentCutL*Dx)
@@ -302,29 +582,13 @@ def FindPoints(strImageFile,strOutputFile,outdir,bol14ModCore = False,xPixels =
   x1Cut = x1-DxcutR
   y0Cut = y0+Dycut
   y1Cut = y1-Dycut
- 
-  c2.Close()
-
-  #Make the output file
-  Output = open(strOutputFile,"w")
-  Output.write("#\n# frame parameters used in frameanal.py\n#\n")
 
-  #Find the EndofStaveCard
-  avgStaveTemp = 0.0
-  avgAboveTemp = 0.0
-  avgBelowTemp = 0.0
+  #Find the EndofStaveCard, sums over the pixels strictly inside the ranges
   stavePixels = (x1Cut-x0Cut)*(y1Cut-y0Cut)
   EOSCardPixels = 300 
-  for i in range(xPixels):
-    for j in range(yPixels):
-      if i > x0Cut and i < x1Cut:
-        if j > y0Cut and j < y1Cut:
-          avgStaveTemp = avgStaveTemp + image[i][j]
-      if i > x0Cut and i < (x0Cut+30):
-        if j > y1 and j < (y1+10):
-          avgAboveTemp += image[i][j]
-        if j > y0 - 10 and j < y0:
-          avgBelowTemp += image[i][j] 
+  avgStaveTemp = float(image[OpenRange(x0Cut,x1Cut),OpenRange(y0Cut,y1Cut)].sum())
+  avgAboveTemp = float(image[OpenRange(x0Cut,x0Cut+30),OpenRange(y1,y1+10)].sum())
+  avgBelowTemp = float(image[OpenRange(x0Cut,x0Cut+30),OpenRange(y0-10,y0)].sum())
       
   avgStaveTemp = avgStaveTemp/stavePixels
   avgAboveTemp = avgAboveTemp/EOSCardPixels
@@ -356,6 +620,84 @@ def FindPoints(strImageFile,strOutputFile,outdir,bol14ModCore = False,xPixels =
     y1EOS = abs(yorig[0] - yPixels)
     y1Cut = abs(yorig[1] - yPixels)
 
+  return {"x0":x0,"x1":x1,"y0EOS":y0EOS,"y1EOS":y1EOS,"x0Cut":x0Cut,"x1Cut":x1Cut,"y0Cut":y0Cut,"y1Cut":y1Cut,
+          "StaveSideL":intStaveSideL,"avgStaveTemp":avgStaveTemp}
+
+def FindPoints(strImageFile,strOutputFile,outdir,bol14ModCore = False,xPixels = None,yPixels = None,fltxPercentCutL=0.05,fltxPercentCutR=0.023,fltyPercentCut=0.20,bolPlot = True,intRowBand = 0,strCacheDir = None,strHough = "full",strEngine = "hough"):
+  """
+  This function takes an input root stave image and finds all of the appropriate
+  locations on the stave and creates a config file. The number of pixels is
+  taken from the frame (btree nxpixel, nypixel) unless xPixels, yPixels are given.
+  Without bolPlot no plot is made (and ROOT is not needed).
+  If the vertical lines are not all found, the stave x position is the window
+  of highest contrast on the middle row, or on the rows within intRowBand of it.
+  With strCacheDir the stave lines are reused from the geometry cache of that
+  directory when the frame matches a cached one. strHough is the Hough
+  resolution schedule, see HOUGH_SCHEDULES (default "full", the original
+  passes).
+  With strEngine "projection" the stave lines are found from the row and
+  column projections of the frame (ProjectionLines), with Hough only if
+  these are ambiguous.
+  """
+
+  try:
+    #Bulk load of the file, root or npy (frameLoader.py), temperatures decoded
+    temperature = fl.LoadTemperature(strImageFile,False,-999.) #-999 used as a placeholder for pixels not stored
+  except:
+    print("Failed to Load ImageFile")
+    return
+
+  #image[x][y]
+  image = temperature.T
+  if xPixels is None or yPixels is None:
+    xPixels,yPixels = image.shape
+  lstRows = range(max(0,yPixels//2-intRowBand),min(yPixels,yPixels//2+intRowBand+1))
+
+  #The stave lines [y1, y0, x1, x0], reused from the geometry cache when the
+  #frame matches one already seen, else found from the projections or with Hough
+  lineData = None
+  c2 = None
+  if strCacheDir is not None:
+    fingerprint = Fingerprint(image)
+    lineData = LookUpGeometry(strCacheDir,fingerprint,image,bol14ModCore)
+  if lineData is None and strEngine == "projection":
+    lineData = ProjectionLines(image,bol14ModCore)
+    if lineData is None:
+      print("Projection peaks are ambiguous, finding the stave lines with Hough")
+    else:
+      print("Stave lines "+str(lineData)+" found from the projections, Hough skipped")
+      if strCacheDir is not None:
+        StoreGeometry(strCacheDir,fingerprint,image,lineData,bol14ModCore)
+  if lineData is None:
+    lineData,c2 = HoughLines(image,xPixels,yPixels,bol14ModCore,lstRows,bolPlot,strHough)
+    if strCacheDir is not None:
+      StoreGeometry(strCacheDir,fingerprint,image,lineData,bol14ModCore)
+  elif bolPlot:
+    c2 = MakeCanvas(image)
+
+#------------------------------------------------------------------------------
+  #Put the found area on the plot 
+  for i in range(2):
+    DrawLine(c2,lineData[2],lineData[i],lineData[3],lineData[i],1,1)
+    DrawLine(c2,lineData[i+2],lineData[0],lineData[i+2],lineData[1],1,1)
+
+  #Print all of the Fit Lines
+  if c2 is not None:
+    c2.Update()
+    c2.Print(outdir+"/AllFoundLines.pdf")
+    c2.Print(outdir+"/AllFoundLines.root")
+    c2.Close()
+
+  region = PipeRegion(image,lineData,yPixels,fltxPercentCutL,fltxPercentCutR,fltyPercentCut)
+  x0,x1,y0EOS,y1EOS = region["x0"],region["x1"],region["y0EOS"],region["y1EOS"]
+  x0Cut,x1Cut,y0Cut,y1Cut = region["x0Cut"],region["x1Cut"],region["y0Cut"],region["y1Cut"]
+  intStaveSideL = region["StaveSideL"]
+  avgStaveTemp = region["avgStaveTemp"]
+
+  #Make the output file
+  Output = open(strOutputFile,"w")
+  Output.write("#\n# frame parameters used in frameanal.py\n#\n")
+
   #Put in the stave parameters
   Output.write("StavePixelX0 "+str(x0)+"\n")
   Output.write("StavePixelY0 "+str(y0EOS)+"\n")
@@ -415,33 +757,157 @@ def FindPoints(strImageFile,strOutputFile,outdir,bol14ModCore = False,xPixels =
   Output.close()
   return [x0Cut,x1Cut,y0Cut,y1Cut,intStaveSideL,intLowTValue]
 
-#Below is a short program that will get all of the fit data out of a set of frames
-"""
+#------------------------------------------------------------------------------
+#Geometry stability study: FindPoints on every (or a sample of the) frames of
+#a recording in a process pool, the jitter of the edges and a consensus config
+STABILITY_EDGES = ["x0Cut","x1Cut","y0Cut","y1Cut"]
+
+def ListFrames(strInputs,intSample = 0):
+  """
+  Returns the single frames roo/frame_N.root (or .json) of the directories
+  and the files given, ordered by N, or intSample of them evenly spaced
+  """
+  strFrames = []
+  for strInput in strInputs:
+    if not os.path.isdir(strInput):
+      strFrames.append(strInput)
+      continue
+    strNames = [name for name in os.listdir(strInput) if re.match(r"frame_\d+\.root$",name)]
+    if len(strNames) == 0:
+      strNames = [name for name in os.listdir(strInput) if re.match(r"frame_\d+\.json$",name)]
+    strNames.sort(key = lambda name: int(re.findall(r"\d+",name)[0]))
+    strFrames += [os.path.join(strInput,name) for name in strNames]
+  if 0 < intSample < len(strFrames):
+    strFrames = [strFrames[i] for i in np.linspace(0,len(strFrames)-1,intSample).round().astype(int)]
+  return strFrames
+
+def _StabilityWorker():
+  """
+  Every frame of the study is read once: no frame cache in the workers
+  """
+  fc.SetMaxMB(0)
+
+def _StabilityJob(job):
+  """
+  FindPoints of one frame in a worker, without plot nor geometry cache
+  """
+  strFrame,strOutputFile,bol14ModCore,strEngine = job
+  try:
+    return FindPoints(strFrame,strOutputFile,".",bol14ModCore,bolPlot = False,strEngine = strEngine)
+  except Exception as error:
+    print("Failed to find the geometry of "+strFrame+": "+str(error))
+    return None
+
+def StabilityStudy(strFrames,strOutputFile,outdir,bol14ModCore = False,intJobs = 0,strEngine = "hough",fltMaxJitter = 1.0):
+  """
+  Finds the geometry of every frame strFrames in intJobs processes (0: one per
+  cpu), writes the results of each frame to outdir/stability.csv, prints the
+  distribution and the jitter (RMS, largest deviation to the median) of the
+  pipe region edges, and writes the consensus config strOutputFile: the one
+  of the frame closest to the median edges, with the side and temperature
+  found on most frames.
+  Returns True if the geometry is stable: every frame found, the RMS of every
+  edge within fltMaxJitter pixels and one stave side for all frames.
+  """
+  if len(strFrames) == 0:
+    print("Stability: no frame to study")
+    return False
+  if not os.path.isdir(outdir):
+    os.makedirs(outdir)
+  strTmpDir = tempfile.mkdtemp(prefix = "configFinder")
+  jobs = [(strFrame,os.path.join(strTmpDir,"config_"+str(i)),bol14ModCore,strEngine) for i,strFrame in enumerate(strFrames)]
+
+  fltStart = time.time()
+  if intJobs == 1:
+    fltMaxMB = fc.GetStats()["maxMB"]
+    _StabilityWorker()
+    try:
+      results = [_StabilityJob(job) for job in jobs]
+    finally:
+      fc.SetMaxMB(fltMaxMB)
+  else:
+    pool = multiprocessing.Pool(intJobs if intJobs > 0 else None,_StabilityWorker)
+    try:
+      results = pool.map(_StabilityJob,jobs,chunksize = max(1,len(jobs)/(8*multiprocessing.cpu_count())))
+    finally:
+      pool.close()
+      pool.join()
+  print("Stability: %d frames in %.1f s" % (len(jobs),time.time()-fltStart))
+
+  f_csv = open(os.path.join(outdir,"stability.csv"),"w")
+  f_csv.write("frame,"+",".join(STABILITY_EDGES)+",StaveSideL,LiquidTLow\n")
+  for strFrame,result in zip(strFrames,results):
+    f_csv.write(strFrame+","+(",".join(str(val) for val in result) if result is not None else ",,,,,")+"\n")
+  f_csv.close()
+
+  iFound = [i for i,result in enumerate(results) if result is not None]
+  nFailed = len(results)-len(iFound)
+  if len(iFound) == 0:
+    print("Stability: the geometry was not found on any frame")
+    shutil.rmtree(strTmpDir)
+    return False
+  values = np.array([results[i] for i in iFound],dtype=float)
+
+  bolStable = (nFailed == 0)
+  print("Stability: %d of %d frames found" % (len(iFound),len(results)))
+  medians = np.median(values[:,:4],axis=0)
+  for j,strEdge in enumerate(STABILITY_EDGES):
+    column = values[:,j]
+    fltRMS = float(column.std())
+    fltMaxDev = float(np.abs(column-medians[j]).max())
+    counts = collections.Counter(column.astype(int).tolist())
+    print("  %-6s median %6.1f RMS %5.2f max deviation %5.1f px  %s" % (strEdge,medians[j],fltRMS,fltMaxDev,
+      " ".join("%d:%d" % (val,counts[val]) for val in sorted(counts))))
+    if fltRMS > fltMaxJitter:
+      bolStable = False
+  for j,strName in [(4,"StaveSideL"),(5,"LiquidTLow")]:
+    counts = collections.Counter(values[:,j].astype(int).tolist())
+    print("  %-10s %s" % (strName," ".join("%d:%d" % (val,counts[val]) for val in sorted(counts))))
+  sides = collections.Counter(values[:,4].astype(int).tolist())
+  if len(sides) > 1:
+    bolStable = False
+
+  #Consensus: the frame of the most common side and temperature closest to the median edges
+  mode = values[:,4:6].tolist()
+  mode = max(mode,key = mode.count)
+  agree = np.all(values[:,4:6] == mode,axis=1)
+  distance = np.where(agree,np.abs(values[:,:4]-medians).sum(axis=1),np.inf)
+  iBest = iFound[int(np.argmin(distance))]
+  shutil.copy(jobs[iBest][1],strOutputFile)
+  shutil.rmtree(strTmpDir)
+  print("Stability: consensus "+strOutputFile+" from "+strFrames[iBest]+" "+str(results[iBest]))
+  print("Stability: geometry "+("STABLE" if bolStable else "UNSTABLE")+" (edge RMS limit %.2f px)" % fltMaxJitter)
+  return bolStable
+
+def print_usage(strFunction):
+  print("Usage: "+strFunction+" FRAMES... [-o CONFIG = config_frame] [-d OUTDIR = plot]")
+  print("  FRAMES: roo directories (all their frame_N.root) or frame files")
+  print(" -n N : study N frames evenly spaced instead of all of them")
+  print(" -j N : number of processes (default one per cpu)")
+  print(" -mj PX: largest RMS of an edge in pixels for a stable geometry (default 1.0)")
+  print(" -14M : searches for a 14 module stave core instead of a 13 module")
+  print(" -pj : find the stave lines from the projections, Hough only if they are ambiguous")
+  print("Exit status 1 if the geometry is not stable, to gate the camera alignment")
+
 if __name__ == '__main__':
-  x0hist = ROOT.TH1F("x0hist","X0 values found;xPixel;N Entries",10,89,99) 
-  x1hist = ROOT.TH1F("x1hist","X1 values found;xPixel;N Entries",10,598,608) 
-  y0hist = ROOT.TH1F("y0hist","Y0 values found;yPixel;N Entries",10,223,233) 
-  y1hist = ROOT.TH1F("y1hist","Y1 values found;yPixel;N Entries",10,257,267) 
-  staveSideHist = ROOT.TH1F("staveSideHist","Side Found;LSide?;N Entries",2,0,1) 
-  TempHist = ROOT.TH1F("TempHist","AvgTemperature on Stave;Temperature [#circC];N Entries",200,-50,50) 
-  for i in range(200):
-    Output = FindPoints("roo/frame_"+str(i)+".root","configure")
-    x0hist.Fill(Output[0])
-    x1hist.Fill(Output[1])
-    y0hist.Fill(Output[2])
-    y1hist.Fill(Output[3])
-    staveSideHist.Fill(Output[4])
-    TempHist.Fill(Output[5])
-    print(str(i)+" " +str(Output[0])+" "+str(Output[1])+" "+str(Output[2])+" "+str(Output[3])+" "+str(Output[4])+" "+str(Output[5]))
-
-  c1= ROOT.TCanvas("c1")
-  c1.cd()    
-  x0hist.Draw()
-  c1.Print("x0hist.png")
-  x1hist.Draw()
-  c1.Print("x1hist.png")
-  y0hist.Draw()
-  c1.Print("y0hist.png")
-  y1hist.Draw()
-  c1.Print("y1hist.png")
-"""
+  strInputCmds = sys.argv[1:]
+  if len(strInputCmds) == 0 or ("-h" in strInputCmds) or ("--help" in strInputCmds):
+    print_usage(sys.argv[0])
+    sys.exit(0)
+
+  options = {"-o":"config_frame","-d":"plot","-n":"0","-j":"0","-mj":"1.0"}
+  for strOpt in options.keys():
+    while strOpt in strInputCmds:
+      iOpt = strInputCmds.index(strOpt)
+      if iOpt + 1 >= len(strInputCmds):
+        print("ERROR: "+strOpt+" needs a value")
+        sys.exit(2)
+      options[strOpt] = strInputCmds[iOpt+1]
+      del strInputCmds[iOpt:iOpt+2]
+  bol14ModCore = "-14M" in strInputCmds
+  strEngine = "projection" if "-pj" in strInputCmds else "hough"
+  strInputCmds = [strCmd for strCmd in strInputCmds if strCmd not in ["-14M","-pj"]]
+
+  strFrames = ListFrames(strInputCmds,int(options["-n"]))
+  bolStable = StabilityStudy(strFrames,options["-o"],options["-d"],bol14ModCore,int(options["-j"]),strEngine,float(options["-mj"]))
+  sys.exit(0 if bolStable else 1)
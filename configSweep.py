@@ -0,0 +1,213 @@
+'''
+configSweep.py
+
+About: Parameter sweep of the geometry finding of configFinder.py, to tune
+  the hand-tuned constants on a new setup: the cut fractions of the pipe
+  region (fltxPercentCutL, fltxPercentCutR, fltyPercentCut), the Canny
+  sigma, the Hough vote thresholds of the long and short lines and the stave
+  length, over a grid (GRID, or -g), on reference frames with hand-labelled
+  geometry.
+
+    python configSweep.py LABELS.csv [-o sweep.csv] [-j N] [-g NAME=V1,V2,...]
+
+  LABELS.csv has the columns frame, x0Cut, x1Cut, y0Cut, y1Cut (pipe region
+  as returned by configFinder.FindPoints), e.g. the plot/stability.csv of
+  the stability study of configFinder.py corrected by hand.
+
+  The grid runs in a process pool, one job per frame: the frame is loaded
+  once, its Canny image made once per sigma and reused for every threshold
+  and stave length, and the stave lines found once are reused for every
+  cut fraction. Every grid point is scored against the labels: the
+  fraction of frames with all four edges within -t pixels (default 2) and
+  the mean and largest absolute error in pixels. The scores are written to
+  sweep.csv, best first, and the best points are printed.
+
+Requires: numpy, OpenCV (no ROOT)
+'''
+
+import sys
+import csv
+import time
+import itertools
+import multiprocessing
+import numpy as np
+
+import configFinder as cf
+import frameLoader as fl
+
+#The default grid, (name, values); the defaults of configFinder.py in the middle
+GRID = [
+  ("cutL",   [0.03,0.04,0.05,0.06,0.07]), #fltxPercentCutL
+  ("cutR",   [0.013,0.023,0.033]),        #fltxPercentCutR
+  ("cutY",   [0.15,0.20,0.25]),           #fltyPercentCut
+  ("sigma",  [0.25,0.33,0.40]),           #Canny thresholds (1 -+ sigma) of the median
+  ("long",   [80,100,120]),               #votes of the long horizontal lines
+  ("short",  [15,20,25]),                 #votes of the short vertical lines
+  ("length", [0.985,1.,1.015]),           #stave length, fraction of the 13 (14) module one
+]
+LINE_PARAMETERS = ["long","short","length"]
+CUT_PARAMETERS = ["cutL","cutR","cutY"]
+EDGES = ["x0Cut","x1Cut","y0Cut","y1Cut"]
+
+def ReadLabels(strLabelFile):
+  """
+  Returns the frames and the labelled edges [x0Cut, x1Cut, y0Cut, y1Cut] of
+  a csv file, rows without edges are skipped
+  """
+  strFrames = []
+  labels = []
+  f_csv = open(strLabelFile,"r")
+  for row in csv.DictReader(f_csv):
+    if any(row.get(strEdge,"").strip() == "" for strEdge in EDGES):
+      continue
+    strFrames.append(row["frame"].strip())
+    labels.append([float(row[strEdge]) for strEdge in EDGES])
+  f_csv.close()
+  return strFrames,np.array(labels)
+
+def _SweepJob(job):
+  """
+  Finds the pipe region of one frame for every grid point, returns
+  {(sigma, long, short, length, cutL, cutR, cutY): edges}, the points
+  without a region left out
+  """
+  strFrame,sigmas,linePoints,cutPoints,bol14ModCore,strHough = job
+  results = {}
+  try:
+    image = fl.LoadTemperature(strFrame,False,-999.).T #once per frame
+  except Exception as error:
+    print("Failed to load "+strFrame+": "+str(error))
+    return results
+  xPixels,yPixels = image.shape
+  StaveLength,cutPercent = cf.StaveLengthCut(bol14ModCore)
+  for fltSigma in sigmas:
+    image2 = cf.CannyImage(image,fltSigma) #once per frame and sigma
+    for linePoint in linePoints:
+      intLong,intShort,fltLength = linePoint
+      try:
+        lineData,c2 = cf.HoughLines(image,xPixels,yPixels,bol14ModCore,[yPixels/2],False,strHough,image2,intLong,intShort,StaveLength*fltLength)
+      except Exception as error:
+        print("Failed to find the stave lines of "+strFrame+": "+str(error))
+        continue
+      for cutPoint in cutPoints:
+        try:
+          region = cf.PipeRegion(image,lineData,yPixels,*cutPoint)
+        except Exception:
+          continue
+        results[(fltSigma,)+tuple(linePoint)+tuple(cutPoint)] = [region[strEdge] for strEdge in EDGES]
+  return results
+
+def Sweep(strFrames,labels,grid = GRID,bol14ModCore = False,intJobs = 0,strHough = "full",intTolerance = 2):
+  """
+  Runs the grid on the labelled frames in intJobs processes (0: one per cpu).
+  Returns the list of (parameters dict, fraction of frames within
+  intTolerance pixels, mean absolute error, largest absolute error), best
+  first
+  """
+  values = dict(grid)
+  linePoints = list(itertools.product(*[values[name] for name in LINE_PARAMETERS]))
+  cutPoints = list(itertools.product(*[values[name] for name in CUT_PARAMETERS]))
+  jobs = [(strFrame,values["sigma"],linePoints,cutPoints,bol14ModCore,strHough) for strFrame in strFrames]
+
+  fltStart = time.time()
+  if intJobs == 1:
+    results = [_SweepJob(job) for job in jobs]
+  else:
+    pool = multiprocessing.Pool(intJobs if intJobs > 0 else None)
+    try:
+      results = pool.map(_SweepJob,jobs,chunksize = 1)
+    finally:
+      pool.close()
+      pool.join()
+  print("Sweep: %d frames x %d points in %.1f s" % (len(strFrames),len(values["sigma"])*len(linePoints)*len(cutPoints),time.time()-fltStart))
+
+  #errors[point] = |found - label| per frame and edge, inf if not found
+  scores = []
+  for fltSigma in values["sigma"]:
+    for linePoint in linePoints:
+      for cutPoint in cutPoints:
+        key = tuple(linePoint)+tuple(cutPoint)
+        errors = np.full(labels.shape,np.inf)
+        for iFrame in range(len(strFrames)):
+          found = results[iFrame].get((fltSigma,)+key)
+          if found is not None:
+            errors[iFrame] = np.abs(np.array(found,dtype=float)-labels[iFrame])
+        fltWithin = float(np.mean(np.all(errors <= intTolerance,axis=1)))
+        finite = errors[np.isfinite(errors)]
+        fltMean = float(finite.mean()) if finite.size == errors.size else float("inf")
+        fltMax = float(errors.max())
+        parameters = dict(zip(LINE_PARAMETERS+CUT_PARAMETERS,key))
+        parameters["sigma"] = fltSigma
+        scores.append((parameters,fltWithin,fltMean,fltMax))
+  scores.sort(key = lambda score: (-score[1],score[2],score[3]))
+  return scores
+
+def WriteScores(strOutputFile,scores,grid = GRID):
+  """
+  Writes the scores of Sweep, one column per parameter of the swept grid
+  """
+  names = [name for name,values in grid]
+  f_csv = open(strOutputFile,"w")
+  f_csv.write(",".join(names)+",within,mean_error,max_error\n")
+  for parameters,fltWithin,fltMean,fltMax in scores:
+    f_csv.write(",".join(str(parameters[name]) for name in names)+",%.4f,%.3f,%.3f\n" % (fltWithin,fltMean,fltMax))
+  f_csv.close()
+
+def PrintScores(scores,intTolerance,grid = GRID,nBest = 10):
+  names = [name for name,values in grid]
+  print("Sweep: best of %d points (frames within %d px, mean and largest error in px)" % (len(scores),intTolerance))
+  print("  "+" ".join("%6s" % name for name in names)+"  within   mean    max")
+  for parameters,fltWithin,fltMean,fltMax in scores[:nBest]:
+    print("  "+" ".join("%6s" % str(parameters[name]) for name in names)+"  %6.3f %6.2f %6.1f" % (fltWithin,fltMean,fltMax))
+
+def print_usage(strFunction):
+  print("Usage: "+strFunction+" LABELS.csv [-o OUTPUT = sweep.csv]")
+  print("  LABELS.csv: columns frame,x0Cut,x1Cut,y0Cut,y1Cut of the reference frames")
+  print(" -g NAME=V1,V2,... : values of a parameter ("+", ".join(name for name,values in GRID)+"), repeatable")
+  print(" -j N : number of processes (default one per cpu)")
+  print(" -t PX: largest error of an edge in pixels for a frame to agree (default 2)")
+  print(" -hs SCHEDULE: Hough resolution schedule ("+", ".join(sorted(cf.HOUGH_SCHEDULES))+", default full)")
+  print(" -14M : searches for a 14 module stave core instead of a 13 module")
+
+if __name__ == '__main__':
+  strInputCmds = sys.argv[1:]
+  if len(strInputCmds) == 0 or ("-h" in strInputCmds) or ("--help" in strInputCmds):
+    print_usage(sys.argv[0])
+    sys.exit(0)
+
+  grid = [(name,list(values)) for name,values in GRID]
+  while "-g" in strInputCmds:
+    iOpt = strInputCmds.index("-g")
+    if iOpt + 1 >= len(strInputCmds) or "=" not in strInputCmds[iOpt+1]:
+      print("ERROR: -g needs NAME=V1,V2,...")
+      sys.exit(2)
+    strName,strValues = strInputCmds[iOpt+1].split("=",1)
+    if strName not in dict(grid):
+      print("ERROR: unknown parameter "+strName+", use one of "+", ".join(name for name,values in grid))
+      sys.exit(2)
+    grid = [(name,([type(values[0])(val) for val in strValues.split(",")] if name == strName else values)) for name,values in grid]
+    del strInputCmds[iOpt:iOpt+2]
+
+  options = {"-o":"sweep.csv","-j":"0","-t":"2","-hs":"full"}
+  for strOpt in options.keys():
+    while strOpt in strInputCmds:
+      iOpt = strInputCmds.index(strOpt)
+      if iOpt + 1 >= len(strInputCmds):
+        print("ERROR: "+strOpt+" needs a value")
+        sys.exit(2)
+      options[strOpt] = strInputCmds[iOpt+1]
+      del strInputCmds[iOpt:iOpt+2]
+  bol14ModCore = "-14M" in strInputCmds
+  strInputCmds = [strCmd for strCmd in strInputCmds if strCmd != "-14M"]
+  if len(strInputCmds) != 1:
+    print_usage(sys.argv[0])
+    sys.exit(2)
+
+  strFrames,labels = ReadLabels(strInputCmds[0])
+  if len(strFrames) == 0:
+    print("ERROR: no labelled frame in "+strInputCmds[0])
+    sys.exit(1)
+  intTolerance = int(options["-t"])
+  scores = Sweep(strFrames,labels,grid,bol14ModCore,int(options["-j"]),options["-hs"],intTolerance)
+  WriteScores(options["-o"],scores,grid)
+  PrintScores(scores,intTolerance,grid)
@@ -35,9 +35,11 @@
 
 import sys          # system 
 import os           # operating system
-import ROOT         # ROOT from CERN
 import numpy as np  # number in python
 
+import frameCache as fc
+from lazyRoot import ROOT # ROOT from CERN, imported on first use
+
 from defectFinderToolBox import *
 from defectFinderPeakFinder import *
 
@@ -82,6 +84,7 @@ def TextCommands(inputfile,outdirs,fitdirs,canvas,bolVerb):
     #canvas.Clear()
     #canvas.Update()
     if Vin == 'q':
+      fc.PrintStats()
       bolQuit = True
     elif Vin == 'f':
       for i in range(len(inputfile)):
@@ -5,8 +5,9 @@ This is a portion of the defectFinder.py code that finds defects
 
 import sys          # system 
 import os           # operating system
-import ROOT         # ROOT from CERN
 import numpy as np  # number in pyth
+
+from lazyRoot import ROOT # ROOT from CERN, imported on first use
 from defectFinderToolBox import *
 
 
@@ -3,26 +3,61 @@ This is the toolbox of functions for the defectFinder.py
 """
 import sys          # system 
 import os           # operating system
-import ROOT         # ROOT from CERN
 import numpy as np  # number in python
 
+import frameCache as fc
+from lazyRoot import ROOT # ROOT from CERN, imported on first use
+
 
 #Some Functions----------------------------------------------------------------
 def GetHistogram(inputfile,intPipeNum,strType = "temperature;1"):
   """
-  Gets the histogram from the input file and returns it
+  Gets the histogram from the input file and returns it. The file is read
+  once per process (frameCache.py, the bin contents are cached as numpy
+  arrays), each call returns a new histogram.
   """
-  File = ROOT.TFile(inputfile,"READ")
   side = "top_pipe_"
   if intPipeNum == 1:
     side = "bot_pipe_"
 
-  Hist = File.Get(side+strType)
-  Hist.SetDirectory(0)
+  Hist = MakeHistogram(fc.Get([inputfile],("hist",side+strType),lambda: ReadHistogram(inputfile,side+strType)))
   strOrigName = Hist.GetName()
   strNamePrecurse = MakeFileName(inputfile)
   Hist.SetName(strNamePrecurse+'_'+strOrigName)
+  return Hist
+
+def ReadHistogram(inputfile,strName):
+  """
+  Reads the histogram strName from the input file into numpy arrays: the bin
+  contents and errors (with under- and overflow) and the axis range
+  """
+  File = ROOT.TFile(inputfile,"READ")
+  Hist = File.Get(strName)
+  nbins = Hist.GetNbinsX()
+  content = {
+    "class":    Hist.ClassName(),
+    "name":     Hist.GetName(),
+    "title":    Hist.GetTitle()+";"+Hist.GetXaxis().GetTitle()+";"+Hist.GetYaxis().GetTitle(),
+    "axis":     np.array([Hist.GetXaxis().GetXmin(),Hist.GetXaxis().GetXmax()]),
+    "contents": np.array([Hist.GetBinContent(i) for i in range(nbins+2)]),
+    "errors":   np.array([Hist.GetBinError(i) for i in range(nbins+2)]),
+    "entries":  Hist.GetEntries(),
+  }
   File.Close()
+  return content
+
+def MakeHistogram(content):
+  """
+  Makes a new histogram, not attached to any file, from the arrays of
+  ReadHistogram
+  """
+  nbins = len(content["contents"])-2
+  Hist = getattr(ROOT,content["class"])(content["name"],content["title"],nbins,content["axis"][0],content["axis"][1])
+  Hist.SetDirectory(0)
+  for i in range(nbins+2):
+    Hist.SetBinContent(i,content["contents"][i])
+    Hist.SetBinError(i,content["errors"][i])
+  Hist.SetEntries(content["entries"])
   return Hist
 
 #------------------------------------------------------------------------------
@@ -30,7 +30,6 @@
 """
 import sys
 import os
-import ROOT
 import numpy as np
 from scipy.signal import argrelextrema
 
@@ -38,6 +37,10 @@ from scipy.signal import argrelextrema
 sys.path.append("../configFinder.py")
 #import configFinder as cf
 
+sys.path.insert(1,os.path.join(os.path.dirname(os.path.abspath(__file__)),os.pardir))
+import frameLoader as fl
+from lazyRoot import ROOT
+
 #------------------------------------------------------------------------------
 #LOADING IN THINGS
 #------------------------------------------------------------------------------
@@ -174,45 +177,27 @@ def LoadSlices(inputcsv,outdir):
 #------------------------------------------------------------------------------
 def ChopTempData(strInputFile,bolStaveSideL,X0,X1,Y0,Y1,strName,strOutdir):
   """
-  Takes and loads the TTree from the input file and creates an array that has been cut to the size
+  Loads the frame (root or npy) from the input file and creates an array that has been cut to the size
   of the stave. It also will remove the End of Stave Card
   """
-  File = ROOT.TFile(strInputFile,'r')
-  Tree = File.Get('atree;1')
-  nentries = Tree.GetEntries()
+  #bulk load of the root or npy frame (frameLoader.py), L side flipped along y
+  #Temp[x][y]
+  Temp = fl.LoadTemperature(strInputFile,bolStaveSideL > 0,0.).T
   ROOT.gStyle.SetOptStat(0)
   strName = strInputFile.split('/')[-2]
   print ("FILE NAME: "+strName)
 
-  nxpixels = 640
-  nypixels = 480
-  Temp = [[0 for i in range(nypixels)] for j in range(nxpixels)]
-
-  if bolStaveSideL <= 0:
-    for y in range(nypixels):
-      for x in range(nxpixels):
-        Tree.GetEntry(x*nypixels + y)
-        Temp[x][y] = Tree.temperature
-
-  else: #Flipy along y direction!
-    for y in range(nypixels):
-      for x in range(nxpixels):
-        Tree.GetEntry(x*nypixels + y)
-        Temp[x][nypixels-1-y] = Tree.temperature
+  #frame size from the file (btree nxpixel, nypixel)
+  nxpixels,nypixels = Temp.shape
+  if X1 > nxpixels or Y1 > nypixels:
+    print("ERROR: cut "+str([X0,X1,Y0,Y1])+" outside of the "+str(nxpixels)+"x"+str(nypixels)+" frame")
 
   nxcut = X1 - X0
   nycut = Y1 - Y0
-  Tempcut = [[0 for i in range(nycut)] for j in range(nxcut)]
-  for y in range(nycut):
-    for x in range(nxcut):
-      Tempcut[x][y] = Temp[x+X0][y+Y0]
+  Tempcut = Temp[X0:X1,Y0:Y1].tolist()
 
   YEOScut = 5*nycut/7
-  EOScut = [[0 for i in range(YEOScut)] for j in range(nxcut)]
-
-  for y in range(YEOScut):
-    for x in range(nxcut):
-      EOScut[x][y] = Temp[x+X0][y+Y0]
+  EOScut = Temp[X0:X1,Y0:Y0+YEOScut].tolist()
 
   CutHist = ROOT.TH2F("h2",strName+" Cut Image;xPixel;yPixel;Temperature [#circC]",nxcut,0,nxcut,nycut,0,nycut) 
   for x in range(nxcut):
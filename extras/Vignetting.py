@@ -17,47 +17,33 @@
 
 import sys
 import os
-import ROOT
 import numpy as np
 
-def ReadInFrame(filename,outdir,stripnumber,stripdata,nc = 40, nx = 640, ny = 480):
+sys.path.insert(1,os.path.join(os.path.dirname(os.path.abspath(__file__)),os.pardir))
+import frameLoader as fl
+from lazyRoot import ROOT
+
+def ReadInFrame(filename,outdir,stripnumber,stripdata,nc = 40):
   """
   This reads in an input root file and spits out a strip of data from it and
   writes it to the strip image
   """
-  tfile = ROOT.TFile(filename,"read")
-  atree = tfile.Get("atree")
-  xpos = np.zeros(1,dtype = int)
-  ypos = np.zeros(1,dtype = int)
-  temp = np.zeros(1,dtype = float)
-
-  atree.SetBranchAddress( "xpos", xpos)
-  atree.SetBranchAddress( "ypos", ypos)
-  atree.SetBranchAddress( "temperature", temp)
-  nentries = atree.GetEntries()
-
-  tempdata = [[0. for i in range(ny)] for j in range(nx)]
-  for i in range(nentries):
-    atree.GetEntry( i )
-    tempdata[xpos[0]][ypos[0]] = temp[0]    
+  #bulk load of the root or npy frame (frameLoader.py), tempdata[x][y]
+  #the frame size comes from the file (btree nxpixel, nypixel)
+  tempdata = fl.LoadTemperature(filename,False,0.).T
+  nx,ny = tempdata.shape
 
   #Print out the whole first strip's plot
   if stripnumber == 0:
-    printPlot(tempdata,outdir,"FirstPlot")
+    printPlot(tempdata,outdir,"FirstPlot",nx,ny)
 
   #Fill the old data into the output
-  oldstripdata = stripdata
-  outputdata = [[-999. for i in range(ny)] for j in range(nx)]
-  for x in range(nx):
-    for y in range(ny):
-      outputdata[x][y] = oldstripdata[x][y]
+  outputdata = np.array(stripdata,dtype=float)
 
   #Fill the strip into the output
   xf = nx - 20 - nc* stripnumber
   x0 = xf - nc  
-  for x in range(x0,xf):
-    for y in range(ny):
-      outputdata[x][y] = tempdata[x][y]
+  outputdata[x0:xf,:] = tempdata[x0:xf,:]
 
   return outputdata
 #------------------------------------------------------------------------------
@@ -168,7 +154,7 @@ def filterScrews (dataArray, outdir,nstrips = 15,nc =40 ,nx =640,ny =480):
         else:
           outputData[x][y] = avg  
 
-  printPlot(outputData,outdir,"Filtered")
+  printPlot(outputData,outdir,"Filtered",nx,ny)
   return outputData
 
 #------------------------------------------------------------------------------
@@ -267,9 +253,9 @@ def main ():
 
   nfiles = len(inputfiles)
 
-  nX = 640
-  nY = 480
-  LoadedDataStrips = [[-999. for i in range(nY)] for j in range(nX)]
+  #frame size of the first file (btree nxpixel, nypixel)
+  nY,nX = fl.LoadTemperature(inputfiles[0],False,0.).shape
+  LoadedDataStrips = np.full((nX,nY),-999.)
 
   outdir = inputfiles[0]
   outdir = outdir.split('/')[0]
@@ -277,10 +263,10 @@ def main ():
   for i in range(nfiles):
     LoadedDataStrips = ReadInFrame(inputfiles[i],outdir,i,LoadedDataStrips)
 
-  printPlot(LoadedDataStrips,outdir)
-  findXVig (LoadedDataStrips, outdir)
-  LoadedDataStrips = filterScrews(LoadedDataStrips,outdir)
-  printVignetting(LoadedDataStrips,outdir)
+  printPlot(LoadedDataStrips,outdir,"StripTemps",nX,nY)
+  findXVig (LoadedDataStrips, outdir,nx = nX,ny = nY)
+  LoadedDataStrips = filterScrews(LoadedDataStrips,outdir,nx = nX,ny = nY)
+  printVignetting(LoadedDataStrips,outdir,nx = nX,ny = nY)
 
 if __name__ == "__main__":
   main()
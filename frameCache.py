@@ -0,0 +1,160 @@
+'''
+frameCache.py
+
+About: Process-wide LRU cache of the decoded frames and pipe profiles, so
+  that one process (an interactive defectFinder.py session, frameanal.py
+  calling configFinder.FindPoints before reading the same frame itself,
+  the sliding windows) reads and decodes every file only once.
+
+  An entry is keyed by what was loaded (e.g. ("frame", fill value)) and by
+  (absolute path, mtime, size) of every file it was read from: a file
+  rewritten by a new conversion is read again, never served stale.
+
+  The cache holds at most MaxMB (default 512 MB) of arrays, the least
+  recently used entries are evicted first. Arrays of memory-mapped npy
+  files do not count against MaxMB: their pages belong to the page cache
+  of the system, not to the process. They are counted separately. The
+  cached arrays are made read only, the callers get views or copies they
+  can change. Only arrays are sized: cache the numpy contents of ROOT
+  objects, not the objects (see defectFinderToolBox.GetHistogram).
+
+  Statistics: GetStats() returns the hits, misses, evictions, number of
+  entries, MB held and MB mapped; PrintStats() prints them.
+
+Requires: numpy
+'''
+
+import os
+import collections
+import numpy as np
+
+class FrameCache:
+  """
+  LRU cache of loaded objects, bounded by the bytes of their arrays held in
+  memory
+  """
+  def __init__(self,fltMaxMB = 512.):
+    self._entries = collections.OrderedDict()
+    self.Clear()
+    self.SetMaxMB(fltMaxMB)
+
+  def SetMaxMB(self,fltMaxMB):
+    """
+    Sets the memory cap in MB, 0 disables the cache
+    """
+    self._maxbytes = int(max(0.,float(fltMaxMB))*1024*1024)
+    self._Evict()
+
+  def Clear(self):
+    """
+    Drops every entry and resets the statistics
+    """
+    self._entries.clear()
+    self._nbytes = 0
+    self._nmapped = 0
+    self.nhits = 0
+    self.nmisses = 0
+    self.nevictions = 0
+
+  def Get(self,strFiles,key,fnLoad):
+    """
+    Returns the object key loaded from the files strFiles, calling fnLoad()
+    only if it is not cached or if one of the files changed since
+    """
+    fullkey = (key,FileKey(strFiles))
+    if fullkey in self._entries:
+      entry = self._entries.pop(fullkey)
+      self._entries[fullkey] = entry
+      self.nhits += 1
+      return entry[0]
+
+    self.nmisses += 1
+    value = fnLoad()
+    nbytes,nmapped = _Freeze(value)
+    if self._maxbytes > 0 and nbytes <= self._maxbytes:
+      self._entries[fullkey] = (value,nbytes,nmapped)
+      self._nbytes += nbytes
+      self._nmapped += nmapped
+      self._Evict()
+    return value
+
+  def _Evict(self):
+    while (self._nbytes > self._maxbytes or self._maxbytes == 0) and len(self._entries) > 0:
+      fullkey,(value,nbytes,nmapped) = self._entries.popitem(last = False)
+      self._nbytes -= nbytes
+      self._nmapped -= nmapped
+      self.nevictions += 1
+
+  def GetStats(self):
+    """
+    Returns a dictionary of the cache statistics
+    """
+    return {
+      "hits":      self.nhits,
+      "misses":    self.nmisses,
+      "evictions": self.nevictions,
+      "entries":   len(self._entries),
+      "MB":        self._nbytes/1024./1024.,
+      "mappedMB":  self._nmapped/1024./1024.,
+      "maxMB":     self._maxbytes/1024./1024.,
+    }
+
+  def PrintStats(self):
+    stats = self.GetStats()
+    print("INFO: frame cache %d hits, %d misses, %d evictions, %d entries, %.1f of %.0f MB, %.1f MB mapped" % (stats["hits"],stats["misses"],stats["evictions"],stats["entries"],stats["MB"],stats["maxMB"],stats["mappedMB"]))
+
+def FileKey(strFiles):
+  """
+  Returns the ((absolute path, mtime, size), ...) of the files
+  """
+  fileKey = []
+  for strFile in strFiles:
+    stat = os.stat(strFile)
+    fileKey.append((os.path.abspath(strFile),stat.st_mtime,stat.st_size))
+  return tuple(fileKey)
+
+def _IsMapped(array):
+  """
+  True if the array is (a view of) a memory-mapped file
+  """
+  while isinstance(array,np.ndarray):
+    if isinstance(array,np.memmap):
+      return True
+    array = array.base
+  return False
+
+def _Freeze(value):
+  """
+  Makes the arrays of a loaded object (array, or dictionary, list, tuple of
+  them) read only and returns their size in bytes (held, mapped)
+  """
+  if isinstance(value,np.ndarray):
+    value.flags.writeable = False
+    if _IsMapped(value):
+      return (0,value.nbytes)
+    return (value.nbytes,0)
+  items = []
+  if isinstance(value,dict):
+    items = value.values()
+  elif isinstance(value,(list,tuple)):
+    items = value
+  sizes = [_Freeze(item) for item in items]
+  return (sum(size[0] for size in sizes),sum(size[1] for size in sizes))
+
+#The cache of the process
+_cache = FrameCache()
+
+def Get(strFiles,key,fnLoad):
+  return _cache.Get(strFiles,key,fnLoad)
+
+def SetMaxMB(fltMaxMB):
+  _cache.SetMaxMB(fltMaxMB)
+
+def Clear():
+  _cache.Clear()
+
+def GetStats():
+  return _cache.GetStats()
+
+def PrintStats():
+  _cache.PrintStats()
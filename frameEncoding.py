@@ -0,0 +1,89 @@
+'''
+frameEncoding.py
+
+About: Numeric storage of the temperature frames written by
+  share/texttoroot.py and the transparent decoding used by every reader.
+
+  Three encodings of the atree branches are supported:
+    double: temperature/D, xpos/I, ypos/I  (default, 16 bytes per pixel)
+    float:  temperature/F, xpos/s, ypos/s  (8 bytes per pixel)
+    centi:  temperature/S, xpos/s, ypos/s  (6 bytes per pixel)
+            int16 fixed point, temperature = tscale * value + toffset with
+            tscale = 0.01 C, i.e. centi-degree, covering -327 C to 327 C.
+
+  The scale and offset are written to the btree branches tscale and toffset.
+  Files without these branches are decoded with scale 1 and offset 0, so
+  root files from older conversions are read as before.
+
+Requires: numpy, pyROOT for BranchBuffer and ReadScale
+'''
+
+import numpy as np
+
+ENCODINGS = {
+  #name      temperature leaf, numpy type, position leaf, numpy type, scale, offset
+  "double": ("D", np.float64, "I", int,       1.,   0.),
+  "float":  ("F", np.float32, "s", np.uint16, 1.,   0.),
+  "centi":  ("S", np.int16,   "s", np.uint16, 0.01, 0.),
+}
+
+#numpy types matching the ROOT leaf types, used to read any encoding
+LEAFTYPES = {
+  "Double_t":  np.float64,
+  "Float_t":   np.float32,
+  "Short_t":   np.int16,
+  "UShort_t":  np.uint16,
+  "Int_t":     int,
+  "UInt_t":    int,
+}
+
+def GetEncoding(strEncoding):
+  """
+  Returns the tuple describing an encoding, raises an Exception for an unknown name
+  """
+  if strEncoding not in ENCODINGS:
+    print("ERROR: unknown storage encoding "+str(strEncoding)+", use one of "+", ".join(sorted(ENCODINGS)))
+    raise Exception(" Storage encoding error! ")
+  return ENCODINGS[strEncoding]
+
+def Encode(temperature,strEncoding):
+  """
+  Encodes an array of temperatures (C) into the stored values of the encoding
+  """
+  leaf,dtype,posleaf,posdtype,scale,offset = GetEncoding(strEncoding)
+  if dtype == np.int16:
+    info = np.iinfo(np.int16)
+    values = np.round((np.asarray(temperature,dtype=float)-offset)/scale)
+    return np.clip(values,info.min,info.max).astype(np.int16)
+  return np.asarray(temperature,dtype=dtype)
+
+def Decode(values,scale = 1.,offset = 0.):
+  """
+  Decodes stored values (a number or an array) back into temperatures (C)
+  """
+  if scale == 1. and offset == 0.:
+    return np.asarray(values,dtype=float)
+  return np.asarray(values,dtype=float)*scale + offset
+
+def BranchBuffer(Tree,strBranch):
+  """
+  Makes a one element numpy buffer matching the leaf type of a branch and sets
+  the branch address to it
+  """
+  leaf = Tree.GetLeaf(strBranch)
+  dtype = float
+  if leaf:
+    dtype = LEAFTYPES.get(leaf.GetTypeName(),float)
+  buf = np.zeros(1,dtype=dtype)
+  Tree.SetBranchAddress(strBranch,buf)
+  return buf
+
+def ReadScale(btree):
+  """
+  Returns (scale, offset) of the temperature values from the camera information
+  tree, (1., 0.) for files written without them
+  """
+  if not btree or not btree.GetBranch("tscale"):
+    return (1.,0.)
+  btree.GetEntry(0)
+  return (float(btree.tscale),float(btree.toffset))
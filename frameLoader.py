@@ -0,0 +1,117 @@
+'''
+frameLoader.py
+
+About: Bulk loading of the temperature frames into 2D numpy arrays, shared
+  by every reader (frameanal.py, configFinder.py, extras/Vignetting.py and
+  extras/SliceFinder.py).
+
+  The columns of a tree (temperature, xpos, ypos, per pixel maps) are pulled
+  in one TTree::Draw per 4 columns into its internal double buffers, instead
+  of one GetEntry per pixel from python: loading a 640x480 frame goes from
+  seconds to milliseconds. RDataFrame.AsNumpy would do the same, but its
+  just-in-time compilation costs more than the whole read of a frame.
+  The pixels are then placed with one fancy index assignment, so the order
+  of the entries (single frame, average, stave region only) does not matter.
+
+  The converter tags the order of the entries (btree branch layout, see
+  frameStorage.py): the columns of tagged files are only reshaped into 2D
+  views of the region with ReshapeColumn, no copy and no xpos/ypos column.
+  The frame size always comes from the btree (nxpixel, nypixel), any
+  camera resolution, binning or cropping is read the same way.
+
+  LoadTemperature returns the frame T[y][x] oriented as stored in the files
+  and, for L side staves, mirrored in Y to look like a J side stave. The
+  decoded frames are kept in the LRU cache of the process (frameCache.py),
+  a frame read again, e.g. by configFinder.py then frameanal.py, costs no
+  I/O. The returned arrays are read only.
+
+Requires: numpy, pyROOT for root files (npy files, see frameStorage.py, are
+  memory-mapped and need no loop at all)
+'''
+
+import numpy as np
+
+import frameStorage as fs
+import frameCache as fc
+
+def _DrawBuffer(buf,nEntries):
+  """
+  Copies the first nEntries values of a TTree::Draw buffer (GetV1...GetV4)
+  """
+  if hasattr(buf,"SetSize"):
+    buf.SetSize(nEntries)
+  elif hasattr(buf,"reshape"):
+    buf = buf.reshape((nEntries,))
+  return np.array(np.frombuffer(buf,dtype=np.float64,count=nEntries))
+
+def ReadColumns(Tree,strNames):
+  """
+  Reads the branches strNames of all entries of a tree, returns a dictionary
+  name: 1D numpy array (float64)
+  """
+  nEntries = int(Tree.GetEntries())
+  columns = {}
+  if nEntries <= 0:
+    return dict((name,np.zeros(0)) for name in strNames)
+
+  Tree.SetEstimate(nEntries+1)
+  for i in range(0,len(strNames),4):
+    group = strNames[i:i+4]
+    nDrawn = Tree.Draw(":".join(group),"","goff")
+    if nDrawn != nEntries:
+      print("WARNING: TTree::Draw read "+str(nDrawn)+" of "+str(nEntries)+" entries, reading entry by entry")
+      return _ReadColumnsLoop(Tree,strNames)
+    for j,name in enumerate(group):
+      columns[name] = _DrawBuffer(getattr(Tree,"GetV"+str(j+1))(),nEntries)
+  return columns
+
+def _ReadColumnsLoop(Tree,strNames):
+  """
+  Slow fallback of ReadColumns, one GetEntry per entry
+  """
+  nEntries = int(Tree.GetEntries())
+  columns = dict((name,np.zeros(nEntries)) for name in strNames)
+  for entry in range(nEntries):
+    Tree.GetEntry(entry)
+    for name in strNames:
+      columns[name][entry] = getattr(Tree,name)
+  return columns
+
+def ColumnsToFrame(xpos,ypos,values,nxpixel,nypixel,fltFill = -999.):
+  """
+  Places the values of the pixels (xpos, ypos) in a 2D array [y][x] of the
+  full frame, fltFill for the pixels not given
+  """
+  frame = np.full((nypixel,nxpixel),fltFill,dtype=float)
+  frame[np.asarray(ypos,dtype=int),np.asarray(xpos,dtype=int)] = values
+  return frame
+
+def ReshapeColumn(values,region,strOrder):
+  """
+  Returns the 2D view [y][x] of the region (X0, Y0, X1, Y1) of a column of
+  values stored in the order strOrder ("frame" or "average", see
+  frameStorage.LAYOUTS), without copy
+  """
+  x0,y0,x1,y1 = region
+  if strOrder == "average":
+    return values.reshape((x1-x0+1,y1-y0+1)).T
+  return values.reshape((y1-y0+1,x1-x0+1))[::-1]
+
+def LoadFrame(strName,bolSideL = False,fltFill = -999.):
+  """
+  Reads a frame record (see frameStorage.py) of a root or npy file with the
+  temperature and the per pixel maps mirrored in Y for an L side stave.
+  The decoded frame is cached (frameCache.py), its arrays are read only.
+  """
+  frame = dict(fc.Get(fs.FrameFiles(strName),("frame",fltFill),lambda: fs.ReadFrame(strName,fltFill)))
+  if bolSideL:
+    frame["temperature"] = frame["temperature"][::-1]
+    frame["maps"] = dict((name,map_2d[::-1]) for name,map_2d in frame["maps"].items())
+  return frame
+
+def LoadTemperature(strName,bolSideL = False,fltFill = -999.):
+  """
+  Returns the temperature frame T[y][x] (C) of a root or npy file, mirrored
+  in Y for an L side stave
+  """
+  return LoadFrame(strName,bolSideL,fltFill)["temperature"]
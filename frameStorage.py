@@ -0,0 +1,448 @@
+'''
+frameStorage.py
+
+About: Storage of the temperature frames (single frames, averages) written
+  by share/texttoroot.py and of the pipe profiles written by frameanal.py,
+  with two backends:
+
+    root: the ROOT files, NAME.root with the trees
+            atree: temperature, xpos, ypos (+ per pixel maps, e.g. noise)
+            btree: camera information, one entry, with the layout tag
+                   of the atree entries (see LAYOUTS)
+            ttree: time information of the averaged frames (averages only)
+    npy:  NumPy files, read memory-mapped (no copy, no per entry access)
+            NAME.npy      stored temperature values [ypos][xpos] of the
+                          stored region, encoded as in frameEncoding.py
+            NAME.json     camera information (the btree values), region,
+                          encoding, names of the maps, time of the frames
+            NAME.MAP.npy  per pixel maps (float32), e.g. NAME.noise.npy
+
+  Pipe profiles: NAME.root (histograms, for plotting) and NAME.npz (one
+  array of bin contents per histogram plus the bin edges).
+
+  The readers choose the backend from the file name: NAME.root is read
+  with ROOT, NAME.npy or NAME.json with NumPy. A NAME without extension
+  uses NAME.root if it exists, else NAME.json.
+
+  A frame record, as written by WriteFrame and returned by ReadFrame:
+    temperature: 2D array [ypos][xpos] of the full frame in C (ReadFrame)
+    values:      2D array of the stored values of the region (WriteFrame)
+    region:      (X0, Y0, X1, Y1) of the stored pixels
+    nxpixel, nypixel: frame size
+    encoding:    storage encoding name, see frameEncoding.py
+    order:       "frame" (atree entries row by row from the top, as in the
+                 text files) or "average" (X by X, entry = x*NY + y)
+    info:        list of (name, value, leaf type) of the btree (WriteFrame),
+                 dictionary name: value (ReadFrame)
+    maps:        dictionary name: 2D array of the region
+    frames:      list of (index, (year, month, date, hour, minute, second),
+                 accepted) or None
+
+Requires: numpy, pyROOT for the root backend
+'''
+
+import os
+import json
+import numpy as np
+
+import frameEncoding as fe
+import frameLoader as fl
+from lazyRoot import ROOT #imported on first use, the npy backend works without it
+
+FORMATS = ["root", "npy"]
+
+#extension of the file of the stored values of a frame, per backend
+EXTENSIONS = {"root": ".root", "npy": ".npy"}
+
+#btree branch layout: order of the atree entries of the region, written by
+#WriteFrame, so the readers reshape the temperature column without xpos/ypos
+#(root files without it are placed pixel by pixel from xpos/ypos)
+LAYOUTS = {
+  "frame":   1, # row by row from the top row (ypos Y1 down to Y0), xpos fastest
+  "average": 2, # X by X (xpos X0 to X1), ypos fastest
+}
+
+def GetFormats(strFormat):
+  """
+  Returns the list of backends of a format option: root, npy or both
+  """
+  if strFormat == "both":
+    return list(FORMATS)
+  if strFormat not in FORMATS:
+    print("ERROR: unknown storage format "+str(strFormat)+", use one of "+", ".join(FORMATS+["both"]))
+    raise Exception(" Storage format error! ")
+  return [strFormat]
+
+def FrameBase(strName):
+  """
+  Returns the file name without the backend extension
+  """
+  for strExt in [".root",".json",".npy"]:
+    if strName.endswith(strExt):
+      return strName[:-len(strExt)]
+  return strName
+
+def FrameFormat(strName):
+  """
+  Returns the backend (root or npy) used to read a file name
+  """
+  if strName.endswith(".root"):
+    return "root"
+  if strName.endswith(".npy") or strName.endswith(".json"):
+    return "npy"
+  if os.path.isfile(strName+".root"):
+    return "root"
+  return "npy"
+
+def FrameExists(strName):
+  """
+  Returns whether the frame can be read with one of the backends
+  """
+  if FrameFormat(strName) == "root":
+    return os.path.isfile(FrameBase(strName)+".root")
+  return os.path.isfile(FrameBase(strName)+".json")
+
+def FrameFiles(strName):
+  """
+  Returns the files of a frame in the backend used to read it
+  """
+  strBase = FrameBase(strName)
+  if FrameFormat(strName) == "root":
+    return [strBase+".root"]
+  strFiles = [strBase+".json",strBase+".npy"]
+  if os.path.isfile(strBase+".json"):
+    strFiles += [strBase+"."+strMap+".npy" for strMap in _ReadJson(strBase)["maps"]]
+  return [strFile for strFile in strFiles if os.path.isfile(strFile)]
+
+#------------------------------------------------------------------------------
+def WriteFrame(strBase,record,formats = ("root",)):
+  """
+  Writes a frame record to strBase.root and/or strBase.npy and strBase.json,
+  returns the number of bytes written
+  """
+  nBytes = 0
+  for strFormat in formats:
+    if strFormat == "root":
+      nBytes += _WriteRoot(strBase+".root",record)
+    else:
+      nBytes += _WriteNpy(strBase,record)
+  return nBytes
+
+def _WriteRoot(strName,record):
+  t_leaf,t_dtype,pos_leaf,pos_dtype,tscale,toffset = fe.GetEncoding(record["encoding"])
+  values = record["values"]
+  maps = record.get("maps") or {}
+  x0,y0,x1,y1 = record["region"]
+
+  temperature = np.zeros(1,dtype=t_dtype)
+  xpos = np.zeros(1,dtype=pos_dtype)
+  ypos = np.zeros(1,dtype=pos_dtype)
+  mapbufs = dict((name,np.zeros(1,dtype=np.float32)) for name in maps)
+  leaftypes = {"I":int,"D":float}
+  infobufs = [(name,np.array([value],dtype=leaftypes[leaf]),leaf) for name,value,leaf in record["info"]]
+  infobufs.append(("layout",np.array([LAYOUTS[record["order"]]],dtype=int),"I"))
+
+  f_roo = ROOT.TFile(strName,"recreate")
+  atree = ROOT.TTree("atree","a tree of temperature data")
+  atree.Branch('temperature',temperature,'temperature/'+t_leaf)
+  atree.Branch('xpos',xpos,'xpos/'+pos_leaf)
+  atree.Branch('ypos',ypos,'ypos/'+pos_leaf)
+  for name in sorted(maps):
+    atree.Branch(name,mapbufs[name],name+'/F')
+
+  btree = ROOT.TTree("btree","a tree of camera information")
+  for name,buf,leaf in infobufs:
+    btree.Branch(name,buf,name+'/'+leaf)
+  btree.Fill()
+
+  #one atree entry per pixel, filled from whole columns
+  nx,ny = x1-x0+1,y1-y0+1
+  if record["order"] == "average":
+    #pixels of an average stored X by X
+    order = lambda array_2d: np.asarray(array_2d).T.ravel()
+    xcol,ycol = np.repeat(np.arange(x0,x1+1),ny),np.tile(np.arange(y0,y1+1),nx)
+  else:
+    #pixels stored in the order of the text file: X first, from the top row to the bottom row
+    order = lambda array_2d: np.asarray(array_2d)[::-1].ravel()
+    xcol,ycol = np.tile(np.arange(x0,x1+1),ny),np.repeat(np.arange(y1,y0-1,-1),nx)
+  columns = [order(values),xcol,ycol]+[order(maps[name]) for name in sorted(maps)]
+  FillTree(atree,columns,[temperature,xpos,ypos]+[mapbufs[name] for name in sorted(maps)])
+
+  ttree = None
+  if record.get("frames") is not None:
+    t_index = np.zeros(1,dtype=int)
+    t_accepted = np.zeros(1,dtype=int)
+    t_time = [np.zeros(1,dtype=int) for i in range(5)]+[np.zeros(1,dtype=float)]
+    ttree = ROOT.TTree("ttree","a tree of frame time information")
+    ttree.Branch('index',t_index,'index/I')
+    ttree.Branch('accepted',t_accepted,'accepted/I')
+    for name,buf in zip(['year','month','date','hour','minute'],t_time[:5]):
+      ttree.Branch(name,buf,name+'/I')
+    ttree.Branch('second',t_time[5],'second/D')
+    for outidx,ftime,accepted in record["frames"]:
+      t_index[0] = outidx
+      t_accepted[0] = accepted
+      for buf,val in zip(t_time,ftime):
+        buf[0] = val
+      ttree.Fill()
+
+  #
+  # close the file right away, this deletes the trees owned by it
+  #
+  f_roo.Write()
+  f_roo.Close()
+  del atree,btree,ttree,f_roo
+  return os.path.getsize(strName)
+
+#compiled fill loop of FillTree, declared to cling on first use
+_FILL_COLUMNS = """
+#include <cstring>
+#include <vector>
+#include "TTree.h"
+namespace frameStorage {
+  //copies element i of every column into the buffer of its branch, then fills entry i
+  Long64_t FillColumns(TTree* tree,Long64_t nEntries,const std::vector<Long64_t>& columns,
+                       const std::vector<Long64_t>& buffers,const std::vector<int>& sizes) {
+    for (Long64_t i = 0; i < nEntries; ++i) {
+      for (size_t j = 0; j < columns.size(); ++j)
+        std::memcpy((char*)buffers[j],(const char*)columns[j]+i*sizes[j],sizes[j]);
+      tree->Fill();
+    }
+    return nEntries;
+  }
+}
+"""
+_fillColumns = []
+
+def _FillColumns():
+  """
+  Returns the compiled fill loop, None without cling (ROOT 5)
+  """
+  if len(_fillColumns) == 0:
+    fill = None
+    try:
+      if ROOT.gInterpreter.Declare(_FILL_COLUMNS):
+        fill = ROOT.frameStorage.FillColumns
+    except Exception:
+      fill = None
+    _fillColumns.append(fill)
+  return _fillColumns[0]
+
+def FillTree(tree,columns,buffers):
+  """
+  Fills one tree entry per element of the columns (1D arrays, one per
+  branch) into the branches of the one element buffers. The loop runs in
+  compiled code; without cling it falls back to a python loop
+  """
+  columns = [np.ascontiguousarray(column,dtype=buf.dtype) for column,buf in zip(columns,buffers)]
+  nEntries = len(columns[0]) if len(columns) > 0 else 0
+  fill = _FillColumns()
+  if fill is None:
+    for i in range(nEntries):
+      for column,buf in zip(columns,buffers):
+        buf[0] = column[i]
+      tree.Fill()
+    return nEntries
+  vecColumns = ROOT.std.vector('Long64_t')()
+  vecBuffers = ROOT.std.vector('Long64_t')()
+  vecSizes = ROOT.std.vector('int')()
+  for column,buf in zip(columns,buffers):
+    vecColumns.push_back(column.ctypes.data)
+    vecBuffers.push_back(buf.ctypes.data)
+    vecSizes.push_back(buf.dtype.itemsize)
+  return fill(tree,nEntries,vecColumns,vecBuffers,vecSizes)
+
+def _WriteNpy(strBase,record):
+  maps = record.get("maps") or {}
+  meta = {
+    "nxpixel":  int(record["nxpixel"]),
+    "nypixel":  int(record["nypixel"]),
+    "region":   [int(val) for val in record["region"]],
+    "encoding": record["encoding"],
+    "order":    record["order"],
+    "info":     dict((name,(int(value) if leaf == "I" else float(value))) for name,value,leaf in record["info"]),
+    "maps":     sorted(maps),
+    "frames":   None,
+  }
+  if record.get("frames") is not None:
+    meta["frames"] = [[int(outidx),list(ftime),int(accepted)] for outidx,ftime,accepted in record["frames"]]
+
+  np.save(strBase+".npy",np.ascontiguousarray(record["values"]))
+  nBytes = os.path.getsize(strBase+".npy")
+  for name in maps:
+    np.save(strBase+"."+name+".npy",np.ascontiguousarray(maps[name],dtype=np.float32))
+    nBytes += os.path.getsize(strBase+"."+name+".npy")
+  f_json = open(strBase+".json","w")
+  json.dump(meta,f_json,indent=1,sort_keys=True)
+  f_json.close()
+  return nBytes + os.path.getsize(strBase+".json")
+
+#------------------------------------------------------------------------------
+def ReadInfo(strName):
+  """
+  Returns the camera information (btree values) of a frame as a dictionary
+  """
+  strBase = FrameBase(strName)
+  if FrameFormat(strName) == "npy":
+    return _ReadJson(strBase)["info"]
+  f_roo = ROOT.TFile(strBase+".root","read")
+  info = _ReadBtree(f_roo.Get("btree"))
+  f_roo.Close()
+  return info
+
+def ReadFrame(strName,fltFill = -999.):
+  """
+  Reads a frame record. The temperature covers the full frame, the pixels
+  outside of the stored region are set to fltFill. With the npy backend a
+  double frame of the full size is returned without any copy.
+  """
+  strBase = FrameBase(strName)
+  if FrameFormat(strName) == "npy":
+    return _ReadNpy(strBase,fltFill)
+  return _ReadRoot(strBase+".root",fltFill)
+
+def _ReadJson(strBase):
+  f_json = open(strBase+".json","r")
+  meta = json.load(f_json)
+  f_json.close()
+  return meta
+
+def _ReadBtree(btree):
+  info = {}
+  if not btree:
+    return info
+  btree.GetEntry(0)
+  for branch in btree.GetListOfBranches():
+    name = branch.GetName()
+    info[name] = getattr(btree,name)
+  return info
+
+def _FullFrame(region_2d,region,nxpixel,nypixel,fltFill):
+  """
+  Places the array of a region in a full frame, no copy if the region is the frame
+  """
+  x0,y0,x1,y1 = region
+  if (x0,y0,x1,y1) == (0,0,nxpixel-1,nypixel-1):
+    return region_2d
+  full = np.full((nypixel,nxpixel),fltFill,dtype=float)
+  full[y0:y1+1,x0:x1+1] = region_2d
+  return full
+
+def _ReadNpy(strBase,fltFill):
+  meta = _ReadJson(strBase)
+  info = meta["info"]
+  nxpixel,nypixel = meta["nxpixel"],meta["nypixel"]
+  region = tuple(meta["region"])
+  values = np.load(strBase+".npy",mmap_mode="r")
+  temperature = fe.Decode(values,info.get("tscale",1.),info.get("toffset",0.))
+  maps = {}
+  for name in meta["maps"]:
+    map_2d = np.load(strBase+"."+name+".npy",mmap_mode="r")
+    maps[name] = _FullFrame(map_2d,region,nxpixel,nypixel,0.)
+  frames = None
+  if meta.get("frames") is not None:
+    frames = [(outidx,tuple(ftime),accepted) for outidx,ftime,accepted in meta["frames"]]
+  return {
+    "temperature": _FullFrame(temperature,region,nxpixel,nypixel,fltFill),
+    "region":      region,
+    "nxpixel":     nxpixel,
+    "nypixel":     nypixel,
+    "encoding":    meta["encoding"],
+    "order":       meta["order"],
+    "info":        info,
+    "maps":        maps,
+    "frames":      frames,
+  }
+
+def _ReadRoot(strName,fltFill):
+  f_roo = ROOT.TFile(strName,"read")
+  info = _ReadBtree(f_roo.Get("btree"))
+  nxpixel,nypixel = int(info["nxpixel"]),int(info["nypixel"])
+  region = (0,0,nxpixel-1,nypixel-1)
+  if "roix0" in info:
+    region = (int(info["roix0"]),int(info["roiy0"]),int(info["roix1"]),int(info["roiy1"]))
+  tscale,toffset = fe.ReadScale(f_roo.Get("btree"))
+
+  atree = f_roo.Get("atree")
+  names = [branch.GetName() for branch in atree.GetListOfBranches()]
+  mapnames = [name for name in names if name not in ["temperature","xpos","ypos"]]
+  x0,y0,x1,y1 = region
+  orders = dict((layout,name) for name,layout in LAYOUTS.items())
+  strOrder = orders.get(int(info.get("layout",0)))
+  if strOrder is not None and atree.GetEntries() == (x1-x0+1)*(y1-y0+1):
+    #entries in the order of the layout tag: 2D views of the columns
+    columns = fl.ReadColumns(atree,["temperature"]+mapnames)
+    temperature = _FullFrame(fl.ReshapeColumn(fe.Decode(columns["temperature"],tscale,toffset),region,strOrder),region,nxpixel,nypixel,fltFill)
+    maps = dict((name,_FullFrame(fl.ReshapeColumn(columns[name],region,strOrder),region,nxpixel,nypixel,0.)) for name in mapnames)
+  else:
+    columns = fl.ReadColumns(atree,["xpos","ypos","temperature"]+mapnames)
+    temperature = fl.ColumnsToFrame(columns["xpos"],columns["ypos"],fe.Decode(columns["temperature"],tscale,toffset),nxpixel,nypixel,fltFill)
+    maps = dict((name,fl.ColumnsToFrame(columns["xpos"],columns["ypos"],columns[name],nxpixel,nypixel,0.)) for name in mapnames)
+  leaf = atree.GetLeaf("temperature")
+  dtype = np.dtype(fe.LEAFTYPES.get(leaf.GetTypeName(),float) if leaf else float)
+
+  frames = None
+  ttree = f_roo.Get("ttree")
+  if strOrder is None:
+    strOrder = "average" if ttree else "frame"
+  if ttree:
+    frames = []
+    for entry in range(ttree.GetEntries()):
+      ttree.GetEntry(entry)
+      ftime = (ttree.year,ttree.month,ttree.date,ttree.hour,ttree.minute,ttree.second)
+      frames.append((ttree.index,ftime,ttree.accepted))
+  f_roo.Close()
+
+  strEncoding = "double"
+  for name in fe.ENCODINGS:
+    if fe.ENCODINGS[name][4] == tscale and dtype == fe.ENCODINGS[name][1]:
+      strEncoding = name
+  return {
+    "temperature": temperature,
+    "region":      region,
+    "nxpixel":     nxpixel,
+    "nypixel":     nypixel,
+    "encoding":    strEncoding,
+    "order":       strOrder,
+    "info":        info,
+    "maps":        maps,
+    "frames":      frames,
+  }
+
+#------------------------------------------------------------------------------
+def WriteProfiles(strBase,profiles,edges):
+  """
+  Writes the pipe profiles, name: array of bin contents, and the bin edges
+  to strBase.npz
+  """
+  arrays = dict((name,np.asarray(values,dtype=float)) for name,values in profiles.items())
+  arrays["edges"] = np.asarray(edges,dtype=float)
+  np.savez(strBase+".npz",**arrays)
+
+def ReadProfiles(strName):
+  """
+  Reads the pipe profiles from NAME.npz, or from the histograms of NAME.root.
+  Returns (profiles, edges) with profiles a dictionary name: bin contents.
+  """
+  strBase = strName
+  for strExt in [".root",".npz"]:
+    if strName.endswith(strExt):
+      strBase = strName[:-len(strExt)]
+  if strName.endswith(".npz") or (not strName.endswith(".root") and os.path.isfile(strBase+".npz")):
+    data = np.load(strBase+".npz")
+    profiles = dict((name,data[name]) for name in data.files if name != "edges")
+    return (profiles,data["edges"])
+
+  f_roo = ROOT.TFile(strBase+".root","read")
+  profiles = {}
+  edges = None
+  for key in f_roo.GetListOfKeys():
+    hist = f_roo.Get(key.GetName())
+    if not hist.InheritsFrom("TH1"):
+      continue
+    nbins = hist.GetNbinsX()
+    profiles[key.GetName()] = np.array([hist.GetBinContent(i+1) for i in range(nbins)])
+    if edges is None:
+      edges = np.array([hist.GetXaxis().GetBinUpEdge(i) for i in range(nbins+1)])
+  f_roo.Close()
+  return (profiles,edges)
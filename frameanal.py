@@ -35,6 +35,15 @@
     The returned temperature is the measurement of the cooling pipe temperature at that
       point.
 
+  pixel_error(iy, ix):
+    Error of a pixel temperature used in the fits: noise / sqrt(N) from the noise map
+      of the average frame (N frames averaged), else 2% of |T| for older root files.
+
+  fit_pipes_fast(ny_1pipe):
+    With fast_fit (-ff), the top and bottom profiles of all the pipe columns are fitted
+      at once with pipeFit.FitProfiles (numpy Levenberg-Marquardt, same model, limits,
+      errors and start values as fit_hist) instead of one MINUIT fit and plot per profile.
+
   find_pipes():
     Find the cooling pipes on the pipe region image. Make plots of the temperature
       distribution along the cooling pipe, together with the fitted result of the mean
@@ -56,9 +65,14 @@ import sys   # system
 import os    # operating system
 import numpy # number in python
 import math  # math
-import ROOT  # ROOT from CERN
 
 import configFinder as cf
+import frameEncoding as fe
+import frameStorage as fs
+import frameLoader as fl
+import frameCache as fc
+import pipeFit as pf
+from lazyRoot import ROOT # ROOT from CERN, imported on first use
 
 class FrameAnalysis:
   """
@@ -110,11 +124,15 @@ class FrameAnalysis:
     "PipeTmin":     999., 
   }
 
-  def __init__ (self, roo_name, cfg_name = "config_frame", fig_outdir = "plot", bolFindConfig = True, bol14ModCore = False) :
+  def __init__ (self, roo_name, cfg_name = "config_frame", fig_outdir = "plot", bolFindConfig = True, bol14ModCore = False, geo_cache_dir = None, geo_engine = "hough", fast_fit = False, no_root = False, geo_hough = "full") :
     #
-    # better run root on batch mode
+    # better run root on batch mode; without ROOT (no_root) nothing is drawn, the profiles are fitted with numpy
+    # and only written to result.npz
     #
-    ROOT.gROOT.SetBatch()
+    self._no_root = no_root
+    self._fast_fit = fast_fit or no_root
+    if not no_root:
+      ROOT.gROOT.SetBatch()
 
     #
     # create the output folders if not exist yet
@@ -131,7 +149,7 @@ class FrameAnalysis:
  
     if bolFindConfig == True:
       print ("Usage: Finding frame configuration...")
-      cf.FindPoints( roo_name, cfg_name, fig_outdir, bol14ModCore)
+      cf.FindPoints( roo_name, cfg_name, fig_outdir, bol14ModCore, bolPlot = not no_root, strCacheDir = geo_cache_dir, strHough = geo_hough, strEngine = geo_engine )
  
     if not os.path.isfile( cfg_name ):
       print ("ERROR:<FRAMEANALYSIS::__INIT__> config file " + cfg_name + " not found.")
@@ -139,8 +157,8 @@ class FrameAnalysis:
 
     if bolFindConfig == True:
       os.system('cp '+cfg_name+' '+fig_outdir+'/'+cfg_name)
-      frame_name = roo_name.split('/')[-1]
-      os.system('cp '+roo_name+' '+fig_outdir+'/'+frame_name)
+      for frame_file in fs.FrameFiles( roo_name ):
+        os.system('cp '+frame_file+' '+fig_outdir+'/'+frame_file.split('/')[-1])
 
     _f_cfg = open( cfg_name, 'r')
     for line in _f_cfg:
@@ -187,54 +205,42 @@ class FrameAnalysis:
       print ("INFO:<FRAMEANALYSIS::__INIT__> " + par + " = " + str( val ) )
 
     #
-    # read the input root file
+    # read the input frame, root or npy file, see frameStorage.py
     #
-    if not os.path.isfile( roo_name ):
+    if not fs.FrameExists( roo_name ):
       print ("ERROR:<FRAMEANALYSIS::__INIT__> root input file " + roo_name + " not found.")
       raise Exception(" Root input file error! ")
-    _f_roo = ROOT.TFile( roo_name, "read" );
-
-    _btree = _f_roo.Get("btree");
-    _nxpixel  = numpy.zeros(1, dtype=int)
-    _nypixel  = numpy.zeros(1, dtype=int)
-    _btree.SetBranchAddress( "nxpixel", _nxpixel )
-    _btree.SetBranchAddress( "nypixel", _nypixel )
-    _btree.GetEntry( 0 )
-    if (_nxpixel[0] <=0) or (_nypixel[0] <=0):
+    #
+    # bulk read (frameLoader.py); for L side, the frame and its maps are
+    # mirrored in Y to present the stave as J side
+    #
+    _frame = fl.LoadFrame( roo_name, self._parameters[ "StaveSideL" ], -999. )
+
+    _nxpixel = _frame[ "nxpixel" ]
+    _nypixel = _frame[ "nypixel" ]
+    if (_nxpixel <=0) or (_nypixel <=0):
       print ("ERROR:<FRAMEANALYSIS::__INIT__> number of pixels in X and/or Y not obtained.")
       raise Exception(" Number of pixels not set!")
 
-    if ( self._parameters[ "StavePixelX1" ] >= _nxpixel[0] ) or ( self._parameters[ "StavePixelY1" ] >= _nypixel[0] ):
+    if ( self._parameters[ "StavePixelX1" ] >= _nxpixel ) or ( self._parameters[ "StavePixelY1" ] >= _nypixel ):
       raise Exception(" Stave pixel index overflowed error! ")
  
-    self._nxpixel_raw = _nxpixel[0]
-    self._nypixel_raw = _nypixel[0]
+    self._nxpixel_raw = _nxpixel
+    self._nypixel_raw = _nypixel
 
     #
-    # Temperature in 2D for the whole raw figure T[y][x] initialized with -999 C.
+    # Temperature in 2D for the whole raw figure T[y][x], -999 C for the pixels not stored.
+    # The temperature may be stored as float or fixed point, see frameEncoding.py
     #
-    self.stave_temperature_2d = [[ -999. for x in range( _nxpixel[0] )] for y in range( _nypixel[0] )]
-
-    _atree = _f_roo.Get("atree");
-    _xpos  = numpy.zeros(1, dtype=int)
-    _ypos  = numpy.zeros(1, dtype=int)
-    _temperature = numpy.zeros(1, dtype=float) 
-    _atree.SetBranchAddress( "xpos", _xpos )
-    _atree.SetBranchAddress( "ypos", _ypos )
-    _atree.SetBranchAddress( "temperature", _temperature )
-    _n_entries = _atree.GetEntries()
-    for ientry in range( _n_entries ):
-      _atree.GetEntry( ientry )
-      if ( self._parameters[ "StaveSideL" ] ):
-      # 
-      # for L side, use a mirror image for Y axis to present the stave as J side
-      #
-        _ypos_mr = _nypixel[0] - _ypos[0] - 1
-        self.stave_temperature_2d[ _ypos_mr ][ _xpos[0] ] = _temperature[0]
-      else:
-        self.stave_temperature_2d[ _ypos[0] ][ _xpos[0] ] = _temperature[0]
+    self.stave_temperature_2d = _frame[ "temperature" ]
 
-    _f_roo.Close()
+    #
+    # temporal noise of each pixel and number of frames averaged, written by
+    # share/texttoroot.py for the average frame. Without them the pixel
+    # errors fall back to 2% of the temperature.
+    #
+    self.stave_noise_2d = _frame[ "maps" ].get( "noise" )
+    self._nframes = max( 1, int( _frame[ "info" ].get( "nframes", 1 ) ) )
 
   def draw_frames(self):
     """
@@ -312,6 +318,26 @@ class FrameAnalysis:
     c2.Print( self._fig_outdir + "/pipe.png" )
     c2.Print( self._fig_outdir + "/pipe.pdf" )
 
+  def pixel_error(self, iy, ix):
+    """
+      error of the temperature of pixel [iy][ix]: the error of the mean, noise / sqrt( nframes ),
+      from the noise map of the average frame, else 2% of the absolute temperature
+    """
+    if ( self.stave_noise_2d is not None ) and ( self.stave_noise_2d[ iy ][ ix ] > 0. ):
+      return self.stave_noise_2d[ iy ][ ix ] / math.sqrt( self._nframes )
+    return 0.02 * math.fabs( self.stave_temperature_2d[ iy ][ ix ] )
+
+  def pixel_errors(self, rows, cols):
+    """
+      errors of the pixels [rows, cols] (slices) as pixel_error, in one array
+    """
+    _temp = numpy.asarray( self.stave_temperature_2d[ rows, cols ], dtype=float )
+    _err = 0.02 * numpy.abs( _temp )
+    if self.stave_noise_2d is not None:
+      _noise = numpy.asarray( self.stave_noise_2d[ rows, cols ], dtype=float )
+      _err = numpy.where( _noise > 0., _noise / math.sqrt( self._nframes ), _err )
+    return _err
+
   def fit_hist(self, h1):
     """
       read a 1D histogram, fit to gaussian function, return (mean, mean position, width) 
@@ -369,6 +395,32 @@ class FrameAnalysis:
  
     return (_temp, _mean, _width, _chi2, _ndf)
 
+  def fit_pipes_fast(self, ny_1pipe):
+    """
+      fit the top and bottom profiles of all the pipe columns at once (pipeFit.FitProfiles), with the model, parameter
+      limits, pixel errors and start values (those of TH1::Fit for "gaus") of fit_hist.
+      Returns the (temp, mean, width, chi2, ndf) arrays of the top and of the bottom pipe. No fit plot is made.
+    """
+    _ix0 = int( self._parameters[ "PipePixelX0" ] )
+    _iy0 = int( self._parameters[ "PipePixelY0" ] )
+    _cols = slice( _ix0, _ix0 + self._nxpixel_pipe )
+    _top = slice( _iy0 + self._nypixel_pipe - ny_1pipe, _iy0 + self._nypixel_pipe )
+    _bot = slice( _iy0, _iy0 + ny_1pipe )
+
+    # one row per profile, top then bottom, the values rounded as in the TH1F bins
+    _t_2d = numpy.vstack( ( self.stave_temperature_2d[ _top, _cols ].T, self.stave_temperature_2d[ _bot, _cols ].T ) )
+    _t_2d = _t_2d.astype( numpy.float32 ).astype( float )
+    _e_2d = numpy.vstack( ( self.pixel_errors( _top, _cols ).T, self.pixel_errors( _bot, _cols ).T ) )
+
+    if ( self._parameters[ "LiquidTLow" ] > 0 ):
+      _t_limits = (-100., 10.)
+    else:
+      _t_limits = (0.00001, 100.)
+    _fit = pf.FitProfiles( _t_2d, _e_2d, _t_limits )
+
+    _n = self._nxpixel_pipe
+    return ( [ _val[:_n] for _val in _fit ], [ _val[_n:] for _val in _fit ] )
+
   def find_pipes(self):
     """
       Find the temperature profile of the cooling pipe. At each point along the cooling pipe, find the minimum ( or maximum depending on the operating
@@ -382,7 +434,20 @@ class FrameAnalysis:
         where, only the top and bottom pipes are kept. The short pipe turn along the Y axis at right is NOT analyzed so far.
         Obtain the cooling pipe temperature as a function of X axis for top and bottom lines. Use the top 40% of the pixels to get the top cooling pipe,
         and the bottom 40% of the pixels for the bottom pipe curve.
+        The profiles are written as histograms to result.root and as arrays to result.npz.
+        With fast_fit all the profiles are fitted at once (fit_pipes_fast), without the plots of plot/fit/.
+        With no_root the profiles are only written to result.npz, without ROOT and without plots.
     """
+    _edges = numpy.linspace( self._X0_pipe, self._X1_pipe, self._nxpixel_pipe + 1 )
+    if self._no_root:
+      _t_data, _b_data = self.fit_pipes_fast( int ( 0.4 * self._nypixel_pipe ) )
+      _profiles = {}
+      for _side, _data in [ ("top", _t_data), ("bot", _b_data) ]:
+        for _name, _val in zip( [ "temperature", "mean", "width", "chi2", "ndf" ], _data ):
+          # float32 as the TH1F bins of result.root
+          _profiles[ _side + "_pipe_" + _name ] = numpy.asarray( _val ).astype( numpy.float32 ).astype( float )
+      fs.WriteProfiles( self._fig_outdir + "/result", _profiles, _edges )
+      return
 
     _roo_out = ROOT.TFile(self._fig_outdir+"/result.root", "recreate")
     h1s = [ ROOT.TH1F("top_pipe_temperature",  ";X in cm; Temperature (#circC)",  self._nxpixel_pipe, self._X0_pipe, self._X1_pipe),
@@ -398,42 +463,49 @@ class FrameAnalysis:
           ]
           
 
-    for ix in range ( self._nxpixel_pipe ) :
-      ix_raw = int ( ix + self._parameters[ "PipePixelX0" ] )
-      ny_1pipe = int ( 0.4 * self._nypixel_pipe )
-      #
-      # pipe using the top and bottom 40% of the pixels
-      #   top: high Y
-      #   bottom: low Y
-      #
-      ht1 = ROOT.TH1F( "t"+str(ix), "t"+str(ix), ny_1pipe, 0., float( ny_1pipe ) ) 
-      hb1 = ROOT.TH1F( "b"+str(ix), "b"+str(ix), ny_1pipe, 0., float( ny_1pipe ) ) 
-      for iy in range ( self._nypixel_pipe ) :
+    if self._fast_fit:
+      _t_data, _b_data = self.fit_pipes_fast( int ( 0.4 * self._nypixel_pipe ) )
+      for idx in range( 5 ):
+        for ix in range( self._nxpixel_pipe ):
+          h1s[ idx ].SetBinContent( ix+1, _t_data[ idx ][ ix ] )
+          h1s[ idx + 5 ].SetBinContent( ix+1, _b_data[ idx ][ ix ] )
+    else:
+      for ix in range ( self._nxpixel_pipe ) :
+        ix_raw = int ( ix + self._parameters[ "PipePixelX0" ] )
+        ny_1pipe = int ( 0.4 * self._nypixel_pipe )
+        #
+        # pipe using the top and bottom 40% of the pixels
+        #   top: high Y
+        #   bottom: low Y
+        #
+        ht1 = ROOT.TH1F( "t"+str(ix), "t"+str(ix), ny_1pipe, 0., float( ny_1pipe ) ) 
+        hb1 = ROOT.TH1F( "b"+str(ix), "b"+str(ix), ny_1pipe, 0., float( ny_1pipe ) ) 
+        for iy in range ( self._nypixel_pipe ) :
         
-        iy_raw = int ( iy + self._parameters[ "PipePixelY0" ] )
-
-        if ( iy < ny_1pipe ):
-          #
-          # low Y pixel number for bottom curve
-          #
-          hb1.SetBinContent( iy + 1, self.stave_temperature_2d[ iy_raw ][ ix_raw ])
-          hb1.SetBinError( iy + 1, 0.02 * self.stave_temperature_2d[ iy_raw ][ ix_raw ]) # set 2% error
-        elif ( iy >= int(self._nypixel_pipe - ny_1pipe) ):
-          #
-          # high Y pixel number for top curve
-          #
-          iy_reset = int(iy - (self._nypixel_pipe - ny_1pipe) + 1 )
-          ht1.SetBinContent( iy_reset, self.stave_temperature_2d[ iy_raw ][ ix_raw ])
-          ht1.SetBinError( iy_reset, 0.02 * self.stave_temperature_2d[ iy_raw ][ ix_raw ]) # set 2% error
-
-      # returned tuple: (temp, mean, width, chi2, ndf)
-      _t_data = self.fit_hist( ht1 )
-      _b_data = self.fit_hist( hb1 )
-      for idx,val in enumerate(_t_data):
-        h1s[ idx ].SetBinContent( ix+1, val )
-      for idx,val in enumerate(_b_data):
-        jdx = int( idx + 5 )
-        h1s[ jdx ].SetBinContent( ix+1, val )
+          iy_raw = int ( iy + self._parameters[ "PipePixelY0" ] )
+
+          if ( iy < ny_1pipe ):
+            #
+            # low Y pixel number for bottom curve
+            #
+            hb1.SetBinContent( iy + 1, self.stave_temperature_2d[ iy_raw ][ ix_raw ])
+            hb1.SetBinError( iy + 1, self.pixel_error( iy_raw, ix_raw ) )
+          elif ( iy >= int(self._nypixel_pipe - ny_1pipe) ):
+            #
+            # high Y pixel number for top curve
+            #
+            iy_reset = int(iy - (self._nypixel_pipe - ny_1pipe) + 1 )
+            ht1.SetBinContent( iy_reset, self.stave_temperature_2d[ iy_raw ][ ix_raw ])
+            ht1.SetBinError( iy_reset, self.pixel_error( iy_raw, ix_raw ) )
+
+        # returned tuple: (temp, mean, width, chi2, ndf)
+        _t_data = self.fit_hist( ht1 )
+        _b_data = self.fit_hist( hb1 )
+        for idx,val in enumerate(_t_data):
+          h1s[ idx ].SetBinContent( ix+1, val )
+        for idx,val in enumerate(_b_data):
+          jdx = int( idx + 5 )
+          h1s[ jdx ].SetBinContent( ix+1, val )
 
     c0 = ROOT.TCanvas( 'c0', '', 2000, 600 )
     # margin: Float_t left, Float_t right, Float_t bottom, Float_t top
@@ -452,17 +524,50 @@ class FrameAnalysis:
 
     _roo_out.Close()
 
+    #
+    # the same profiles as numpy arrays, result.npz, see frameStorage.py
+    #
+    _profiles = dict( (h1.GetName(), [ h1.GetBinContent( ix + 1 ) for ix in range( self._nxpixel_pipe ) ]) for h1 in h1s )
+    fs.WriteProfiles( self._fig_outdir + "/result", _profiles, _edges )
+
 def print_usage( s_function):
   print ("Usage: " + s_function + " INPUT_ROOT_FILE [CONFIG = config_frame] [OUTDIR = plot]")
   print (" -mc : uses the config_frame file in the local directory of the inputroot file")
   print (" -14M: searches for a 14 module stave core instead of a 13 module")
+  print (" -w  : also profile the window_NNNNN.root (or .json) sliding-window averages next to the input file")
+  print (" -id : profile the frame even if its stave drift is above the steady-state threshold")
+  print (" -cm MB: memory cap of the cache of decoded frames (default 512 MB, 0 disables it)")
+  print (" -gc : reuse the stave lines of a matching frame from the geometry cache (geometrycache/ in the working directory)")
+  print (" -pj : find the stave lines from the row and column projections of the frame, Hough only if they are ambiguous")
+  print (" -hs SCHEDULE: Hough resolution schedule (full: the original passes, default; strips, fast: in the stave band only)")
+  print (" -ff : fit all the pipe profiles at once with numpy instead of one MINUIT fit each, no plots in OUTDIR/fit/")
+  print (" -nr : no ROOT (npy input, see frameStorage.py): no plots, numpy fits (-ff), profiles only in OUTDIR/result.npz")
+
+def check_drift( roo_name ):
+  """
+    Returns False if the drift of the stave (btree branch drift, C/min) written by share/texttoroot.py is above
+    its threshold (driftlimit), i.e. the recording was not in steady state. True for root files without them.
+  """
+  if not fs.FrameExists( roo_name ):
+    return True
+  _info = fs.ReadInfo( roo_name )
+  bolSteady = True
+  if ( "drift" in _info ) and ( "driftlimit" in _info ):
+    _drift = float( _info[ "drift" ] )
+    _limit = float( _info[ "driftlimit" ] )
+    if _drift > _limit:
+      print ("ERROR:<FRAMEANALYSIS::CHECK_DRIFT> stave drift %.3f C/min above %.3f C/min in %s, not in steady state!" % (_drift, _limit, roo_name) )
+      bolSteady = False
+    else:
+      print ("INFO:<FRAMEANALYSIS::CHECK_DRIFT> stave drift %.3f C/min below %.3f C/min." % (_drift, _limit) )
+  return bolSteady
 
-def main():
-  if sys.version_info[0] >= 3:
-    print ("ERROR:<FRAMEANALYSIS::MAIN> PyROOT only works with Python 2.x. Code Tested with 2.7.10. Current version " + str(sys.version_info[0]) + ".x")
-    raise Exception(" Python Version too high. Use 2.x. ")
-
-  strInputCmds = sys.argv[1:]
+def main( strArgs = None ):
+  """
+    Runs frameanal.py with the command line options strArgs (default: sys.argv[1:]), e.g. called in-process by
+    seqToProfile.py so ROOT is loaded once for all recordings.
+  """
+  strInputCmds = list( sys.argv[1:] if strArgs is None else strArgs )
   if ("-h" in strInputCmds) or ("--help" in strInputCmds):
     print_usage( str(sys.argv[0]))
     return
@@ -487,6 +592,91 @@ def main():
   else:
     print("Usage: Assuming 13 module stave core")
 
+  bolIgnoreDrift = False
+  if ("-id" in strInputCmds) or ("--ignoredrift" in strInputCmds):
+    print("Usage: Profiling even if the recording is not in steady state")
+    bolIgnoreDrift = True
+    while ("-id" in strInputCmds):
+      strInputCmds.remove("-id")
+    while ("--ignoredrift" in strInputCmds):
+      strInputCmds.remove("--ignoredrift")
+
+  bolWindows = False
+  if ("-w" in strInputCmds) or ("--windows" in strInputCmds):
+    print("Usage: Also profiling the sliding-window averages")
+    bolWindows = True
+    while ("-w" in strInputCmds):
+      strInputCmds.remove("-w")
+    while ("--windows" in strInputCmds):
+      strInputCmds.remove("--windows")
+
+  strGeoCacheDir = None
+  if ("-gc" in strInputCmds) or ("--geometrycache" in strInputCmds):
+    print("Usage: Stave lines reused from the geometry cache (geometrycache/) when confirmed")
+    strGeoCacheDir = "geometrycache"
+    while ("-gc" in strInputCmds):
+      strInputCmds.remove("-gc")
+    while ("--geometrycache" in strInputCmds):
+      strInputCmds.remove("--geometrycache")
+  if ("-ng" in strInputCmds) or ("--nogeometrycache" in strInputCmds):
+    print ("WARNING:<FRAMEANALYSIS> -ng (--nogeometrycache) is deprecated and ignored: the geometry cache is only used with -gc")
+    while ("-ng" in strInputCmds):
+      strInputCmds.remove("-ng")
+    while ("--nogeometrycache" in strInputCmds):
+      strInputCmds.remove("--nogeometrycache")
+
+  strGeoEngine = "hough"
+  if ("-pj" in strInputCmds) or ("--projection" in strInputCmds):
+    print("Usage: Stave lines found from the projections of the frame")
+    strGeoEngine = "projection"
+    while ("-pj" in strInputCmds):
+      strInputCmds.remove("-pj")
+    while ("--projection" in strInputCmds):
+      strInputCmds.remove("--projection")
+
+  bolFastFit = False
+  if ("-ff" in strInputCmds) or ("--fastfit" in strInputCmds):
+    print("Usage: Pipe profiles fitted all at once (numpy)")
+    bolFastFit = True
+    while ("-ff" in strInputCmds):
+      strInputCmds.remove("-ff")
+    while ("--fastfit" in strInputCmds):
+      strInputCmds.remove("--fastfit")
+
+  bolNoRoot = False
+  if ("-nr" in strInputCmds) or ("--noroot" in strInputCmds):
+    print("Usage: No ROOT: no plots, pipe profiles fitted with numpy, result.npz only")
+    bolNoRoot = True
+    while ("-nr" in strInputCmds):
+      strInputCmds.remove("-nr")
+    while ("--noroot" in strInputCmds):
+      strInputCmds.remove("--noroot")
+  #PyROOT is only needed without -nr
+  if sys.version_info[0] >= 3 and not bolNoRoot:
+    print ("ERROR:<FRAMEANALYSIS::MAIN> PyROOT only works with Python 2.x. Code Tested with 2.7.10. Current version " + str(sys.version_info[0]) + ".x. Use -nr on npy frames.")
+    raise Exception(" Python Version too high. Use 2.x. ")
+
+  strGeoHough = "full"
+  if ("-hs" in strInputCmds) or ("--houghschedule" in strInputCmds):
+    strOpt = "-hs" if ("-hs" in strInputCmds) else "--houghschedule"
+    iOpt = strInputCmds.index(strOpt)
+    if ( iOpt + 1 >= len(strInputCmds) ) or ( strInputCmds[iOpt+1] not in cf.HOUGH_SCHEDULES ):
+      print ("ERROR:<FRAMEANALYSIS> " + strOpt + " needs a Hough schedule: " + ", ".join( sorted( cf.HOUGH_SCHEDULES ) ) + ". Return.")
+      return
+    print("Usage: Hough schedule " + strInputCmds[iOpt+1])
+    strGeoHough = strInputCmds[iOpt+1]
+    del strInputCmds[iOpt:iOpt+2]
+
+  if ("-cm" in strInputCmds) or ("--cachemb" in strInputCmds):
+    strOpt = "-cm" if ("-cm" in strInputCmds) else "--cachemb"
+    iOpt = strInputCmds.index(strOpt)
+    if iOpt + 1 >= len(strInputCmds):
+      print ("ERROR:<FRAMEANALYSIS> " + strOpt + " needs the cache size in MB. Return.")
+      return
+    print("Usage: Frame cache of " + strInputCmds[iOpt+1] + " MB")
+    fc.SetMaxMB( float( strInputCmds[iOpt+1] ) )
+    del strInputCmds[iOpt:iOpt+2]
+
   if len(strInputCmds) <= 0:
     print ("ERROR:<FRAMEANALYSIS> Please provide: input root file. Missing! Return.")
     print_usage( str(sys.argv[0]))
@@ -516,9 +706,36 @@ def main():
     if str_outdir == 'plot':
       str_outdir = strInDir
 
-  ist_frmana = FrameAnalysis( str_inroo, str_cfg, str_outdir, bolFindConfig, bol14ModCore )
-  ist_frmana.draw_frames()
+  if ( not check_drift( str_inroo ) ) and ( not bolIgnoreDrift ):
+    print ("ERROR:<FRAMEANALYSIS> recording not in steady state, no profile made. Use -id to profile it anyway. Return.")
+    return
+
+  ist_frmana = FrameAnalysis( str_inroo, str_cfg, str_outdir, bolFindConfig, bol14ModCore, strGeoCacheDir, strGeoEngine, bolFastFit, bolNoRoot, strGeoHough )
+  if not bolNoRoot:
+    ist_frmana.draw_frames()
   ist_frmana.find_pipes()
+
+  if bolWindows == True:
+    #the windows are profiled with the config of the average, in OUTDIR/windows/window_NNNNN
+    strInDir = os.path.dirname( str_inroo )
+    if strInDir == "":
+      strInDir = "."
+    #root files first, npy files first without ROOT
+    strWinNames = []
+    for strExt in ( [".json", ".root"] if bolNoRoot else [".root", ".json"] ):
+      if len( strWinNames ) == 0:
+        strWinNames = sorted( [ name for name in os.listdir( strInDir ) if name.startswith( "window_" ) and name.endswith( strExt ) ] )
+    if len( strWinNames ) == 0:
+      print ("WARNING:<FRAMEANALYSIS> no window_NNNNN.root or window_NNNNN.json found in " + strInDir)
+    elif not os.path.isdir( str_outdir + "/windows" ):
+      os.mkdir( str_outdir + "/windows" )
+    for strWinName in strWinNames:
+      print ("INFO:<FRAMEANALYSIS> profiling " + strWinName)
+      ist_winana = FrameAnalysis( strInDir + "/" + strWinName, str_cfg, str_outdir + "/windows/" + fs.FrameBase( strWinName ), False, bol14ModCore, fast_fit = bolFastFit, no_root = bolNoRoot )
+      if not bolNoRoot:
+        ist_winana.draw_frames()
+      ist_winana.find_pipes()
+  fc.PrintStats()
   print (' Make plots. Done!')
 
 if __name__ == "__main__":
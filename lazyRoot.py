@@ -0,0 +1,51 @@
+'''
+lazyRoot.py
+
+About: Lazy import of PyROOT for every entry point. Importing ROOT takes
+  seconds (PyROOT and cling start up), more than converting or analysing a
+  frame. With
+
+    from lazyRoot import ROOT
+
+  ROOT is a stand-in module: the real ROOT is imported on the first use of
+  one of its attributes (ROOT.TFile, ROOT.gStyle, ...), i.e. only when a
+  root file or a plot is actually touched. The numeric paths (conversion to
+  npy files, frame loading from npy files, geometry finding without plots,
+  profiling with frameanal.py -nr) never pay for it. The defect search
+  (defectFinder*.py) works on ROOT histograms and always needs ROOT.
+
+  IsLoaded() tells if ROOT was imported, e.g. to check a ROOT-free path.
+
+Requires: pyROOT on first use
+'''
+
+_rootModule = []
+
+def Module():
+  """
+  Imports ROOT on first use and returns the module
+  """
+  if len(_rootModule) == 0:
+    import ROOT as module
+    _rootModule.append(module)
+  return _rootModule[0]
+
+def IsLoaded():
+  return len(_rootModule) > 0
+
+class _LazyModule(object):
+  """
+  Stand-in of the ROOT module, forwards every attribute to the real one
+  """
+  def __getattr__(self,strName):
+    return getattr(Module(),strName)
+
+  def __setattr__(self,strName,value):
+    setattr(Module(),strName,value)
+
+  def __repr__(self):
+    if IsLoaded():
+      return repr(Module())
+    return "<lazy module 'ROOT', not imported yet>"
+
+ROOT = _LazyModule()
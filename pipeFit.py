@@ -0,0 +1,134 @@
+'''
+pipeFit.py
+
+About: The gaussian fits of the pipe profiles of frameanal.py (-ff) done in
+  numpy, all the profiles of a frame at once, instead of one MINUIT fit per
+  profile (FrameAnalysis.fit_hist).
+
+  FitProfiles reproduces fit_hist: the model T(y) = p0 exp(-0.5((y-p1)/p2)^2)
+  on the bin centers 0.5, 1.5, ..., the parameter limits set by fit_hist and
+  the start values TH1::Fit uses for the predefined "gaus" without option B:
+  InitGaus (ROOT::Fit::InitGaus) when the sum of the profile is positive,
+  which also replaces the limits of p2 by [0, 10 rms]; else the TF1 values
+  left by fit_hist, p0 = 0 (moved into its limits), p1 = n/2, p2 = n/3.
+  The chi2 is minimised by FitGausBatch, batched Levenberg-Marquardt steps.
+
+  tests/test_pipeFit.py checks the fits against a grid search of the chi2
+  and, where ROOT and frameanal.py can be imported, against fit_hist.
+
+Requires: numpy
+'''
+
+import numpy as np
+
+#sqrt(2 pi), as in ROOT::Fit::InitGaus
+SQRT2PI = 2.506628
+
+def InitGaus(y_2d,err_2d):
+  """
+  The start values of ROOT::Fit::InitGaus for every row of y_2d, on the bins
+  with an error > 0. Returns the arrays (constant, mean, rms, valid), valid
+  False where the sum of the row is not positive (InitGaus leaves the
+  parameters unchanged)
+  """
+  nrow,nbin = y_2d.shape
+  x = np.arange(nbin)+0.5
+  used = err_2d > 0.
+  y_used = np.where(used,y_2d,0.)
+  n = used.sum(axis=1)
+  valid = n > 0
+  xmin = x[np.argmax(used,axis=1)]
+  xmax = x[nbin-1-np.argmax(used[:,::-1],axis=1)]
+  rangex = np.where(xmax-xmin > 0.,xmax-xmin,1.)
+  binwidth = np.where(n > 1,rangex/np.maximum(n-1,1),1.)
+
+  allcha = y_used.sum(axis=1)
+  valmax = np.maximum(np.where(used,y_2d,-np.inf).max(axis=1),0.)
+  valid &= allcha > 0.
+  norm = np.where(valid,allcha,1.)
+  mean = (y_used*x).sum(axis=1)/norm
+  rms2 = (y_used*x*x).sum(axis=1)/norm-mean*mean
+  rms = np.where(rms2 > 0.,np.sqrt(np.maximum(rms2,0.)),binwidth*n/4.)
+  constant = 0.5*(valmax+binwidth*allcha/(SQRT2PI*rms))
+
+  #mean outside the bins and rms above their range: center and half range
+  outside = ((mean < xmin) | (mean > xmax)) & (rms > xmax-xmin)
+  mean = np.where(outside,0.5*(xmax+xmin),mean)
+  rms = np.where(outside,0.5*(xmax-xmin),rms)
+  return constant,mean,rms,valid
+
+def FitGausBatch(y_2d,err_2d,limits,init,n_iter = 200):
+  """
+  chi2 fits of T(y) = p0 exp(-0.5((y-p1)/p2)^2) to every row of y_2d at once,
+  y the bin centers 0.5, 1.5, ..., with batched Levenberg-Marquardt steps.
+  The parameters are bounded by limits, 3 (low, high) pairs (scalars or one
+  per row): the steps are clipped to them, and a parameter at a limit is
+  held there while the chi2 pushes it out. init are the 3 start values
+  (scalars or one per row). Bins with zero error are left out, as in
+  TH1::Fit. Returns the arrays (p0, p1, p2, chi2, ndf), one value per row
+  """
+  nrow,nbin = y_2d.shape
+  x = np.arange(nbin)+0.5
+  w = np.where(err_2d > 0.,1./np.where(err_2d > 0.,err_2d,1.),0.)
+
+  def _Column(values):
+    return np.column_stack([np.broadcast_to(np.asarray(val,dtype=float),(nrow,)) for val in values])
+  lo = _Column([lim[0] for lim in limits])
+  hi = _Column([lim[1] for lim in limits])
+  #a width limit of 0 (InitGaus) is kept just above it
+  lo[:,2] = np.maximum(lo[:,2],1.e-6)
+
+  def _Residuals(p):
+    g = np.exp(-0.5*((x-p[:,1:2])/p[:,2:3])**2)
+    r = (y_2d-p[:,0:1]*g)*w
+    return g,r,(r**2).sum(axis=1)
+
+  p = np.clip(_Column(init),lo,hi)
+  g,r,chi2 = _Residuals(p)
+  lam = np.full(nrow,1.e-3)
+  jac = np.empty((nrow,nbin,3))
+  eye = np.eye(3)
+  for it in range(n_iter):
+    #weighted jacobian of the model
+    dx = x-p[:,1:2]
+    jac[:,:,0] = g
+    jac[:,:,1] = p[:,0:1]*g*dx/p[:,2:3]**2
+    jac[:,:,2] = p[:,0:1]*g*dx**2/p[:,2:3]**3
+    jac *= w[:,:,None]
+
+    a = np.einsum('nbi,nbj->nij',jac,jac)
+    b = np.einsum('nbi,nb->ni',jac,r)
+    #parameters at a limit pushed out of it are held
+    free = ~(((p <= lo) & (b < 0.)) | ((p >= hi) & (b > 0.)))
+    mask = free[:,:,None] & free[:,None,:]
+    diag = np.maximum(np.diagonal(a,axis1=1,axis2=2),1.e-9)
+    a = np.where(mask,a,0.)+(lam[:,None]*diag+~free)[:,:,None]*eye
+    step = np.linalg.solve(a,np.where(free,b,0.)[:,:,None])[:,:,0]
+    p_new = np.clip(p+step,lo,hi)
+
+    g_new,r_new,chi2_new = _Residuals(p_new)
+    better = chi2_new < chi2
+    done = (better & (chi2-chi2_new <= 1.e-10*chi2)) | (~better & (lam >= 1.e10))
+    p[better] = p_new[better]
+    g[better] = g_new[better]
+    r[better] = r_new[better]
+    chi2[better] = chi2_new[better]
+    lam = np.clip(np.where(better,0.1*lam,10.*lam),1.e-12,1.e12)
+    if np.all(done):
+      break
+
+  ndf = (w > 0.).sum(axis=1)-3
+  return (p[:,0],p[:,1],p[:,2],chi2,ndf)
+
+def FitProfiles(t_2d,err_2d,tLimits):
+  """
+  The fits of FrameAnalysis.fit_hist for every row of t_2d (one profile of
+  n bins per row, errors err_2d): p0 within tLimits, p1 within [n/4, 3n/4],
+  p2 within [n/5, 3n/4], started as TH1::Fit starts the predefined "gaus"
+  (InitGaus, see above). Returns the arrays (temp, mean, width, chi2, ndf)
+  """
+  nrow,nbins = t_2d.shape
+  constant,mean,rms,valid = InitGaus(t_2d,err_2d)
+  init = [np.where(valid,constant,0.),np.where(valid,mean,nbins/2.),np.where(valid,rms,nbins/3.)]
+  limits = [tLimits,(nbins/4.,nbins*3/4.),(np.where(valid,0.,nbins/5.),np.where(valid,10.*rms,nbins*3/4.))]
+  return FitGausBatch(t_2d,err_2d,limits,init)
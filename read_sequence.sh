@@ -3,14 +3,50 @@
 if [[ "$1" =~ ".seq" ]]; then 
   echo ------ doing: $0 $1
 else
-  echo do: $0 _FILE_NAME_.seq -e \(OR -Emissivity\) 0.95
+  echo do: $0 _FILE_NAME_.seq -e \(OR -Emissivity\) 0.95 [--average-only] [--keep-every K] [--storage double\|float\|centi] [--roi [--roi-margin N]] [--no-reject] [--frame-config FILE]
   break
 fi
+seqfile=$1
+shift
 
+#
+# options passed on to texttoroot.py:
+#   --average-only: only produce frame_average.root, no roo/frame_NNNNN.root
+#   --keep-every K: with --average-only, still keep every K-th frame
+#   --storage double|float|centi: numeric storage of the temperatures
+#   --roi: only store the stave region of each frame
+#   --roi-margin N: margin in pixels around the stave region
+#   --chunk N: frames per chunk for memory checks and logging
+#   --max-rss MB: memory budget of the conversion
+#   --window N: also write sliding-window averages of N frames
+#   --stride S: frames between two window averages
+#   --pixel-map auto|build|off: bad pixel correction with the cached camera map
+#   --pixel-map-dir DIR: directory of the cached pixel maps
+#   --register: register the frames before averaging
+#   --register-batch N: frames per batch of shift estimates
+#   --transient: fit the per pixel cool-down time constant, roo/transient.root
+#   --drift-threshold D: largest stave drift in C/min of a steady-state recording
+#   --format root|npy|both: file format of the frames and averages
+#   --no-reject: keep all frames in the average, no outlier rejection
+#   --frame-config FILE: config_frame with the stave region for the frame statistics
+#
 setEmissivity=
-if [[ "$2" = "-e" || "$2" = "-Emissivity"  ]] && [[ "$3" != "" ]]; then 
-  setEmissivity=$3
-fi
+convertOptions=
+while [[ "$1" != "" ]]; do
+  case "$1" in
+    -e|-Emissivity)
+      setEmissivity=$2
+      shift ;;
+    --average-only|--roi|--register|--transient|--no-reject)
+      convertOptions="$convertOptions $1" ;;
+    --keep-every|--storage|--roi-margin|--chunk|--max-rss|--window|--stride|--pixel-map|--pixel-map-dir|--register-batch|--drift-threshold|--format|--frame-config)
+      convertOptions="$convertOptions $1 $2"
+      shift ;;
+    *)
+      echo unknown option: $1 ;;
+  esac
+  shift
+done
 
 
 binarydir=fout
@@ -23,7 +59,7 @@ echo '------ converting seq to binary ------ '
 # produce the binary files frame by frame as seq_n*.fff
 #
 
-./share/seqToBin.py $1 $binarydir     #This should work for any number of sequence files...
+./share/seqToBin.py $seqfile $binarydir     #This should work for any number of sequence files...
 #./share/seqtobinary.pl $1 $binarydir #This method works for small sequence files
 echo ''
 
@@ -44,7 +80,7 @@ if (( nfile <= 0 )); then
   echo 'number of files '$nfile' <= 0 '
   break
 fi
-./share/texttoroot.py $outdir $nfile
+./share/texttoroot.py $outdir $nfile config $txtoutdir frame pgm $convertOptions
 echo ''
 
 echo 'clear binary folder: '$binarydir''
@@ -1,8 +1,10 @@
 #!/usr/bin/python
 """
 @run:
-  ./seqToProfile.py [files]
+  ./seqToProfile.py [-ao] [files]
 
+  [-ao]:   (OR --averageonly) only produce frame_average.root, skipping the
+           per frame root files, which are not needed for the profile.
   [files]: This can be any number of differently named .seq files
 
 @brief:
@@ -11,26 +13,40 @@
   file created by read_sequence.sh. frameanal.py initially will put
   everything into a folder called plots. This will then be relabeled by the
   same name as the sequence file.
+
+  frameanal.py runs in this process (frameanal.main), so ROOT is imported
+  and initialised once for all the sequence files instead of once per file.
 """
 
 import sys
 import os
-import ROOT
 import numpy as np
 import time
 
+import frameanal
+
 def main():
   """
     The main loop
   """
   #load the files
-  nargv = len(sys.argv)
+  strInputCmds = sys.argv[1:]
+  strConvertOptions = ''
+  if ("-ao" in strInputCmds) or ("--averageonly" in strInputCmds):
+    print("Usage: Only the average frame is converted")
+    strConvertOptions = ' --average-only'
+    while ("-ao" in strInputCmds):
+      strInputCmds.remove("-ao")
+    while ("--averageonly" in strInputCmds):
+      strInputCmds.remove("--averageonly")
+
+  nargv = len(strInputCmds)
   inputfiles = []
-  if (nargv <=1):
+  if (nargv <=0):
     print("ERROR: Please provied a set of files.")
   else:
-    for i in range(1,nargv):
-      inputfiles = np.append(inputfiles,sys.argv[i])
+    for i in range(nargv):
+      inputfiles = np.append(inputfiles,strInputCmds[i])
   while True:
     Vin = raw_input("\nIs the stave core a 13 or 14 module core? (13/14)")
     if "13" in Vin:
@@ -55,12 +71,16 @@ def main():
     print('  Start Time   : '+str(starttime))  
     print('  Current Time : '+str(ctime))
     #Read the sequence
-    os.system('bash read_sequence.sh '+inputfiles[i]+' -e 0.92')
+    os.system('bash read_sequence.sh '+inputfiles[i]+' -e 0.92'+strConvertOptions)
     #Create the plots
-    if bol14Mod == False:
-      os.system('./frameanal.py roo/frame_average.root')
-    else:
-      os.system('./frameanal.py roo/frame_average.root -14M')
+    #(an error stops this recording only, as with a separate process)
+    strAnaArgs = ['roo/frame_average.root']
+    if bol14Mod == True:
+      strAnaArgs.append('-14M')
+    try:
+      frameanal.main(strAnaArgs)
+    except Exception as e:
+      print('ERROR: frameanal.py failed on '+inputfiles[i]+': '+str(e))
     #Rename the outdir
     outfilename = inputfiles[i].split('.')[0]
     try:
@@ -49,6 +49,7 @@ for ffile in `ls -t $binaryfold/`; do
       Emissivity=$(echo "$Flir" | grep "Emissivity" | cut -d: -f2)
     fi
     ReflTemp=$(echo "$Flir" | grep "Reflected Apparent Temperature" | sed 's/[^0-9.-]*//g')
+    CameraSerial=$(echo "$Flir" | grep "Camera Serial Number" | head -1 | cut -d: -f2 | tr -d ' ')
 
     echo R1 $R1 >  config
     echo R2 $R2 >> config
@@ -57,6 +58,9 @@ for ffile in `ls -t $binaryfold/`; do
     echo F  $F  >> config
     echo Emissivity  $Emissivity  >> config
     echo ReflTemp $ReflTemp >> config
+    if [[ "$CameraSerial" != "" ]]; then
+      echo CameraSerial $CameraSerial >> config
+    fi
     #echo Time $Time >> config
   fi
 
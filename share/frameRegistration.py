@@ -0,0 +1,124 @@
+"""
+@brief:
+  Registration of the frames of a recording before they are averaged.
+  Camera or stave jitter smears the average frame, which widens the fitted
+  pipe width and biases its mean position in frameanal.py.
+
+  The shift of every frame against a reference frame is found with FFT
+  phase correlation on the stave region: the peak of the inverse FFT of the
+  normalised cross power spectrum is at the shift, refined to sub-pixel
+  with a parabola through the peak and its two neighbours along each axis.
+  The FFTs of a batch of frames are done in one numpy call.
+
+  IR frames are smooth and noisy: a fully whitened spectrum gives the pixel
+  noise the same weight as the stave edges and the peak is lost. The cross
+  power spectrum is therefore only normalised by the square root of its
+  magnitude and the frequencies above ~0.2 cycles per pixel are damped.
+
+@functions:
+  taper_window( n, ntaper ) return window
+  - flat top window with cosine tapers over ntaper samples at each end.
+
+  shift_frame( temperature_2d, dy, dx ) return temperature_2d
+  - frame sampled at (y + dy, x + dx) with bilinear interpolation, the edge
+    pixels are repeated.
+
+@classes:
+  FrameRegistration
+  - keeps the windowed FFT of the reference region and estimates the shifts
+    of a batch of frames.
+
+@email: jie.yu@cern.ch
+"""
+
+import numpy
+
+def taper_window(n, ntaper):
+  """
+  @brief: flat window with cosine tapers over ntaper samples at each end
+  """
+  window = numpy.ones( n )
+  ntaper = min( ntaper, n // 2 )
+  if ntaper > 0:
+    taper = 0.5 * ( 1. - numpy.cos( numpy.pi * numpy.arange( ntaper ) / ntaper ) )
+    window[ :ntaper ] = taper
+    window[ n - ntaper: ] = taper[::-1]
+  return window
+
+def shift_frame(temperature_2d, dy, dx):
+  """
+  @brief: return the frame sampled at (y + dy, x + dx), bilinear, positions
+    outside of the frame are clamped to its edges
+  """
+  ny, nx = temperature_2d.shape
+  ys = numpy.clip( numpy.arange( ny ) + dy, 0., ny - 1. )
+  xs = numpy.clip( numpy.arange( nx ) + dx, 0., nx - 1. )
+  y0 = numpy.minimum( numpy.floor( ys ).astype( int ), ny - 2 )
+  x0 = numpy.minimum( numpy.floor( xs ).astype( int ), nx - 2 )
+  wy = ( ys - y0 )[ :, numpy.newaxis ]
+  wx = ( xs - x0 )[ numpy.newaxis, : ]
+
+  top = temperature_2d[ y0 ][ :, x0 ] * ( 1. - wx ) + temperature_2d[ y0 ][ :, x0 + 1 ] * wx
+  bottom = temperature_2d[ y0 + 1 ][ :, x0 ] * ( 1. - wx ) + temperature_2d[ y0 + 1 ][ :, x0 + 1 ] * wx
+  return top * ( 1. - wy ) + bottom * wy
+
+def _peak_offset(left, centre, right):
+  """
+  @brief: sub-pixel offset of the vertex of the parabola through 3 points
+  """
+  denom = left - 2. * centre + right
+  offset = numpy.where( numpy.fabs( denom ) > 1.e-12, 0.5 * ( left - right ) / numpy.where( denom == 0., 1., denom ), 0. )
+  return numpy.clip( offset, -0.5, 0.5 )
+
+class FrameRegistration:
+  """
+    Phase correlation registration against a reference frame. Only the
+    region (X0, Y0, X1, Y1) of the frames, padded by 'taper' pixels on each
+    side, is used, after removing its mean and applying a window that
+    tapers over the padding only. The stave edges, the only strong
+    structure along Y (and the stave ends along X), are inside the region
+    and keep their full weight: a window tapering over them biases the
+    shifts towards zero. Where the frame ends before the padding, the taper
+    reaches into the region.
+
+    estimate( frames ) returns the shifts (dy, dx) such that
+    shift_frame( frame, dy, dx ) is aligned with the reference.
+  """
+  def __init__ (self, reference_2d, region = None, whitening = 0.5, cutoff = 0.2, taper = 16) :
+    nypixel, nxpixel = reference_2d.shape
+    if region is None:
+      region = (0, 0, nxpixel - 1, nypixel - 1)
+    x0, y0, x1, y1 = region
+    x0, y0, x1, y1 = ( max( 0, x0 - taper ), max( 0, y0 - taper ), min( nxpixel - 1, x1 + taper ), min( nypixel - 1, y1 + taper ) )
+    self._region = (x0, y0, x1, y1)
+    self._whitening = whitening
+    self._window = numpy.outer( taper_window( y1 - y0 + 1, taper ), taper_window( x1 - x0 + 1, taper ) )
+    fy = numpy.fft.fftfreq( y1 - y0 + 1 )[ :, numpy.newaxis ]
+    fx = numpy.fft.fftfreq( x1 - x0 + 1 )[ numpy.newaxis, : ]
+    self._lowpass = numpy.exp( -( fy**2 + fx**2 ) / cutoff**2 )
+    self._reference = numpy.conj( numpy.fft.fft2( self._prepare( reference_2d[ numpy.newaxis ] ) )[0] )
+
+  def _prepare(self, frames_3d):
+    x0, y0, x1, y1 = self._region
+    crop = numpy.array( frames_3d[ :, y0:y1+1, x0:x1+1 ], dtype=float )
+    crop -= crop.mean( axis = (1, 2) )[ :, numpy.newaxis, numpy.newaxis ]
+    return crop * self._window
+
+  def estimate(self, frames_3d):
+    """
+    @brief: shifts (dy, dx), arrays of one value per frame, of a batch of
+      frames, frames_3d[frame][y][x]
+    """
+    cross = numpy.fft.fft2( self._prepare( frames_3d ) ) * self._reference
+    cross *= self._lowpass / numpy.maximum( numpy.abs( cross ), 1.e-12 )**self._whitening
+    corr = numpy.fft.ifft2( cross ).real
+
+    nframe, ny, nx = corr.shape
+    peak = corr.reshape( nframe, -1 ).argmax( axis = 1 )
+    py, px = peak // nx, peak % nx
+    frames = numpy.arange( nframe )
+    dy = py + _peak_offset( corr[ frames, ( py - 1 ) % ny, px ], corr[ frames, py, px ], corr[ frames, ( py + 1 ) % ny, px ] )
+    dx = px + _peak_offset( corr[ frames, py, ( px - 1 ) % nx ], corr[ frames, py, px ], corr[ frames, py, ( px + 1 ) % nx ] )
+    dy = numpy.where( dy > ny / 2., dy - ny, dy )
+    dx = numpy.where( dx > nx / 2., dx - nx, dx )
+    return dy, dx
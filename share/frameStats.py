@@ -0,0 +1,460 @@
+"""
+@brief:
+  Cheap per-frame statistics computed while texttoroot.py streams the frames
+  of a recording, and the running baseline used to leave transient frames
+  (camera auto-NUC events, occlusion, a focus hunt) out of the average.
+
+  Everything here works on one frame at a time, so a recording is only read
+  once.
+
+@functions:
+  read_stave_region( cfg_name, nxpixel, nypixel ) return (X0, Y0, X1, Y1)
+  - read the stave pixel region from a config_frame file and convert it to
+    the pixel indexes used in the root files (L side is not flipped there).
+
+  find_stave_region( temperature_2d ) return (X0, Y0, X1, Y1)
+  - quick estimate of the stave bounding box from the row and column
+    contrast profiles of a (few frames averaged) temperature frame.
+
+  expand_region( region, margin, nxpixel, nypixel ) return (X0, Y0, X1, Y1)
+  - add a margin in pixels around a region, limited to the frame.
+
+  frame_statistics( temperature_2d, counts_2d, maxcount, region, previous_2d )
+  - mean stave region temperature, frame-to-frame difference norm and number
+    of saturated pixels of one frame.
+
+  frame_summary( temperature_2d, region, previous_2d, shift ) return summary
+  - the per frame summary row (see SUMMARY_COLUMNS): mean, min and max of the
+    full frame and of the stave region, spatial RMS, difference RMS and the
+    registration shift.
+
+  frame_seconds( time ) return seconds
+  - frame time (year, month, date, hour, minute, second) in seconds since
+    the epoch, to compute the time elapsed between frames.
+
+@classes:
+  OutlierRejector
+  - running median / MAD baseline of the frame statistics. Frames deviating
+    from it are rejected, until so many in a row are that the deviation is
+    a persistent level change and the baseline restarts from them.
+
+  WindowAverager
+  - sliding-window average frames (window length and stride in frames),
+    computed incrementally from a ring buffer and its running sum.
+
+  DriftFitter
+  - streaming per pixel linear regression of the temperature against time:
+    slope map and drift score of a recording.
+
+  TransientFitter
+  - per pixel fit of an exponential approach T(t) = Tinf + dT exp(-t/tau)
+    over the frames, from running sums, solved for all pixels at once.
+
+@email: jie.yu@cern.ch
+"""
+
+import os
+import calendar
+import numpy
+
+#columns of the per frame summary written by texttoroot.py
+SUMMARY_COLUMNS = [ "full_mean", "full_min", "full_max", "roi_mean", "roi_min", "roi_max", "roi_rms", "diff_rms", "shift_x", "shift_y" ]
+
+def read_stave_region(cfg_name, nxpixel, nypixel):
+  """
+  @brief: read StavePixelX0..Y1 and StaveSideL from a config_frame file.
+    The returned (X0, Y0, X1, Y1) are inclusive pixel indexes as stored in
+    the root files, i.e. the L side mirror used in frameanal.py is undone.
+    Returns None if the file or the parameters are not available.
+  """
+  if not cfg_name or not os.path.isfile( cfg_name ):
+    return None
+
+  pars = {}
+  f_cfg = open( cfg_name, 'r')
+  for line in f_cfg:
+    item_val = line.split()
+    if ( len(item_val) != 2 ) or line.startswith( '#' ):
+      continue
+    try:
+      pars[ item_val[0] ] = float( item_val[1] )
+    except ValueError:
+      continue
+  f_cfg.close()
+
+  for par in [ "StavePixelX0", "StavePixelY0", "StavePixelX1", "StavePixelY1" ]:
+    if not par in pars:
+      return None
+
+  x0 = int( pars[ "StavePixelX0" ] )
+  x1 = int( pars[ "StavePixelX1" ] )
+  y0 = int( pars[ "StavePixelY0" ] )
+  y1 = int( pars[ "StavePixelY1" ] )
+  if pars.get( "StaveSideL", 0 ) > 0:
+    # configFinder.PipeRegion stores the L side edges as |y - NYPIXEL|
+    y0, y1 = nypixel - y1, nypixel - y0
+
+  x0 = max( 0, min( x0, nxpixel - 1 ) )
+  x1 = max( 0, min( x1, nxpixel - 1 ) )
+  y0 = max( 0, min( y0, nypixel - 1 ) )
+  y1 = max( 0, min( y1, nypixel - 1 ) )
+  if ( x1 <= x0 ) or ( y1 <= y0 ):
+    return None
+  return (x0, y0, x1, y1)
+
+def find_stave_region(temperature_2d, fraction = 0.5):
+  """
+  @brief: the stave is a large rectangle with a temperature different from
+    the room temperature background. The rows (columns) of the stave are
+    those whose mean contrast |T - median(T)| exceeds the given fraction of
+    the largest row (column) contrast. The columns are only measured in the
+    rows of the stave. Returns None if no contrast is found.
+  """
+  contrast = numpy.fabs( temperature_2d - numpy.median( temperature_2d ) )
+  row_profile = contrast.mean( axis = 1 )
+  if row_profile.max() <= 0.:
+    return None
+  rows = numpy.nonzero( row_profile > fraction * row_profile.max() )[0]
+  y0, y1 = int( rows[0] ), int( rows[-1] )
+
+  col_profile = contrast[ y0:y1+1 ].mean( axis = 0 )
+  cols = numpy.nonzero( col_profile > fraction * col_profile.max() )[0]
+  x0, x1 = int( cols[0] ), int( cols[-1] )
+  if ( x1 <= x0 ) or ( y1 <= y0 ):
+    return None
+  return (x0, y0, x1, y1)
+
+def expand_region(region, margin, nxpixel, nypixel):
+  """
+  @brief: enlarge a region by margin pixels on each side, within the frame
+  """
+  x0, y0, x1, y1 = region
+  return ( max( 0, x0 - margin ), max( 0, y0 - margin ), min( nxpixel - 1, x1 + margin ), min( nypixel - 1, y1 + margin ) )
+
+def frame_statistics(temperature_2d, counts_2d, maxcount, region = None, previous_2d = None):
+  """
+  @brief: statistics of one frame, temperature_2d[y][x] in degree C.
+    mean:      mean temperature in the stave region (whole frame if no region)
+    diff:      RMS of the difference to previous_2d, None for the first frame
+    saturated: number of pixels with ADC counts at 0 or at the maximum count
+  """
+  if region is None:
+    stave = temperature_2d
+  else:
+    x0, y0, x1, y1 = region
+    stave = temperature_2d[ y0:y1+1, x0:x1+1 ]
+
+  stats = { "mean": float( stave.mean() ), "diff": None }
+  if previous_2d is not None:
+    stats[ "diff" ] = float( numpy.sqrt( numpy.mean( ( temperature_2d - previous_2d )**2 ) ) )
+  stats[ "saturated" ] = int( numpy.count_nonzero( ( counts_2d <= 0 ) | ( counts_2d >= maxcount ) ) )
+  return stats
+
+def frame_summary(temperature_2d, region = None, previous_2d = None, shift = (0., 0.)):
+  """
+  @brief: summary of one frame, temperature_2d[y][x] in degree C.
+    full_*:   mean, min, max of the whole frame
+    roi_*:    mean, min, max and spatial RMS (standard deviation) of the
+              stave region (whole frame if no region)
+    diff_rms: RMS of the difference to previous_2d, NaN for the first frame
+    shift_x, shift_y: shift applied to register the frame, in pixels
+  """
+  if region is None:
+    stave = temperature_2d
+  else:
+    x0, y0, x1, y1 = region
+    stave = temperature_2d[ y0:y1+1, x0:x1+1 ]
+
+  summary = {
+    "full_mean": float( temperature_2d.mean() ),
+    "full_min":  float( temperature_2d.min() ),
+    "full_max":  float( temperature_2d.max() ),
+    "roi_mean":  float( stave.mean() ),
+    "roi_min":   float( stave.min() ),
+    "roi_max":   float( stave.max() ),
+    "roi_rms":   float( stave.std() ),
+    "diff_rms":  float( "nan" ),
+    "shift_x":   float( shift[1] ),
+    "shift_y":   float( shift[0] ),
+  }
+  if previous_2d is not None:
+    summary[ "diff_rms" ] = float( numpy.sqrt( numpy.mean( ( temperature_2d - previous_2d )**2 ) ) )
+  return summary
+
+def frame_seconds(time):
+  """
+  @brief: (year, month, date, hour, minute, second) to seconds since the epoch
+  """
+  year, month, date, hour, minute, second = time
+  return calendar.timegm( (int(year), int(month), int(date), int(hour), int(minute), 0) ) + float(second)
+
+class OutlierRejector:
+  """
+    Keeps a running robust baseline (median and MAD of the last accepted
+    frames) of each frame statistic. A frame is rejected if one of its
+    statistics is further than nsigma robust sigmas away from the baseline.
+    The robust sigma is never taken below a per statistic floor, so a very
+    stable recording does not reject frames for tiny fluctuations.
+
+    The first 'warmup' frames are always accepted to seed the baseline.
+
+    A transient (NUC event, occlusion) lasts a few frames. After 'relock'
+    frames rejected in a row the deviation is a persistent level change:
+    the baseline of the level statistics restarts from these frames, the
+    frame is accepted and level_changes is counted up. relock = 0 never
+    restarts. The diff of the rejected frames (and of the relocking one) is
+    measured against the last frame before the step and holds the step, so
+    the diff baseline keeps the frame to frame differences from before it.
+  """
+  _floors = {
+    "mean":      0.2,  # degree C
+    "diff":      0.1,  # degree C
+    "saturated": 10.,  # pixels
+  }
+  _two_sided = { "mean": True, "diff": False, "saturated": False }
+  _frame_to_frame = [ "diff" ]
+
+  def __init__ (self, nsigma = 5., history = 25, warmup = 5, relock = 10) :
+    self._nsigma = nsigma
+    self._history = history
+    self._warmup = warmup
+    self._relock = relock
+    self._values = dict( (stat, []) for stat in self._floors )
+    self._rejected = []
+    self._naccepted = 0
+    self.level_changes = 0
+
+  def check(self, stats):
+    """
+    @brief: return the list of reasons to reject a frame with these
+      statistics, empty if the frame is accepted. Only accepted frames
+      update the baseline, except at a level change (see relock).
+    """
+    reasons = []
+    if self._naccepted >= self._warmup:
+      for stat in self._floors:
+        val = stats.get( stat )
+        if ( val is None ) or ( len( self._values[ stat ] ) < self._warmup ):
+          continue
+        hist = numpy.array( self._values[ stat ], dtype=float )
+        median = numpy.median( hist )
+        sigma = max( 1.4826 * numpy.median( numpy.fabs( hist - median ) ), self._floors[ stat ] )
+        dev = val - median
+        if self._two_sided[ stat ]:
+          dev = abs( dev )
+        if dev > self._nsigma * sigma:
+          reasons.append( "%s=%.3f (baseline %.3f)" % (stat, val, median) )
+
+    relocked = False
+    if len( reasons ) > 0 and self._relock > 0:
+      if len( self._rejected ) + 1 < self._relock:
+        self._rejected.append( stats )
+      else:
+        #
+        # persistent level change: restart the level baselines from the
+        # frames rejected in a row, this one is accepted and added below
+        #
+        for stat in self._floors:
+          if stat in self._frame_to_frame:
+            continue
+          self._values[ stat ] = [ rej[ stat ] for rej in self._rejected if rej.get( stat ) is not None ][ -self._history: ]
+        self.level_changes = self.level_changes + 1
+        relocked = True
+        reasons = []
+
+    if len( reasons ) == 0:
+      self._rejected = []
+      self._naccepted = self._naccepted + 1
+      for stat in self._floors:
+        val = stats.get( stat )
+        if ( val is None ) or ( relocked and stat in self._frame_to_frame ):
+          continue
+        self._values[ stat ].append( val )
+        if len( self._values[ stat ] ) > self._history:
+          self._values[ stat ].pop( 0 )
+    return reasons
+
+class WindowAverager:
+  """
+    Sliding-window average of the accepted frames. The last 'window' frames
+    are kept in a ring buffer together with their sum: each new frame is
+    added to the sum once and subtracted once when it leaves the window,
+    so a window average costs O(pixels) whatever the window length.
+
+    Every 'stride' frames (once the first window is full) add() returns the
+    window average and the list of (index, time) of the frames in it.
+  """
+  def __init__ (self, window = 50, stride = 10) :
+    self._window = window
+    self._stride = max( 1, stride )
+    self._ring = None
+    self._sum = None
+    self._frames = []
+    self._nadded = 0
+
+  def add(self, temperature_2d, index, time):
+    """
+    @brief: add a frame, return (average_2d, frames) when a window is
+      complete, else None
+    """
+    if self._ring is None:
+      self._ring = numpy.zeros( (self._window,) + temperature_2d.shape, dtype=float )
+      self._sum = numpy.zeros( temperature_2d.shape, dtype=float )
+
+    slot = self._nadded % self._window
+    if self._nadded >= self._window:
+      self._sum -= self._ring[ slot ]
+      self._frames.pop( 0 )
+    self._ring[ slot ] = temperature_2d
+    self._sum += self._ring[ slot ]
+    self._frames.append( (index, time) )
+    self._nadded = self._nadded + 1
+
+    if ( self._nadded < self._window ) or ( ( self._nadded - self._window ) % self._stride != 0 ):
+      return None
+    return ( self._sum / self._window, list( self._frames ) )
+
+class DriftFitter:
+  """
+    Per pixel straight line fit T = T0 + slope * t over the frames, from
+    the running sums of t, t^2, T and t*T (two frame sized arrays). The
+    drift score of a recording is the absolute median slope of the stave
+    region in degree C per minute: a stave in thermal equilibrium has none.
+  """
+  def __init__ (self) :
+    self._n = 0
+    self._t0 = None
+    self._st = 0.
+    self._stt = 0.
+    self._sT = None
+    self._stT = None
+
+  def add(self, temperature_2d, seconds):
+    """
+    @brief: add a frame taken at seconds (any origin)
+    """
+    if self._t0 is None:
+      self._t0 = seconds
+      self._sT = numpy.zeros( temperature_2d.shape, dtype=float )
+      self._stT = numpy.zeros( temperature_2d.shape, dtype=float )
+    t = seconds - self._t0
+    self._n = self._n + 1
+    self._st += t
+    self._stt += t * t
+    self._sT += temperature_2d
+    self._stT += t * temperature_2d
+
+  def slope(self):
+    """
+    @brief: per pixel slope in degree C per minute, None if the frames do
+      not span any time
+    """
+    if self._n < 2:
+      return None
+    n = float( self._n )
+    Ctt = self._stt - self._st * self._st / n
+    if Ctt <= 0.:
+      return None
+    return 60. * ( self._stT - self._st * self._sT / n ) / Ctt
+
+  def drift_score(self, region = None):
+    """
+    @brief: absolute median slope (degree C per minute) of the region, whole
+      frame if no region. None if no slope.
+    """
+    slope_2d = self.slope()
+    if slope_2d is None:
+      return None
+    if region is not None:
+      x0, y0, x1, y1 = region
+      slope_2d = slope_2d[ y0:y1+1, x0:x1+1 ]
+    return abs( float( numpy.median( slope_2d ) ) )
+
+class TransientFitter:
+  """
+    Fits T(t) = Tinf + dT * exp( -t / tau ) for every pixel of a region.
+    Integrating dT/dt = ( Tinf - T ) / tau from the first frame gives the
+    linear model
+      T(t) = T(0) + ( Tinf / tau ) * t - ( 1 / tau ) * S(t),  S(t) = integral of T from 0 to t
+    so T is regressed on t and S (S per pixel, trapezoid rule over the
+    frames). Only the running sums of the regression are kept, the least
+    squares normal equations of all pixels are solved together at the end.
+  """
+  def __init__ (self, region = None) :
+    self._region = region
+    self._n = 0
+    self._sums = {}
+
+  def add(self, temperature_2d, seconds):
+    """
+    @brief: add a frame taken at seconds (any origin)
+    """
+    if self._region is None:
+      T = numpy.array( temperature_2d, dtype=float )
+    else:
+      x0, y0, x1, y1 = self._region
+      T = numpy.array( temperature_2d[ y0:y1+1, x0:x1+1 ], dtype=float )
+
+    if self._n == 0:
+      self._t0 = seconds
+      self._integral = numpy.zeros( T.shape, dtype=float )
+      for name in [ "S", "SS", "tS", "T", "TT", "tT", "ST" ]:
+        self._sums[ name ] = numpy.zeros( T.shape, dtype=float )
+      for name in [ "t", "tt" ]:
+        self._sums[ name ] = 0.
+    else:
+      self._integral += 0.5 * ( T + self._previous ) * ( seconds - self._t_previous )
+    t = seconds - self._t0
+    S = self._integral
+    self._n = self._n + 1
+    self._sums[ "t" ] += t
+    self._sums[ "tt" ] += t * t
+    self._sums[ "S" ] += S
+    self._sums[ "SS" ] += S * S
+    self._sums[ "tS" ] += t * S
+    self._sums[ "T" ] += T
+    self._sums[ "TT" ] += T * T
+    self._sums[ "tT" ] += t * T
+    self._sums[ "ST" ] += S * T
+    self._previous = T
+    self._t_previous = seconds
+
+  def get_entries(self):
+    return self._n
+
+  def get_region(self):
+    return self._region
+
+  def solve(self):
+    """
+    @brief: return the maps (tau, tinf, deltat, valid) of the region, tau
+      in seconds. valid is False where the fit has no decaying solution, or
+      where 1/tau is not 3 standard errors away from 0 (no transient).
+      None if less than 4 frames were added.
+    """
+    if self._n < 4:
+      return None
+    n = float( self._n )
+    s = self._sums
+    #centred sums: the intercept is eliminated, a 2x2 system is left per pixel
+    Ctt = s[ "tt" ] - s[ "t" ] * s[ "t" ] / n
+    CtS = s[ "tS" ] - s[ "t" ] * s[ "S" ] / n
+    CSS = s[ "SS" ] - s[ "S" ] * s[ "S" ] / n
+    CtT = s[ "tT" ] - s[ "t" ] * s[ "T" ] / n
+    CST = s[ "ST" ] - s[ "S" ] * s[ "T" ] / n
+    CTT = s[ "TT" ] - s[ "T" ] * s[ "T" ] / n
+    det = Ctt * CSS - CtS * CtS
+    valid = numpy.fabs( det ) > 1.e-12 * numpy.fabs( Ctt * CSS ) + 1.e-300
+    det = numpy.where( valid, det, 1. )
+    b = ( CtT * CSS - CST * CtS ) / det
+    c = ( CST * Ctt - CtT * CtS ) / det
+    a = ( s[ "T" ] - b * s[ "t" ] - c * s[ "S" ] ) / n
+    residual = numpy.maximum( CTT - b * CtT - c * CST, 0. ) / ( n - 3. )
+    c_error = numpy.sqrt( residual * Ctt / det )
+
+    valid = valid & ( c < 0. ) & numpy.isfinite( c ) & ( -c > 3. * c_error )
+    c = numpy.where( valid, c, -1. )
+    tau = numpy.where( valid, -1. / c, 0. )
+    tinf = numpy.where( valid, -b / c, s[ "T" ] / n )
+    deltat = numpy.where( valid, a - tinf, 0. )
+    return (tau, tinf, deltat, valid)
@@ -0,0 +1,193 @@
+"""
+@brief:
+  Dead, hot and noisy pixel map of an IR camera and its correction.
+
+  The map is built from the temporal statistics of every pixel over a
+  reference recording (a uniform scene: lens cap or stave-free background)
+  and cached per camera serial number in a directory of maps,
+    pixelmaps/pixelmap_SERIAL.npy
+  Later conversions with the same camera replace the bad pixels of every
+  frame by the mean of their good neighbours, so the spikes never reach the
+  Gaussian fits of frameanal.py or the Canny edges of configFinder.py.
+
+@functions:
+  median3x3( image_2d ) return image_2d
+  - 3x3 median filter (edges replicated), vectorised.
+
+  map_name( map_dir, serial ) return file name
+  - the cached map file of a camera.
+
+  load_map( map_dir, serial, shape ) return map_2d or None
+  - read the cached map of a camera, None if there is none with this shape.
+
+  save_map( map_dir, serial, map_2d )
+  - write the map of a camera to the cache.
+
+@classes:
+  PixelStatistics
+  - streaming per pixel mean and variance (Welford) of the frames, their
+    temporal noise map, and the map of bad pixels built from them.
+
+  PixelCorrector
+  - replaces the bad pixels of a frame by the mean of their good 8
+    neighbours. The neighbour indexes and weights are computed once, each
+    frame costs a gather over the bad pixels only.
+
+@email: jie.yu@cern.ch
+"""
+
+import os
+import numpy
+
+#bits of the pixel map
+STUCK = 1  # no temporal change, or no valid temperature
+HOT   = 2  # mean far from the mean of its neighbours (hot or cold)
+NOISY = 4  # temporal noise far above the one of the sensor
+
+def median3x3(image_2d):
+  """
+  @brief: 3x3 median filter, the frame edges are replicated
+  """
+  ny, nx = image_2d.shape
+  padded = numpy.pad( image_2d, 1, mode='edge' )
+  shifted = [ padded[ dy:dy+ny, dx:dx+nx ] for dy in range(3) for dx in range(3) ]
+  return numpy.median( numpy.array( shifted ), axis = 0 )
+
+def map_name(map_dir, serial):
+  """
+  @brief: cached map file name of a camera
+  """
+  return map_dir + "/pixelmap_" + str( serial ) + ".npy"
+
+def load_map(map_dir, serial, shape):
+  """
+  @brief: read the cached map of a camera, None if not found or if it was
+    built for frames of another size
+  """
+  fname = map_name( map_dir, serial )
+  if not os.path.isfile( fname ):
+    return None
+  map_2d = numpy.load( fname )
+  if map_2d.shape != tuple( shape ):
+    print ("WARNING:<PIXELMAP::LOAD_MAP> " + fname + " is made for frames of " + str(map_2d.shape) + ", not " + str(tuple(shape)) + ". Ignored.")
+    return None
+  return map_2d
+
+def save_map(map_dir, serial, map_2d):
+  """
+  @brief: write the map of a camera to the cache
+  """
+  if not os.path.isdir( map_dir ):
+    os.makedirs( map_dir )
+  numpy.save( map_name( map_dir, serial ), numpy.asarray( map_2d, dtype=numpy.uint8 ) )
+
+class PixelStatistics:
+  """
+    Per pixel running mean and variance of the frames (Welford's algorithm,
+    numerically stable in one pass). build_map() flags the pixels
+    - STUCK: temporal RMS below stuck_rms, or non finite temperature
+    - HOT:   mean further than nsigma robust sigmas from the 3x3 median of
+             the mean frame
+    - NOISY: temporal RMS further than nsigma robust sigmas above the median
+             temporal RMS
+    The robust sigmas are never taken below floor (degree C).
+  """
+  def __init__ (self, nsigma = 8., stuck_rms = 1.e-3, floor = 0.05) :
+    self._nsigma = nsigma
+    self._stuck_rms = stuck_rms
+    self._floor = floor
+    self._n = 0
+    self._mean = None
+    self._m2 = None
+
+  def add(self, temperature_2d):
+    """
+    @brief: add one frame to the statistics
+    """
+    if self._mean is None:
+      self._mean = numpy.zeros( temperature_2d.shape, dtype=float )
+      self._m2 = numpy.zeros( temperature_2d.shape, dtype=float )
+    self._n = self._n + 1
+    delta = temperature_2d - self._mean
+    self._mean += delta / self._n
+    self._m2 += delta * ( temperature_2d - self._mean )
+
+  def get_entries(self):
+    return self._n
+
+  def get_rms(self):
+    """
+    @brief: per pixel temporal RMS (noise) of the frames, None if less than
+      2 frames were added
+    """
+    if self._n < 2:
+      return None
+    return numpy.sqrt( self._m2 / ( self._n - 1 ) )
+
+  def build_map(self):
+    """
+    @brief: return the map of bad pixels (bits STUCK, HOT, NOISY), None if
+      less than 2 frames were added
+    """
+    rms = self.get_rms()
+    if rms is None:
+      return None
+    valid = numpy.isfinite( self._mean ) & numpy.isfinite( rms )
+    mean = numpy.where( valid, self._mean, numpy.median( self._mean[ valid ] ) )
+    rms = numpy.where( valid, rms, 0. )
+
+    map_2d = numpy.zeros( mean.shape, dtype=numpy.uint8 )
+    map_2d[ ( ~valid ) | ( rms < self._stuck_rms ) ] |= STUCK
+
+    residual = mean - median3x3( mean )
+    sigma = max( 1.4826 * numpy.median( numpy.fabs( residual ) ), self._floor )
+    map_2d[ numpy.fabs( residual ) > self._nsigma * sigma ] |= HOT
+
+    rms_median = numpy.median( rms )
+    sigma = max( 1.4826 * numpy.median( numpy.fabs( rms - rms_median ) ), self._floor )
+    map_2d[ rms > rms_median + self._nsigma * sigma ] |= NOISY
+    return map_2d
+
+class PixelCorrector:
+  """
+    Replaces the bad pixels (non zero in the map) of a frame by the mean of
+    their good 8 neighbours. A bad pixel without good neighbour keeps its
+    value.
+  """
+  _offsets = [ (dy, dx) for dy in (-1, 0, 1) for dx in (-1, 0, 1) if (dy, dx) != (0, 0) ]
+
+  def __init__ (self, map_2d) :
+    ny, nx = map_2d.shape
+    bad = ( map_2d != 0 )
+    iy, ix = numpy.nonzero( bad )
+    neighbours = []
+    weights = []
+    for dy, dx in self._offsets:
+      ny_idx = numpy.clip( iy + dy, 0, ny - 1 )
+      nx_idx = numpy.clip( ix + dx, 0, nx - 1 )
+      inside = ( iy + dy >= 0 ) & ( iy + dy < ny ) & ( ix + dx >= 0 ) & ( ix + dx < nx )
+      neighbours.append( ny_idx * nx + nx_idx )
+      weights.append( inside & ~bad[ ny_idx, nx_idx ] )
+    self._bad_idx = iy * nx + ix
+    self._neighbours = numpy.array( neighbours ).T
+    self._weights = numpy.array( weights, dtype=float ).T
+    self._nweights = self._weights.sum( axis = 1 )
+    fixable = ( self._nweights > 0 )
+    self._bad_idx = self._bad_idx[ fixable ]
+    self._neighbours = self._neighbours[ fixable ]
+    self._weights = self._weights[ fixable ]
+    self._nweights = self._nweights[ fixable ]
+    self._nbad = int( bad.sum() )
+
+  def get_nbad(self):
+    return self._nbad
+
+  def correct(self, temperature_2d):
+    """
+    @brief: return a copy of the frame with the bad pixels interpolated
+    """
+    corrected = numpy.array( temperature_2d, dtype=float )
+    flat = corrected.reshape( -1 )
+    if len( self._bad_idx ) > 0:
+      flat[ self._bad_idx ] = ( flat[ self._neighbours ] * self._weights ).sum( axis = 1 ) / self._nweights
+    return corrected
@@ -2,7 +2,7 @@
 
 """
 @run
-  ./share/texttoroot.py OUT_DIR NUM_INPUT_FILES [CONFIG=config] [IN_DIR=tout] [IN_NAME=frame] [IN_EXT=pgm]
+  ./share/texttoroot.py OUT_DIR NUM_INPUT_FILES [CONFIG=config] [IN_DIR=tout] [IN_NAME=frame] [IN_EXT=pgm] [options]
 
   parameters:
     OUT_DIR: output directory, necessary
@@ -12,6 +12,34 @@
     IN_NAME: input file name prefix, optional, default: frame
     IN_EXT: input file extension, optional, default: pgm
 
+  options:
+    --no-reject: keep all frames in the average, no outlier rejection
+    --frame-config FILE: config_frame with the stave region used for the
+      frame statistics, default: config_frame (whole frame if not found)
+    --average-only: only write the average frame, no per frame root files
+    --keep-every K: with --average-only, still write every K-th frame
+    --storage double|float|centi: numeric storage of the temperature,
+      default: double. See frameEncoding.py, float32 or int16 centi-degree
+      fixed point reduce the size of the files 2-3 times.
+    --roi: only store the stave region of each frame, see below
+    --roi-margin N: margin in pixels around the stave region, default: 10
+    --chunk N: number of frames per chunk, default: 100
+    --max-rss MB: memory budget in MB, default: 0 (no limit)
+    --window N: also write sliding-window averages of N frames
+    --stride S: frames between two window averages, default: 10
+    --pixel-map auto|build|off: correct the bad pixels with the cached map
+      of the camera (auto, default), build the map from this (reference)
+      recording, or no correction
+    --pixel-map-dir DIR: directory of the cached pixel maps, default: pixelmaps
+    --register: shift every frame onto the first ones before averaging
+    --register-batch N: frames per batch of shift estimates, default: 16
+    --transient: fit T(t) = Tinf + dT exp(-t/tau) for every pixel of the
+      stave region, written to OUT_DIR/transient.root (.npz for npy)
+    --drift-threshold D: largest drift in C/min of the stave region of a
+      steady-state recording, default: 0.5
+    --format root|npy|both: file format of the frames and averages,
+      default: root. npy writes NAME.npy (memory-mappable) + NAME.json
+
 @brief:
   This code converts ADC counts recorded by IR camera into temperature values
   in degree C.
@@ -49,13 +77,152 @@
 
   TTree: btree
   Frame time information and number of pixels in X and Y directions.
+  The scale and offset of the stored temperature values (tscale, toffset),
+  temperature in C = tscale * temperature + toffset.
+
+  A root file with average temperature frame is calculated and kept. Its
+  atree has one more branch, noise: the temporal RMS of each pixel over the
+  averaged frames (NETD map), accumulated in the same pass as the average.
+  frameanal.py uses noise / sqrt( nframes ) as the error of each pixel of
+  the average in the pipe fits. Besides atree and btree it contains
+  TTree: ttree
+  The time information of every converted frame, its index and whether it
+  entered the average (accepted = 1).
+
+  In --roi mode the per frame root files only contain the pixels of the
+  stave bounding box plus a margin (xpos, ypos are still the indexes in the
+  full frame, btree keeps the full frame size and the stored region in
+  roix0, roiy0, roix1, roiy1). The stave region is read from the
+  config_frame of a previous run (--frame-config), or found with a quick
+  pass over the first frames. The average frame always keeps all pixels.
+
+  The frames are converted in chunks of --chunk frames. Every frame file is
+  closed (its trees released) as soon as it is written. At the end of each
+  chunk its frame summary rows are written to frame_summary.csv/.root and
+  released, the garbage is collected and the resident memory (RSS), peak
+  RSS, frames per second and bytes written are logged, e.g.
+    INFO:<TEXTTOROOT::END_CHUNK> frames 0-99: 12.3 frames/s, 480.2 MB written, RSS 210.4 MB, peak RSS 212.0 MB
+  With --max-rss the RSS is checked before every frame; if it stays above
+  the budget after a garbage collection, no further frame is read: the
+  average, summary and logs of the frames converted so far are written and
+  the script exits with status 4.
+
+  With --window N, sliding-window averages of N accepted frames are written
+  every S frames (--stride S) to $outdir/window_00000.root, ... (.npy and
+  .json with --format npy) in the same format as the average frame, with
+  the frames of the window in ttree.
+  They are computed incrementally: a ring buffer keeps the last N frames
+  and their sum, each frame is added and subtracted once (memory: N frames).
+  Profile them all with ./frameanal.py roo/frame_average.root -w.
+
+  A summary of every converted frame is written to $outdir/frame_summary.csv
+  and to the tree stree of $outdir/frame_summary.root: index, time, time
+  elapsed since the first frame (s), mean/min/max of the full frame and of
+  the stave region, spatial RMS of the stave region, RMS difference to the
+  previous frame and whether the frame entered the average. Screening a
+  recording only needs these few kB instead of the per frame root files.
+
+  Dead, hot and noisy pixels are replaced by the mean of their good
+  neighbours in every frame, before any statistics or average, if a pixel
+  map of the camera (CameraSerial in the config file) is cached in
+  --pixel-map-dir. The map is built with --pixel-map build from the accepted
+  frames of a reference recording of a uniform scene, see share/pixelMap.py.
+
+  With --register, camera or stave jitter is removed before averaging: the
+  sub-pixel shift of every frame against the median of the first batch of
+  frames is estimated with FFT phase correlation on the stave region (plus
+  --roi-margin, and 16 tapered pixels around it so that the stave edges keep
+  their full weight), batched over --register-batch frames, and the frame is
+  shifted (bilinear) before the statistics, the averages and the per frame
+  files. The shifts are logged in the frame summary (shift_x, shift_y),
+  see share/frameRegistration.py.
+
+  With --transient, the cool-down (or warm-up) of every pixel of the stave
+  region is fitted with T(t) = Tinf + dT * exp( -t / tau ) over the frame
+  times. The fit is linearised (T is regressed on t and on its integral),
+  only running sums are kept while streaming, and all pixels are solved
+  together at the end, see TransientFitter in share/frameStats.py. The maps
+  are written to $outdir/transient.root, tree rtree: xpos, ypos, tau (s),
+  tinf, deltat (C) and valid, X by X like the average frame; btree as for
+  the average. Local changes of tau along the pipe point to a poor thermal
+  contact. Only accepted frames are used: a fast cool-down may need
+  --no-reject, since the outlier baseline lags behind it.
+
+  The steady state of the recording is checked with a per pixel straight
+  line fit of the temperature against time, from running sums updated with
+  every accepted frame. The slope map (C/min) is stored in the atree branch
+  slope of the average frame, and the drift score, the absolute median slope
+  of the stave region, in the btree branch drift with the threshold in
+  driftlimit (--drift-threshold). frameanal.py refuses to profile an average
+  drifting more than the threshold unless -id (--ignoredrift) is given.
+
+  With --format npy (or both) the frames and averages are written as NumPy
+  files instead of (besides) root files: NAME.npy with the stored values,
+  NAME.json with the btree values and NAME.noise.npy, ... with the per pixel
+  maps. The readers (frameanal.py, configFinder.py, extras) read both, the
+  npy files memory-mapped without per entry access, see frameStorage.py.
+  With --format npy no root file at all is written and ROOT is never
+  imported (see lazyRoot.py): the frame summary is only written as csv and
+  the transient maps go to $outdir/transient.npz (arrays tau, tinf, deltat,
+  valid of the region [y][x], region, nxpixel, nypixel, nframes, time).
+
+  In --average-only mode the average, btree and ttree are built in memory
+  and no per frame root file is created, except every K-th frame if
+  --keep-every K is given for spot checks.
 
-  A root file with average temperature frame is calculated and kept.
+  Outlier frames (camera auto-NUC events, occlusion, a focus hunt) are left
+  out of the average. While streaming, the mean stave region temperature,
+  the difference norm to the previous accepted frame and the number of
+  saturated pixels are compared with a running robust baseline, see
+  share/frameStats.py. The rejected frames are listed in
+  $outdir/rejected_frames.txt. Their per frame root files are still written.
+  After 10 frames rejected in a row the deviation is taken as a persistent
+  level change (a real temperature step): the baseline restarts from these
+  frames and the following ones are accepted again.
   
 @functions (class TextToRoot):
   counts_to_temperature( counts ) return temperature
   - convert ADC counts into temperature pixel by pixel
 
+  set_option( name, value )
+  - set one of the conversion options, see _options.
+
+  read_frame( fname ) return frame
+  - read one text file into a dictionary with the time, the number of pixels
+    and the 2D array of ADC counts.
+
+  keep_frame( outidx ) return True/False
+  - whether the root file of frame outidx is written.
+
+  probe_region( temperature_2d ) return (X0, Y0, X1, Y1)
+  - stave region plus margin found from a temperature frame, for --roi.
+
+  write_frame( strBaseName, frame, temperature_2d, outidx, region = None ) return bytes
+  - write one frame (or only its region) into a root file with atree and btree.
+
+  read_frames( chunk, n_inputs, indir, inname, inext ) / register_frames( frames )
+  - generators of the converted (and registered) frames of the recording.
+
+  register_batch( batch, registration )
+  - estimate the shifts of a batch of frames and shift them.
+
+  write_average( strBaseName, temperature_2d, ftime, frame_times, maps, info ) return bytes
+  - write an average frame (global or window) with atree, btree and ttree.
+
+  write_pixel_map( pixel_stats )
+  - build the bad pixel map and cache it for the camera serial number.
+
+  write_transient( strBaseName, fitter, nxpixel, nypixel, ftime )
+  - solve the per pixel transient fits and write the tau and Tinf maps
+    to strBaseName.root and/or strBaseName.npz.
+
+  open_summary( fname ) / write_summary( summary ) / close_summary( )
+  - write the per frame summary as fname.csv and fname.root (stree, not
+    for --format npy), chunk by chunk.
+
+  check_memory( ) return bool / end_chunk( chunk, lastidx )
+  - memory budget check before each frame, flush and log of a chunk.
+
   convert(outdir, n_inputs, indir = "tout", inname = "frame", inext = "pmg")
   - set the output directory and the number of input text files
   - convert each text file (representing one frame) into a root file.
@@ -83,13 +250,21 @@
 @email: jie.yu@cern.ch
 """
 
-import ROOT
 import sys
 import os
 import numpy
 import math
 import resource
 import gc
+import time
+
+sys.path.insert( 1, os.path.join( os.path.dirname( os.path.abspath( __file__ ) ), os.pardir ) )
+import frameEncoding as fe
+import frameStorage as fs
+from lazyRoot import ROOT # imported on first use, not needed for --format npy
+from frameRegistration import FrameRegistration, shift_frame
+from pixelMap import PixelStatistics, PixelCorrector, load_map, save_map, map_name
+from frameStats import read_stave_region, find_stave_region, expand_region, frame_statistics, frame_summary, frame_seconds, SUMMARY_COLUMNS, OutlierRejector, WindowAverager, DriftFitter, TransientFitter
 
 class TextToRoot:
   """
@@ -97,8 +272,35 @@ class TextToRoot:
   """
   _parameters = { "R1": 0., "R2": 0., "B": 0., "O": 0., "F": 0., "Emissivity": 0.79, "ReflTemp": 22., "AtomTemp": 22., "Transmissivity": 1.}
   #Emissivity of the stave is 0.9, pipefoam is 0.79
+
+  _options = {
+    "RejectOutliers": True,           # leave outlier frames out of the average
+    "RejectNSigma":   5.,             # robust sigmas away from the running baseline to reject
+    "FrameConfig":    "config_frame", # stave region for the frame statistics
+    "AverageOnly":    False,          # do not write the per frame root files
+    "KeepEvery":      0,              # in AverageOnly mode, still write every k-th frame
+    "Storage":        "double",       # numeric encoding of the temperature, see frameEncoding.py
+    "RoiMode":        False,          # only store the stave region of each frame
+    "RoiMargin":      10,             # margin in pixels around the stave region
+    "RoiProbeFrames": 10,             # frames averaged to find the stave region without config_frame
+    "ChunkFrames":    100,            # frames per chunk: memory check, garbage collection and logging
+    "MaxRSS":         0.,             # memory budget in MB, 0: no limit
+    "Window":         0,              # frames per sliding-window average, 0: no window averages
+    "WindowStride":   10,             # frames between two window averages
+    "PixelMap":       "auto",         # auto: correct with the cached map, build: build the map, off
+    "PixelMapDir":    "pixelmaps",    # directory of the cached pixel maps
+    "PixelMapNSigma": 8.,             # threshold of the bad pixels in robust sigmas
+    "Register":       False,          # register the frames on the first ones before averaging
+    "Transient":      False,          # fit the per pixel exponential approach over the frames
+    "DriftThreshold": 0.5,            # largest stave drift (C/min) of a steady-state recording
+    "Format":         "root",         # root, npy or both, see frameStorage.py
+    "RegisterBatch":  16,             # frames per batch of FFT shift estimates
+  }
   def __init__ (self, cfg_name = "config") :
     self._status = 0
+    self._summary = None
+    self._options = dict( TextToRoot._options )
+    self._serial = "unknown"
     if not os.path.isfile( cfg_name ):
       print ("ERROR:<TEXTTOROOT::__INIT__> config file " + cfg_name + " not found. Status = 1. ")
       _status = 1;
@@ -109,6 +311,9 @@ class TextToRoot:
         print ("ERROR:<TEXTTOROOT::__INIT__> config items expected to be: Item Value. Not the correct style: " + line + ". Status = 2.")
         _status = 2
       item = item_val[0] 
+      if ( item == "CameraSerial" ):
+        self._serial = item_val[1]
+        continue
       value = float( item_val[1] )
       self._parameters[ item ] = value
     print ("INFO:<TEXTTOROOT::__INIT__> the list of the parameters below: ")
@@ -128,10 +333,18 @@ class TextToRoot:
   def get_status(self) :
     return self._status
 
+  def set_option(self, name, value) :
+    if not name in self._options:
+      print ("ERROR:<TEXTTOROOT::SET_OPTION> unknown option " + name + ". Ignored.")
+      return
+    self._options[ name ] = value
+    print ("INFO:<TEXTTOROOT::SET_OPTION> " + name + " = " + str( value ) )
+
   def counts_to_temperature(self, raw_counts ):
     """
     @brief: converting DC counts received by each pixel of the IR camera,
        which represents energy (heat), to temperature in degree C.
+       raw_counts can be a single value or a numpy array of counts.
     """
     if (self._status > 0):
       return -999.
@@ -141,10 +354,187 @@ class TextToRoot:
     RawObj_numerator   = ( raw_counts - self._parameters["Transmissivity"] * (1 - self._parameters["Emissivity"]) * RawAtom - (1 - self._parameters["Transmissivity"]) * RawRefl ) 
     RawObj_denominator = ( self._parameters["Emissivity"] * self._parameters["Transmissivity"]);
     RawObj = RawObj_numerator / RawObj_denominator
-    TinC = self._parameters["B"] / math.log ( self._parameters["R1"] / ( self._parameters["R2"] * ( RawObj + self._parameters["O"] ) ) + self._parameters["F"] ) - 273.15;
+    TinC = self._parameters["B"] / numpy.log ( self._parameters["R1"] / ( self._parameters["R2"] * ( RawObj + self._parameters["O"] ) ) + self._parameters["F"] ) - 273.15;
   
     return TinC;
 
+  def read_frame(self, fname):
+    """
+    @brief: read one text file (one frame), return a dictionary with
+        time: (year, month, date, hour, minute, second)
+        nxpixel, nypixel: number of pixels in X and Y
+        maxcount: maximum ADC count of the camera
+        counts: 2D numpy array of ADC counts [row][x] in the order of the file,
+          i.e. row 0 is the top of the image.
+      or None if the file is not in the expected format.
+    """
+    #
+    # Text file content example:
+    #
+    # Time 2017:08:28 13:22:56.744
+    # P2
+    # 640 480
+    # 65535
+    # 13432 13431 13436 13461 13433 
+    #
+    f = open( fname, 'r')
+    header = []
+    while len( header ) < 4:
+      line = f.readline()
+      if not line:
+        break
+      content = line.split()
+      if ( len(content) <= 0 ):
+        print ("WARNING:<TEXTTOROOT::READ_FRAME> file " + fname + " has an empty line! Continue. ")
+        continue
+      header.append( content )
+    body = f.read()
+    f.close()
+
+    if len( header ) < 4:
+      print ("ERROR:<TEXTTOROOT::READ_FRAME> file " + fname + " header incomplete. Check! ")
+      return None
+
+    content = header[0]
+    if ( content[0] != "Time" ) or ( len(content) < 3 ):
+      print ("ERROR:<TEXTTOROOT::READ_FRAME> first line does not start with Time. Check! ")
+      return None
+    str_ymd = content[1].split(':');
+    if ( len(str_ymd) < 3 ):
+      print ("ERROR:<TEXTTOROOT::READ_FRAME> year,month,date not all found. Check! ")
+      return None
+    str_hms = content[2].split(':');
+    if ( len(str_hms) < 3 ):
+      print ("ERROR:<TEXTTOROOT::READ_FRAME> hour,minute,date not all found. Check! ")
+      return None
+
+    if ( len(header[2]) < 2 ):
+      print ("ERROR:<TEXTTOROOT::READ_FRAME> number of X and Y pixels not found. Check! ")
+      return None
+    nxpixel = int( header[2][0] )
+    nypixel = int( header[2][1] )
+
+    counts = numpy.fromstring( body, dtype=numpy.int64, sep=' ' )
+    if ( counts.size != nxpixel * nypixel ):
+      print ("ERROR:<TEXTTOROOT::READ_FRAME> file " + fname + " has " + str(counts.size) + " pixels, expected " + str(nxpixel * nypixel) + ". Check! ")
+      return None
+
+    frame = {
+      "time": ( int(str_ymd[0]), int(str_ymd[1]), int(str_ymd[2]), int(str_hms[0]), int(str_hms[1]), float(str_hms[2]) ),
+      "nxpixel": nxpixel,
+      "nypixel": nypixel,
+      "maxcount": int( header[3][0] ),
+      "counts": counts.reshape( nypixel, nxpixel ),
+    }
+    return frame
+
+  def read_frames(self, chunk, n_inputs, indir, inname, inext):
+    """
+    @brief: generator of the frames of the recording, yields
+      (outidx, fname, frame, temperature_2d) with temperature_2d[ypos][xpos]
+      in degree C, bad pixels corrected. The chunk dictionary is updated
+      with the frames read and closed every ChunkFrames frames. The frames
+      stop early if the memory budget is exceeded (status 4).
+    """
+    corrector = None
+    shape = None
+    for outidx in range(n_inputs):
+      if ( chunk[ "frames" ] >= int( self._options[ "ChunkFrames" ] ) ):
+        self.end_chunk( chunk, outidx - 1 )
+        chunk.update( { "first": outidx, "frames": 0, "bytes": 0, "start": time.time() } )
+      if not self.check_memory():
+        print ("WARNING:<TEXTTOROOT::CONVERT> conversion stopped before frame " + str(outidx) + " by the memory budget, the frames converted so far are written.")
+        self._status = 4
+        break
+      chunk[ "frames" ] = chunk[ "frames" ] + 1
+      chunk[ "last" ] = outidx
+
+      fname = indir + "/" + inname + "_" + str(outidx) + "." + inext
+      if not os.path.isfile( fname ):
+        print ("ERROR:<TEXTTOROOT::CONVERT> file name " + fname + " is incorrect. ")
+        continue;
+      else:
+        print ("INFO:<TEXTTOROOT::CONVERT> converting " + fname + " to root file. ")
+
+      frame = self.read_frame( fname )
+      if frame is None:
+        continue
+
+      #
+      # note the Y axis pixel index is reverted top <--> bottom, so that
+      # temperature_2d[ypos][xpos] is indexed as stored in the root file
+      #
+      temperature_2d = self.counts_to_temperature( frame[ "counts" ] )[::-1]
+
+      if ( shape is None ):
+        shape = temperature_2d.shape
+        print ("INFO:<TEXTTOROOT::CONVERT> NXPIX " +str(frame[ "nxpixel" ]) + " NYPIX " + str(frame[ "nypixel" ]) )
+        print ( "INFO:<TEXTTOROOT::CONVERT> ix: 0 iy: " + str(frame[ "nypixel" ] - 1) + " count: " + str(frame[ "counts" ][0][0]) + " T: " + str(temperature_2d[-1][0]) )
+        if ( self._options[ "PixelMap" ] == "auto" ):
+          map_2d = load_map( self._options[ "PixelMapDir" ], self._serial, shape )
+          if map_2d is None:
+            print ("INFO:<TEXTTOROOT::CONVERT> no pixel map of camera " + self._serial + ", bad pixels are not corrected.")
+          else:
+            corrector = PixelCorrector( map_2d )
+            print ("INFO:<TEXTTOROOT::CONVERT> " + str(corrector.get_nbad()) + " bad pixels corrected with " + map_name( self._options[ "PixelMapDir" ], self._serial ) )
+      elif ( temperature_2d.shape != shape ):
+        print ("ERROR:<TEXTTOROOT::CONVERT> file " + fname + " has a different number of pixels. Skipped! ")
+        continue
+      if corrector is not None:
+        temperature_2d = corrector.correct( temperature_2d )
+
+      yield (outidx, fname, frame, temperature_2d)
+
+  def register_frames(self, frames):
+    """
+    @brief: generator registering the frames of read_frames() in batches of
+      RegisterBatch frames, yields the same tuples with the shifted frames
+    """
+    registration = None
+    batch = []
+    for item in frames:
+      batch.append( item )
+      if ( len( batch ) < int( self._options[ "RegisterBatch" ] ) ):
+        continue
+      registration = self.register_batch( batch, registration )
+      for item in batch:
+        yield item
+      batch = []
+    if ( len( batch ) > 0 ):
+      registration = self.register_batch( batch, registration )
+      for item in batch:
+        yield item
+
+  def register_batch(self, batch, registration = None):
+    """
+    @brief: estimate the shifts of a batch of frames with one batched FFT
+      and replace the frames by the shifted ones (in place). The reference
+      is the median of the first batch, registered on the stave region plus
+      the margin (config_frame, else found on the reference).
+    """
+    stack = numpy.array( [ item[3] for item in batch ] )
+    if registration is None:
+      reference_2d = numpy.median( stack, axis = 0 )
+      nypix, nxpix = reference_2d.shape
+      region = read_stave_region( self._options[ "FrameConfig" ], nxpix, nypix )
+      if region is None:
+        region = find_stave_region( reference_2d )
+      if region is None:
+        print ("WARNING:<TEXTTOROOT::REGISTER_BATCH> no stave region found, register on the full frames.")
+      else:
+        region = expand_region( region, int( self._options[ "RoiMargin" ] ), nxpix, nypix )
+        print ("INFO:<TEXTTOROOT::REGISTER_BATCH> register frames on the region " + str(region) )
+      registration = FrameRegistration( reference_2d, region )
+
+    dy, dx = registration.estimate( stack )
+    for i in range( len( batch ) ):
+      outidx, fname, frame, temperature_2d = batch[i]
+      frame[ "shift" ] = ( float( dy[i] ), float( dx[i] ) )
+      batch[i] = ( outidx, fname, frame, shift_frame( temperature_2d, dy[i], dx[i] ) )
+    print ("INFO:<TEXTTOROOT::REGISTER_BATCH> frames %d-%d: largest shift %.2f pixels in Y, %.2f pixels in X" %
+      (batch[0][0], batch[-1][0], numpy.fabs( dy ).max(), numpy.fabs( dx ).max()) )
+    return registration
+
   def convert(self, outdir, n_inputs, indir = "tout", inname = "frame", inext = "pmg"):
     """
     """
@@ -157,263 +547,625 @@ class TextToRoot:
     #   using 1st frame information of time
     #   using average temperature
     #
+    strBaseName_avg = outdir + "/" + inname + "_average"
+    avg_time = None
 
     #
-    # creating 1D arrays to keep the data!!
+    # outlier rejection: running baseline of the frame statistics, the stave
+    # region is taken from the config_frame of a previous run if available
     #
-    avg_nxpixel = numpy.zeros(1, dtype=int)
-    avg_nypixel = numpy.zeros(1, dtype=int)
-    avg_year = numpy.zeros(1, dtype=int)
-    avg_month = numpy.zeros(1, dtype=int)
-    avg_date = numpy.zeros(1, dtype=int)
-    avg_hour = numpy.zeros(1, dtype=int)
-    avg_minute = numpy.zeros(1, dtype=int)
-    avg_second = numpy.zeros(1, dtype=float)
-  
-    avg_temperature = numpy.zeros(1, dtype=float)
-    avg_xpos  = numpy.zeros(1, dtype=int)
-    avg_ypos  = numpy.zeros(1, dtype=int)
-   
-    strRooName_avg = outdir + "/" + inname + "_average.root" 
-    f_roo_avg = ROOT.TFile( strRooName_avg, "recreate")
-  
-    avg_atree = ROOT.TTree("atree", "a tree of temperature data");
-    avg_atree.Branch('temperature', avg_temperature, 'temperature/D')
-    avg_atree.Branch('xpos', avg_xpos, 'xpos/I')
-    avg_atree.Branch('ypos', avg_ypos, 'ypos/I')
-  
-    avg_btree = ROOT.TTree("btree", "a tree of camera information");
-    avg_btree.Branch('nxpixel', avg_nxpixel, 'nxpixel/I')
-    avg_btree.Branch('nypixel', avg_nypixel, 'nypixel/I')
-    avg_btree.Branch('year', avg_year, 'year/I')
-    avg_btree.Branch('month', avg_month, 'month/I')
-    avg_btree.Branch('date', avg_date, 'date/I')
-    avg_btree.Branch('hour', avg_hour, 'hour/I')
-    avg_btree.Branch('minute', avg_minute, 'minute/I')
-    avg_btree.Branch('second', avg_second, 'second/D') 
-
-    #Things that didn't need to be in the loop
-    temperature = numpy.zeros(1, dtype=float)
-    xpos  = numpy.zeros(1, dtype=int)
-    ypos  = numpy.zeros(1, dtype=int)
-    index  = numpy.zeros(1, dtype=int)
-    nxpixel = numpy.zeros(1, dtype=int)
-    nypixel = numpy.zeros(1, dtype=int)
-    year = numpy.zeros(1, dtype=int)
-    month = numpy.zeros(1, dtype=int)
-    date = numpy.zeros(1, dtype=int)
-    hour = numpy.zeros(1, dtype=int)
-    minute = numpy.zeros(1, dtype=int)
-    second = numpy.zeros(1, dtype=float)
+    #
+    # per pixel temporal statistics of the accepted frames: noise map of the
+    # average, and the bad pixel map with --pixel-map build
+    #
+    pixel_stats = PixelStatistics( self._options[ "PixelMapNSigma" ] )
 
+    rejector = None
+    if self._options[ "RejectOutliers" ]:
+      rejector = OutlierRejector( self._options[ "RejectNSigma" ] )
+    stave_region = None
+    roi = None
+    pending = []
+    rejected = []
+    frame_times = []
+    summary = []
+    last_2d = None
+    previous_2d = None
+    avg_temperature_2d = None
+    n_averaged = 0
 
-    for outidx in range(n_inputs):
-      #print 'Memory usage BOL: %s (MB)' % str(float(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)/1048576)
-      fname = indir + "/" + inname + "_" + str(outidx) + "." + inext
-      if not os.path.isfile( fname ):
-        print ("ERROR:<TEXTTOROOT::CONVERT> file name " + fname + " is incorrect. ")
-        continue;
-      else:
-        print ("INFO:<TEXTTOROOT::CONVERT> converting " + fname + " to root file. ")
- 
-      outnum = str(outidx)
-      if outidx < 10:
-        outnum = "0000" + outnum
-      elif outidx < 100:
-        outnum = "000" + outnum
-      elif outidx < 1000:
-        outnum = "00" + outnum
-      elif outidx < 10000:
-        outnum = "0" + outnum
-       
-      strRooName = outdir + "/" + inname + "_" + outnum + ".root" 
-      f_roo = ROOT.TFile( strRooName, "recreate")
- 
-      atree = ROOT.TTree("atree", "a tree of temperature data");
-      atree.Branch('temperature', temperature, 'temperature/D')
-      atree.Branch('xpos', xpos, 'xpos/I')
-      atree.Branch('ypos', ypos, 'ypos/I')
-  
-      btree = ROOT.TTree("btree", "a tree of camera information");
-      btree.Branch('index', index, 'index/I')
-      btree.Branch('nxpixel', nxpixel, 'nxpixel/I')
-      btree.Branch('nypixel', nypixel, 'nypixel/I')
-      btree.Branch('index', index, 'index/I')
-      btree.Branch('year', year, 'year/I')
-      btree.Branch('month', month, 'month/I')
-      btree.Branch('date', date, 'date/I')
-      btree.Branch('hour', hour, 'hour/I')
-      btree.Branch('minute', minute, 'minute/I')
-      btree.Branch('second', second, 'second/D')
-  
-      f = open( fname, 'r')
-      il = -1  # ith line
-      ipix = 0 # ith pixel
-      nempty_line = 0 # numbers of empty lines (shouldn't be any.)
-     
-      for line in f:
-        il = il + 1
-  
-        content = line.split()
-        if ( len(content) <= 0 ):
-          print ("WARNING:<TEXTTOROOT::CONVERT> file " + fname + " has an empty line! Continue. ")
-          nempty_line = nempty_line + 1
-          continue
-        if ( nempty_line >= 10 ):
-          print ("ERROR:<TEXTTOROOT::CONVERT> file " + fname + " finds >=10 empty lines! Break. ")
-          break
-  
+    #
+    # sliding-window averages of the accepted frames
+    #
+    windows = None
+    n_windows = 0
+    transient = None
+    drift = DriftFitter()
+    if ( int( self._options[ "Window" ] ) > 0 ):
+      windows = WindowAverager( int( self._options[ "Window" ] ), int( self._options[ "WindowStride" ] ) )
+
+    self.open_summary( outdir + "/frame_summary" )
+    chunk = { "first": 0, "last": -1, "frames": 0, "bytes": 0, "start": time.time(), "summary": summary }
+    frames = self.read_frames( chunk, n_inputs, indir, inname, inext )
+    if self._options[ "Register" ]:
+      frames = self.register_frames( frames )
+    for outidx, fname, frame, temperature_2d in frames:
+      if ( avg_temperature_2d is None ):
         #
-        # Text file content example:
+        # Initialize the values with 0 for the average frame when reading the first frame
         #
-        # Time 2017:08:28 13:22:56.744
-        # P2
-        # 640 480
-        # 65535
-        # 13432 13431 13436 13461 13433 
+        avg_temperature_2d = numpy.zeros( (frame[ "nypixel" ], frame[ "nxpixel" ]), dtype=float )
+        stave_region = read_stave_region( self._options[ "FrameConfig" ], frame[ "nxpixel" ], frame[ "nypixel" ] )
+        if stave_region is None:
+          print ("INFO:<TEXTTOROOT::CONVERT> no stave region found, frame statistics use the whole frame.")
+        else:
+          print ("INFO:<TEXTTOROOT::CONVERT> stave region for frame statistics: " + str(stave_region) )
+          if self._options[ "RoiMode" ]:
+            roi = expand_region( stave_region, int( self._options[ "RoiMargin" ] ), frame[ "nxpixel" ], frame[ "nypixel" ] )
+            print ("INFO:<TEXTTOROOT::CONVERT> region stored per frame: " + str(roi) )
+        if self._options[ "Transient" ]:
+          transient = TransientFitter( stave_region )
+
         #
-  
-        if ( il == 0 ): 
-          if ( content[0] != "Time" ):
-            print ("ERROR:<TEXTTOROOT::CONVERT> first line does not start with Time. Check! ")
-            break
-          str_ymd = content[1].split(':');
-          if ( len(str_ymd) < 3 ):
-            print ("ERROR:<TEXTTOROOT::CONVERT> year,month,date not all found. Check! ")
-            break
-
-          #
-          # since it year itself is an array, so use year[0] to get its value
-          #
-          year[0] = int(str_ymd[0])
-          month[0] = int(str_ymd[1]) 
-          date[0] = int(str_ymd[2])
-  
-          str_hms = content[2].split(':');
-          if ( len(str_hms) < 3 ):
-            print ("ERROR:<TEXTTOROOT::CONVERT> hour,minute,date not all found. Check! ")
-            break
-          hour[0] = int(str_hms[0])
-          minute[0] = int(str_hms[1]) 
-          second[0] = float(str_hms[2])
-        elif ( il == 1 ) or ( il == 3 ):  
+        # keep the first frame time information for the average one!
+        #
+        avg_time = frame[ "time" ]
+
+      #
+      # decide whether the frame enters the average
+      #
+      reasons = []
+      if rejector is not None:
+        stats = frame_statistics( temperature_2d, frame[ "counts" ], frame[ "maxcount" ], stave_region, previous_2d )
+        n_changes = rejector.level_changes
+        reasons = rejector.check( stats )
+        if rejector.level_changes > n_changes:
+          print ("WARNING:<TEXTTOROOT::CONVERT> frame " + str(outidx) + ": persistent level change, the outlier baseline restarts from the frames rejected before it")
+      if len( reasons ) == 0:
+        avg_temperature_2d += temperature_2d
+        n_averaged = n_averaged + 1
+        pixel_stats.add( temperature_2d )
+        drift.add( temperature_2d, frame_seconds( frame[ "time" ] ) )
+        if transient is not None:
+          transient.add( temperature_2d, frame_seconds( frame[ "time" ] ) )
+        previous_2d = temperature_2d
+        if windows is not None:
+          window = windows.add( temperature_2d, outidx, frame[ "time" ] )
+          if window is not None:
+            window_2d, window_frames = window
+            strBaseName_win = outdir + "/window_" + ( "%05d" % n_windows )
+            self.write_average( strBaseName_win, window_2d, window_frames[0][1], [ (idx, ftime, True) for idx, ftime in window_frames ] )
+            n_windows = n_windows + 1
+      else:
+        print ("WARNING:<TEXTTOROOT::CONVERT> frame " + str(outidx) + " left out of the average: " + ", ".join( reasons ) )
+        rejected.append( (outidx, fname, reasons) )
+      frame_times.append( (outidx, frame[ "time" ], len( reasons ) == 0) )
+      summary.append( (outidx, frame[ "time" ], len( reasons ) == 0, frame_summary( temperature_2d, stave_region, last_2d, frame.get( "shift", (0., 0.) ) )) )
+      last_2d = temperature_2d
+
+      if not self.keep_frame( outidx ):
+        continue
+ 
+      strBaseName = outdir + "/" + inname + "_" + ( "%05d" % outidx )
+
+      #
+      # in ROI mode without a config_frame, keep the first frames in memory
+      # until the stave region is found from their average
+      #
+      pending.append( (strBaseName, frame, temperature_2d, outidx) )
+      if self._options[ "RoiMode" ] and ( roi is None ):
+        if ( n_averaged < self._options[ "RoiProbeFrames" ] ):
           continue
-        elif ( il == 2 ):
-          if ( len(content) < 2 ):
-            print ("ERROR:<TEXTTOROOT::CONVERT> number of X and Y pixels not found. Check! ")
-            break
-          nxpixel[0] = int( content[0] )
-          nypixel[0] = int( content[1] )
-          if ( outidx == 0 ):
-            print ("INFO:<TEXTTOROOT::CONVERT> NXPIX " +str(nxpixel[0]) + " NYPIX " + str(nypixel[0]) )
-          btree.Fill()
-  
-          #
-          # Initialize the values with 0 for the average frame when reading the first frame
-          #
-          if ( outidx == 0 ):
-            avg_temperature_2d = [[ 0. for x in range( nxpixel[0] )] for y in range( nypixel[0] )]
-  
-          #
-          # keep the first frame time information for the average one!
-          #
-          
-            avg_nxpixel[0] = nxpixel[0]
-            avg_nypixel[0] = nypixel[0]
-            avg_year[0] = year[0]
-            avg_month[0] = month[0]
-            avg_date[0] = date[0]
-            avg_hour[0] = hour[0]
-            avg_minute[0] = minute[0]
-            avg_second[0] = second[0]
-        else: 
-          #
-          # content is a list of raw counts
-          #----------------------------MEMORY LEAK BELOW
-          
-          for str_count in content: 
-
-            xpos[0] = int ( ipix % nxpixel[0] )
-
-            #
-            # note the Y axis pixel index is reverted top <--> bottom
-            #
-            ypos[0] = nypixel[0] - int ( ipix / nxpixel[0] ) - 1
-            counts = int( str_count )
-            temperature[0] = self.counts_to_temperature( counts )
-            if (ipix == 0) and (outidx == 0 ):
-              print ( "INFO:<TEXTTOROOT::CONVERT> ix: " + str(xpos[0]) + " iy: " +str(ypos[0]) + " count: " + str(counts) + " T: " + str(temperature[0]) )
-
-            avg_temperature_2d[ypos[0]][xpos[0]] += temperature[0] / n_inputs
-  
-            ipix = ipix + 1
-            atree.Fill()
-          #----------------------------MEMORY LEAK ABOVE
-          # end of one line
-          # ---------------
-
-        # check the line number
-        # ---------------
-     
-      # end of all lines
-      # ----------------
-      #print 'Memory usage B4C: %s (MB)' % str(float(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)/1048576)
-
-      f.close()
-      f_roo.Write()
-      #print(f_roo.GetSize())
-      
-      #print (str(atree.GetTotBytes()/1048576)) 
-      #print 'Memory usage EOL: %s (MB)' % str(float(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)/1048576)
-      
+        roi = self.probe_region( avg_temperature_2d / n_averaged )
+      for args in pending:
+        chunk[ "bytes" ] += self.write_frame( *args, region = roi )
+      pending = []
+
+    if ( n_averaged <= 0 ):
+      self.write_summary( summary )
+      self.close_summary()
+      print ("ERROR:<TEXTTOROOT::CONVERT> no frame converted, no average frame written! ")
+      return
+
+    if ( len( pending ) > 0 ):
+      if roi is None:
+        roi = self.probe_region( avg_temperature_2d / n_averaged )
+      for args in pending:
+        chunk[ "bytes" ] += self.write_frame( *args, region = roi )
+      pending = []
+    self.end_chunk( chunk, chunk[ "last" ] )
+    self.close_summary()
+
+    self.write_rejected( outdir + "/rejected_frames.txt", rejected )
+    print ("INFO:<TEXTTOROOT::CONVERT> " + str(n_averaged) + " frames averaged, " + str(len(rejected)) + " rejected.")
+
+    if ( self._options[ "PixelMap" ] == "build" ):
+      self.write_pixel_map( pixel_stats )
+
+    if transient is not None:
+      if ( len( rejected ) > 0.1 * ( n_averaged + len( rejected ) ) ):
+        print ("WARNING:<TEXTTOROOT::CONVERT> " + str(len(rejected)) + " frames rejected, missing in the transient fit. Consider --no-reject for a fast transient.")
+      self.write_transient( outdir + "/transient", transient, avg_temperature_2d.shape[1], avg_temperature_2d.shape[0], avg_time )
+
+    if windows is not None:
+      strWinNames = [ outdir + "/window_NNNNN" + fs.EXTENSIONS[ strFormat ] for strFormat in fs.GetFormats( self._options[ "Format" ] ) ]
+      print ("INFO:<TEXTTOROOT::CONVERT> " + str(n_windows) + " window averages written to " + " and ".join( strWinNames ) )
+
     #
     # now deal with the average
     #
-    avg_btree.Fill();
-    for x in range( avg_nxpixel[0] ):
-      for y in range( avg_nypixel[0] ):
-        avg_xpos[0] = x
-        avg_ypos[0] = y
-        avg_temperature[0] = avg_temperature_2d[ y ][ x ]
-        avg_atree.Fill()
-    f_roo_avg.Write()
-    f_roo_avg.Close()
-    #print 'Memory usage Fin: %s (MB)' % str(float(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)/1048576)
+    avg_temperature_2d /= n_averaged
+    drift_info = {}
+    drift_score = drift.drift_score( stave_region )
+    if drift_score is not None:
+      drift_info = { "drift": drift_score, "driftlimit": float( self._options[ "DriftThreshold" ] ) }
+      if ( drift_score > self._options[ "DriftThreshold" ] ):
+        print ("WARNING:<TEXTTOROOT::CONVERT> stave drift %.3f C/min above %.3f C/min, the recording is not in steady state!" % (drift_score, self._options[ "DriftThreshold" ]) )
+      else:
+        print ("INFO:<TEXTTOROOT::CONVERT> stave drift %.3f C/min, below %.3f C/min." % (drift_score, self._options[ "DriftThreshold" ]) )
+    avg_bytes = self.write_average( strBaseName_avg, avg_temperature_2d, avg_time, frame_times, { "noise": pixel_stats.get_rms(), "slope": drift.slope() }, drift_info )
+    print ("INFO:<TEXTTOROOT::CONVERT> average frame written, %.1f MB, peak RSS %.1f MB" % (avg_bytes / 1048576., peak_rss_mb()) )
+
+  def write_average(self, strBaseName, temperature_2d, ftime, frame_times, maps = None, info = None):
+    """
+    @brief: write an average frame, temperature_2d[ypos][xpos], to
+      strBaseName.root (and/or .npy, see --format) with atree, btree (time
+      of the first frame, number of frames averaged) and ttree (index, time
+      and accepted flag of the frames). Returns the bytes written.
+      The pixels of an average are stored X by X: entry = xpos * NYPIXEL + ypos.
+      maps: optional per pixel maps, name: map_2d, stored as float atree
+        branches (noise: temporal RMS in C, slope: drift in C/min)
+      info: optional recording values, name: value, stored as double btree
+        branches (drift, driftlimit in C/min)
+    """
+    t_leaf, t_dtype, pos_leaf, pos_dtype, tscale, toffset = fe.GetEncoding( self._options[ "Storage" ] )
+    nypix, nxpix = temperature_2d.shape
+    nframes = len( [ 1 for f_time in frame_times if f_time[2] ] )
+
+    b_info = [ ('nxpixel', nxpix, 'I'), ('nypixel', nypix, 'I') ]
+    b_info += [ (name, val, 'I') for name, val in zip( ['year', 'month', 'date', 'hour', 'minute'], ftime[:5] ) ]
+    b_info += [ ('second', ftime[5], 'D'), ('tscale', tscale, 'D'), ('toffset', toffset, 'D'), ('nframes', nframes, 'I') ]
+    b_info += [ (name, ( info or {} )[ name ], 'D') for name in sorted( info or {} ) ]
+
+    record = {
+      "values":   fe.Encode( temperature_2d, self._options[ "Storage" ] ),
+      "region":   (0, 0, nxpix - 1, nypix - 1),
+      "nxpixel":  nxpix,
+      "nypixel":  nypix,
+      "encoding": self._options[ "Storage" ],
+      "order":    "average",
+      "info":     b_info,
+      "maps":     dict( (name, map_2d) for name, map_2d in ( maps or {} ).items() if map_2d is not None ),
+      "frames":   frame_times,
+    }
+    return fs.WriteFrame( strBaseName, record, fs.GetFormats( self._options[ "Format" ] ) )
+
+  def check_memory(self):
+    """
+    @brief: whether the resident memory is within the budget (MaxRSS in MB),
+      checked again after a garbage collection
+    """
+    max_rss = float( self._options[ "MaxRSS" ] )
+    if ( max_rss <= 0. ) or ( current_rss_mb() <= max_rss ):
+      return True
+    gc.collect()
+    rss = current_rss_mb()
+    if ( rss > max_rss ):
+      print ("ERROR:<TEXTTOROOT::CHECK_MEMORY> RSS %.1f MB above the budget of %.1f MB. Stop!" % (rss, max_rss) )
+      return False
+    return True
+
+  def end_chunk(self, chunk, lastidx):
+    """
+    @brief: end a chunk of frames: write its summary rows (released from
+      memory), collect the garbage and log its frames per second, bytes
+      written and memory usage
+    """
+    self.write_summary( chunk[ "summary" ] )
+    del chunk[ "summary" ][:]
+    gc.collect()
+    dtime = max( time.time() - chunk[ "start" ], 1.e-6 )
+    print ("INFO:<TEXTTOROOT::END_CHUNK> frames %d-%d: %.1f frames/s, %.1f MB written, RSS %.1f MB, peak RSS %.1f MB" %
+      (chunk[ "first" ], lastidx, chunk[ "frames" ] / dtime, chunk[ "bytes" ] / 1048576., current_rss_mb(), peak_rss_mb()) )
+
+  def keep_frame(self, outidx):
+    """
+    @brief: whether the per frame root file is written for frame outidx
+    """
+    if not self._options[ "AverageOnly" ]:
+      return True
+    keep_every = int( self._options[ "KeepEvery" ] )
+    return ( keep_every > 0 ) and ( outidx % keep_every == 0 )
+
+  def probe_region(self, temperature_2d):
+    """
+    @brief: stave region found from the average of the first frames, plus
+      the margin. The full frame is used if no stave is found.
+    """
+    nypix, nxpix = temperature_2d.shape
+    region = find_stave_region( temperature_2d )
+    if region is None:
+      print ("WARNING:<TEXTTOROOT::PROBE_REGION> no stave region found, store the full frames.")
+      return (0, 0, nxpix - 1, nypix - 1)
+    roi = expand_region( region, int( self._options[ "RoiMargin" ] ), nxpix, nypix )
+    print ("INFO:<TEXTTOROOT::PROBE_REGION> stave region found " + str(region) + ", region stored per frame: " + str(roi) )
+    return roi
+
+  def write_frame(self, strBaseName, frame, temperature_2d, outidx, region = None):
+    """
+    @brief: write one frame, temperature_2d[ypos][xpos], to strBaseName.root
+      (and/or .npy, see --format) with the temperature tree atree and the
+      camera information tree btree. Returns the bytes written.
+      If region = (X0, Y0, X1, Y1) is given, only those pixels are stored.
+    """
+    if region is None:
+      region = (0, 0, frame[ "nxpixel" ] - 1, frame[ "nypixel" ] - 1)
+    x0, y0, x1, y1 = region
+
+    t_leaf, t_dtype, pos_leaf, pos_dtype, tscale, toffset = fe.GetEncoding( self._options[ "Storage" ] )
+    b_info = [ ('index', outidx, 'I'), ('nxpixel', frame[ "nxpixel" ], 'I'), ('nypixel', frame[ "nypixel" ], 'I') ]
+    b_info += [ (name, val, 'I') for name, val in zip( ['year', 'month', 'date', 'hour', 'minute'], frame[ "time" ][:5] ) ]
+    b_info += [ ('second', frame[ "time" ][5], 'D'), ('tscale', tscale, 'D'), ('toffset', toffset, 'D') ]
+    b_info += [ (name, val, 'I') for name, val in zip( ['roix0', 'roiy0', 'roix1', 'roiy1'], region ) ]
+
+    #
+    # the files are closed right away, this deletes the trees owned by
+    # them. Keeping the files open made the memory grow with the number of
+    # frames.
+    #
+    record = {
+      "values":   fe.Encode( temperature_2d[ y0:y1+1, x0:x1+1 ], self._options[ "Storage" ] ),
+      "region":   region,
+      "nxpixel":  frame[ "nxpixel" ],
+      "nypixel":  frame[ "nypixel" ],
+      "encoding": self._options[ "Storage" ],
+      "order":    "frame",
+      "info":     b_info,
+    }
+    return fs.WriteFrame( strBaseName, record, fs.GetFormats( self._options[ "Format" ] ) )
+
+  def write_rejected(self, fname, rejected):
+    """
+    @brief: write the list of frames left out of the average to a log file
+    """
+    f_log = open( fname, 'w')
+    f_log.write( "# frames left out of the average: index file reasons\n" )
+    for outidx, frame_name, reasons in rejected:
+      f_log.write( str(outidx) + " " + frame_name + " " + "; ".join( reasons ) + "\n" )
+    f_log.close()
+    print ("INFO:<TEXTTOROOT::WRITE_REJECTED> " + str(len(rejected)) + " rejected frames listed in " + fname )
+
+  def write_transient(self, strBaseName, fitter, nxpixel, nypixel, ftime):
+    """
+    @brief: solve the transient fits of all pixels and write the maps of
+      tau, tinf, deltat and valid to the tree rtree of strBaseName.root,
+      X by X, and/or to strBaseName.npz for --format npy
+    """
+    result = fitter.solve()
+    if result is None:
+      print ("ERROR:<TEXTTOROOT::WRITE_TRANSIENT> not enough frames (" + str(fitter.get_entries()) + ") for a transient fit! ")
+      return
+    tau_2d, tinf_2d, deltat_2d, valid_2d = result
+    region = fitter.get_region()
+    if region is None:
+      region = (0, 0, nxpixel - 1, nypixel - 1)
+    x0, y0, x1, y1 = region
+    formats = fs.GetFormats( self._options[ "Format" ] )
+    strNames = []
+
+    if "npy" in formats:
+      numpy.savez( strBaseName + ".npz", tau = tau_2d, tinf = tinf_2d, deltat = deltat_2d, valid = valid_2d,
+        region = numpy.array( region ), nxpixel = nxpixel, nypixel = nypixel, nframes = fitter.get_entries(),
+        time = numpy.array( ftime, dtype=float ) )
+      strNames.append( strBaseName + ".npz" )
+    if "root" in formats:
+      self.write_transient_root( strBaseName + ".root", fitter, region, tau_2d, tinf_2d, deltat_2d, valid_2d, nxpixel, nypixel, ftime )
+      strNames.append( strBaseName + ".root" )
+
+    nvalid = int( numpy.count_nonzero( valid_2d ) )
+    if nvalid > 0:
+      print ("INFO:<TEXTTOROOT::WRITE_TRANSIENT> %d of %d pixels fitted, median tau %.1f s, median Tinf %.2f C, written to %s" %
+        (nvalid, valid_2d.size, numpy.median( tau_2d[ valid_2d ] ), numpy.median( tinf_2d[ valid_2d ] ), " and ".join( strNames )) )
+    else:
+      print ("WARNING:<TEXTTOROOT::WRITE_TRANSIENT> no pixel with a decaying transient, " + " and ".join( strNames ) + " written anyway.")
+
+  def write_transient_root(self, strRooName, fitter, region, tau_2d, tinf_2d, deltat_2d, valid_2d, nxpixel, nypixel, ftime):
+    """
+    @brief: write the transient maps of the region to the tree rtree, X by X
+    """
+    x0, y0, x1, y1 = region
+    r_xpos = numpy.zeros(1, dtype=int)
+    r_ypos = numpy.zeros(1, dtype=int)
+    r_tau = numpy.zeros(1, dtype=float)
+    r_tinf = numpy.zeros(1, dtype=float)
+    r_deltat = numpy.zeros(1, dtype=float)
+    r_valid = numpy.zeros(1, dtype=int)
+    b_nxpixel = numpy.array([nxpixel], dtype=int)
+    b_nypixel = numpy.array([nypixel], dtype=int)
+    b_nframes = numpy.array([fitter.get_entries()], dtype=int)
+    b_time = [ numpy.zeros(1, dtype=int) for i in range(5) ] + [ numpy.zeros(1, dtype=float) ]
+    for buf, val in zip( b_time, ftime ):
+      buf[0] = val
+    b_region = [ numpy.array([val], dtype=int) for val in region ]
+
+    f_roo = ROOT.TFile( strRooName, "recreate")
+    rtree = ROOT.TTree("rtree", "a tree of transient fit results");
+    rtree.Branch('xpos', r_xpos, 'xpos/I')
+    rtree.Branch('ypos', r_ypos, 'ypos/I')
+    rtree.Branch('tau', r_tau, 'tau/D')
+    rtree.Branch('tinf', r_tinf, 'tinf/D')
+    rtree.Branch('deltat', r_deltat, 'deltat/D')
+    rtree.Branch('valid', r_valid, 'valid/I')
+
+    btree = ROOT.TTree("btree", "a tree of camera information");
+    btree.Branch('nxpixel', b_nxpixel, 'nxpixel/I')
+    btree.Branch('nypixel', b_nypixel, 'nypixel/I')
+    for name, buf in zip( ['year', 'month', 'date', 'hour', 'minute'], b_time[:5] ):
+      btree.Branch(name, buf, name + '/I')
+    btree.Branch('second', b_time[5], 'second/D')
+    btree.Branch('nframes', b_nframes, 'nframes/I')
+    for name, buf in zip( ['roix0', 'roiy0', 'roix1', 'roiy1'], b_region ):
+      btree.Branch(name, buf, name + '/I')
+    btree.Fill()
+
+    # X by X: xpos slowest, ypos fastest
+    nx, ny = x1 - x0 + 1, y1 - y0 + 1
+    columns = [ numpy.repeat( numpy.arange( x0, x1 + 1 ), ny ), numpy.tile( numpy.arange( y0, y1 + 1 ), nx ) ]
+    columns += [ numpy.asarray( map_2d ).T.ravel() for map_2d in [ tau_2d, tinf_2d, deltat_2d, valid_2d ] ]
+    fs.FillTree( rtree, columns, [ r_xpos, r_ypos, r_tau, r_tinf, r_deltat, r_valid ] )
+
+    f_roo.Write()
+    f_roo.Close()
+    del rtree, btree, f_roo
+
+  def write_pixel_map(self, pixel_stats):
+    """
+    @brief: build the bad pixel map from the statistics of the accepted
+      frames and cache it for the camera of this recording
+    """
+    map_2d = pixel_stats.build_map()
+    if map_2d is None:
+      print ("ERROR:<TEXTTOROOT::WRITE_PIXEL_MAP> not enough frames (" + str(pixel_stats.get_entries()) + ") to build a pixel map! ")
+      return
+    if ( self._serial == "unknown" ):
+      print ("WARNING:<TEXTTOROOT::WRITE_PIXEL_MAP> no CameraSerial in the config file, the map is cached as camera unknown.")
+    save_map( self._options[ "PixelMapDir" ], self._serial, map_2d )
+    print ("INFO:<TEXTTOROOT::WRITE_PIXEL_MAP> " + str(numpy.count_nonzero( map_2d )) + " bad pixels from " + str(pixel_stats.get_entries()) + " frames written to " + map_name( self._options[ "PixelMapDir" ], self._serial ) )
+
+  def open_summary(self, fname):
+    """
+    @brief: open the per frame summary, fname.csv and the tree stree of
+      fname.root (not for --format npy). The rows are written chunk by chunk
+      (write_summary) and the files closed by close_summary.
+    """
+    f_csv = open( fname + ".csv", 'w')
+    f_csv.write( ",".join( ["index", "time", "elapsed"] + SUMMARY_COLUMNS + ["accepted"] ) + "\n" )
+    self._summary = { "name": fname, "csv": f_csv, "rows": 0, "t0": None, "root": None }
+    if "root" not in fs.GetFormats( self._options[ "Format" ] ):
+      return
+
+    s_index = numpy.zeros(1, dtype=int)
+    s_accepted = numpy.zeros(1, dtype=int)
+    s_time = [ numpy.zeros(1, dtype=int) for i in range(5) ] + [ numpy.zeros(1, dtype=float) ]
+    s_elapsed = numpy.zeros(1, dtype=float)
+    s_values = dict( (col, numpy.zeros(1, dtype=float)) for col in SUMMARY_COLUMNS )
+
+    f_roo = ROOT.TFile( fname + ".root", "recreate")
+    stree = ROOT.TTree("stree", "a tree of frame summary information");
+    stree.Branch('index', s_index, 'index/I')
+    for name, buf in zip( ['year', 'month', 'date', 'hour', 'minute'], s_time[:5] ):
+      stree.Branch(name, buf, name + '/I')
+    stree.Branch('second', s_time[5], 'second/D')
+    stree.Branch('elapsed', s_elapsed, 'elapsed/D')
+    for col in SUMMARY_COLUMNS:
+      stree.Branch(col, s_values[ col ], col + '/D')
+    stree.Branch('accepted', s_accepted, 'accepted/I')
+    self._summary[ "root" ] = { "file": f_roo, "tree": stree, "index": s_index, "accepted": s_accepted,
+                                "time": s_time, "elapsed": s_elapsed, "values": s_values }
+
+  def write_summary(self, summary):
+    """
+    @brief: append the summary rows of a chunk, one row (entry) per
+      converted frame, and flush them to the files
+    """
+    if len( summary ) == 0:
+      return
+    if self._summary[ "t0" ] is None:
+      self._summary[ "t0" ] = frame_seconds( summary[0][1] )
+    t0 = self._summary[ "t0" ]
+
+    f_csv = self._summary[ "csv" ]
+    for outidx, ftime, accepted, values in summary:
+      strTime = "%04d-%02d-%02d %02d:%02d:%06.3f" % tuple( ftime )
+      row = [ str(outidx), strTime, "%.3f" % ( frame_seconds( ftime ) - t0 ) ]
+      row += [ "%.4f" % values[ col ] for col in SUMMARY_COLUMNS ]
+      row.append( str( int( accepted ) ) )
+      f_csv.write( ",".join( row ) + "\n" )
+    f_csv.flush()
+    self._summary[ "rows" ] += len( summary )
+
+    s_root = self._summary[ "root" ]
+    if s_root is None:
+      return
+    for outidx, ftime, accepted, values in summary:
+      s_root[ "index" ][0] = outidx
+      s_root[ "accepted" ][0] = accepted
+      for buf, val in zip( s_root[ "time" ], ftime ):
+        buf[0] = val
+      s_root[ "elapsed" ][0] = frame_seconds( ftime ) - t0
+      for col in SUMMARY_COLUMNS:
+        s_root[ "values" ][ col ][0] = values[ col ]
+      s_root[ "tree" ].Fill()
+    # baskets and tree header to the file, readable if the conversion dies
+    s_root[ "tree" ].AutoSave( "SaveSelf" )
+
+  def close_summary(self):
+    """
+    @brief: close the per frame summary files
+    """
+    fname = self._summary[ "name" ]
+    self._summary[ "csv" ].close()
+    s_root = self._summary[ "root" ]
+    if s_root is None:
+      print ("INFO:<TEXTTOROOT::WRITE_SUMMARY> summary of " + str(self._summary[ "rows" ]) + " frames written to " + fname + ".csv")
+    else:
+      s_root[ "file" ].Write( "", ROOT.TObject.kOverwrite )
+      s_root[ "file" ].Close()
+      print ("INFO:<TEXTTOROOT::WRITE_SUMMARY> summary of " + str(self._summary[ "rows" ]) + " frames written to " + fname + ".csv and " + fname + ".root")
+    self._summary = None
+
+def current_rss_mb():
+  """
+  @brief: resident memory of this process in MB, from /proc on Linux, else
+    the peak resident memory
+  """
+  try:
+    f_statm = open( "/proc/self/statm", 'r')
+    pages = int( f_statm.read().split()[1] )
+    f_statm.close()
+    return pages * resource.getpagesize() / 1048576.
+  except (IOError, OSError, IndexError, ValueError):
+    return peak_rss_mb()
+
+def peak_rss_mb():
+  """
+  @brief: peak resident memory of this process in MB (ru_maxrss is in kB
+    on Linux and in bytes on Mac)
+  """
+  maxrss = float( resource.getrusage( resource.RUSAGE_SELF ).ru_maxrss )
+  if sys.platform == "darwin":
+    return maxrss / 1048576.
+  return maxrss / 1024.
+
+def pop_flag(cmds, names):
+  """
+  @brief: remove all the flags in names from the list of commands, return
+    True if any was found.
+  """
+  found = False
+  for name in names:
+    while name in cmds:
+      cmds.remove( name )
+      found = True
+  return found
+
+def pop_option(cmds, names, default):
+  """
+  @brief: remove an option with its value from the list of commands, return
+    the value, or default if the option is not given.
+  """
+  for name in names:
+    if name in cmds:
+      idx = cmds.index( name )
+      if ( idx + 1 >= len(cmds) ):
+        print ("ERROR:<TEXTTOROOT> option " + name + " needs a value!")
+        raise Exception(" Missing option value! ")
+      value = cmds[ idx + 1 ]
+      del cmds[ idx:idx+2 ]
+      return value
+  return default
+
 def print_usage( s_function):
-  print ("Usage: " + s_function + " OUT_DIR NUM_INPUT_FILES [CONFIG=config] [IN_DIR=tout] [IN_NAME=frame] [IN_EXT=pgm]")
+  print ("Usage: " + s_function + " OUT_DIR NUM_INPUT_FILES [CONFIG=config] [IN_DIR=tout] [IN_NAME=frame] [IN_EXT=pgm] [options]")
+  print (" --no-reject : keep all frames in the average, no outlier rejection")
+  print (" --frame-config FILE : config_frame with the stave region for the frame statistics (default: config_frame)")
+  print (" --average-only : only write the average frame, no per frame root files")
+  print (" --keep-every K : with --average-only, still write every K-th frame for spot checks")
+  print (" --storage double|float|centi : numeric storage of the temperature (default: double)")
+  print (" --roi : only store the stave region (from config_frame or the first frames) of each frame")
+  print (" --roi-margin N : margin in pixels around the stave region (default: 10)")
+  print (" --chunk N : number of frames per chunk for memory checks and logging (default: 100)")
+  print (" --max-rss MB : memory budget in MB, stop reading frames if the RSS stays above, the average of the frames read is written (default: no limit)")
+  print (" --window N : also write sliding-window averages of N frames to OUT_DIR/window_NNNNN.root (.npy for npy)")
+  print (" --stride S : frames between two window averages (default: 10)")
+  print (" --pixel-map auto|build|off : correct bad pixels with the cached camera map (default: auto), build it, or off")
+  print (" --pixel-map-dir DIR : directory of the cached pixel maps (default: pixelmaps)")
+  print (" --register : register the frames (FFT phase correlation) before averaging")
+  print (" --register-batch N : frames per batch of shift estimates (default: 16)")
+  print (" --transient : fit the per pixel time constant tau and Tinf, written to OUT_DIR/transient.root (.npz for npy)")
+  print (" --drift-threshold D : largest stave drift in C/min of a steady-state recording (default: 0.5)")
+  print (" --format root|npy|both : file format of the frames and averages (default: root)")
 
 def main():
-  if sys.version_info[0] >= 3:
-    print ("ERROR:<TEXTTOROOT::MAIN> PyROOT only works with Python 2.x. Code Tested with 2.7.10. Current version " + str(sys.version_info[0]) + ".x")
-    raise " Python Version too high. Use 2.x. "
+  strInputCmds = sys.argv[1:]
+  bolNoReject = pop_flag( strInputCmds, ["--no-reject"] )
+  strFrameConfig = pop_option( strInputCmds, ["--frame-config"], "config_frame" )
+  bolAverageOnly = pop_flag( strInputCmds, ["--average-only"] )
+  intKeepEvery = int( pop_option( strInputCmds, ["--keep-every"], 0 ) )
+  strStorage = pop_option( strInputCmds, ["--storage"], "double" )
+  fe.GetEncoding( strStorage )
+  bolRoiMode = pop_flag( strInputCmds, ["--roi"] )
+  intRoiMargin = int( pop_option( strInputCmds, ["--roi-margin"], 10 ) )
+  intChunkFrames = int( pop_option( strInputCmds, ["--chunk"], 100 ) )
+  fltMaxRSS = float( pop_option( strInputCmds, ["--max-rss"], 0. ) )
+  intWindow = int( pop_option( strInputCmds, ["--window"], 0 ) )
+  intStride = int( pop_option( strInputCmds, ["--stride"], 10 ) )
+  strPixelMap = pop_option( strInputCmds, ["--pixel-map"], "auto" )
+  strPixelMapDir = pop_option( strInputCmds, ["--pixel-map-dir"], "pixelmaps" )
+  bolRegister = pop_flag( strInputCmds, ["--register"] )
+  intRegisterBatch = int( pop_option( strInputCmds, ["--register-batch"], 16 ) )
+  bolTransient = pop_flag( strInputCmds, ["--transient"] )
+  fltDriftThreshold = float( pop_option( strInputCmds, ["--drift-threshold"], 0.5 ) )
+  strFormat = pop_option( strInputCmds, ["--format"], "root" )
+  fs.GetFormats( strFormat )
+  #PyROOT is only needed for root files
+  if sys.version_info[0] >= 3 and "root" in fs.GetFormats( strFormat ):
+    print ("ERROR:<TEXTTOROOT::MAIN> PyROOT only works with Python 2.x. Code Tested with 2.7.10. Current version " + str(sys.version_info[0]) + ".x. Use --format npy.")
+    raise Exception(" Python Version too high. Use 2.x. ")
+  if not strPixelMap in ["auto", "build", "off"]:
+    print ("ERROR:<TEXTTOROOT> unknown --pixel-map " + strPixelMap + ", use auto, build or off. Return.")
+    return
+  if ( intKeepEvery > 0 ):
+    bolAverageOnly = True
 
-  nargv = len(sys.argv)
+  nargv = len(strInputCmds) + 1
   if (nargv <= 2): 
     print ("ERROR:<TEXTTOROOT> Please provide: output folder and number of inputs. Missing! Return.")
     print_usage( str(sys.argv[0]) )
     return
   else:
-    str_outdir = sys.argv[1];
-    int_ninput = int( sys.argv[2] )#+3214;
+    str_outdir = strInputCmds[0];
+    int_ninput = int( strInputCmds[1] )#+3214;
 
   str_cfg = "config"
   if (nargv >= 4):
-    str_cfg = sys.argv[3];
+    str_cfg = strInputCmds[2];
 
   str_indir = "tout"
   if (nargv >= 5):
-    str_indir = sys.argv[4];
+    str_indir = strInputCmds[3];
 
   str_inname = "frame"
   if (nargv >= 6): 
-    str_inname = sys.argv[5];
+    str_inname = strInputCmds[4];
 
   str_inext = "pgm"
   if (nargv >= 7):
-    str_inext = sys.argv[6];
+    str_inext = strInputCmds[5];
 
   ist_txtroo = TextToRoot( str_cfg ) 
+  ist_txtroo.set_option( "RejectOutliers", not bolNoReject )
+  ist_txtroo.set_option( "FrameConfig", strFrameConfig )
+  ist_txtroo.set_option( "AverageOnly", bolAverageOnly )
+  ist_txtroo.set_option( "KeepEvery", intKeepEvery )
+  ist_txtroo.set_option( "Storage", strStorage )
+  ist_txtroo.set_option( "RoiMode", bolRoiMode )
+  ist_txtroo.set_option( "RoiMargin", intRoiMargin )
+  ist_txtroo.set_option( "ChunkFrames", max( 1, intChunkFrames ) )
+  ist_txtroo.set_option( "MaxRSS", fltMaxRSS )
+  ist_txtroo.set_option( "Window", intWindow )
+  ist_txtroo.set_option( "WindowStride", intStride )
+  ist_txtroo.set_option( "PixelMap", strPixelMap )
+  ist_txtroo.set_option( "PixelMapDir", strPixelMapDir )
+  ist_txtroo.set_option( "Register", bolRegister )
+  ist_txtroo.set_option( "RegisterBatch", max( 1, intRegisterBatch ) )
+  ist_txtroo.set_option( "Transient", bolTransient )
+  ist_txtroo.set_option( "DriftThreshold", fltDriftThreshold )
+  ist_txtroo.set_option( "Format", strFormat )
   ist_txtroo.convert( str_outdir, int_ninput, str_indir, str_inname, str_inext)
+  if ( ist_txtroo.get_status() == 4 ):
+    print (' Convert. Stopped by the memory budget, the frames read so far are written!')
+    sys.exit( 4 )
   print (' Convert. Done!')
 
 if __name__ == "__main__":
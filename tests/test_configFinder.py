@@ -0,0 +1,134 @@
+"""
+@brief:
+  The numpy search steps of configFinder.py on synthetic frames: BestWindow
+  (prefix sums) against a brute force sum over every window, the stave
+  edges of the projection engine (ProjectionEdges, ProjectionLines) and the
+  check of cached stave lines (VerifyGeometry).
+
+  python -m pytest tests (or python -m unittest discover -s tests)
+"""
+
+import os
+import sys
+import unittest
+import numpy
+
+sys.path.insert( 0, os.path.join( os.path.dirname( os.path.abspath( __file__ ) ), ".." ) )
+
+import configFinder as cf
+
+def brute_best_window(image, points, offset0, offset1, rows, troom = 20.):
+  """
+  @brief: BestWindow summed pixel by pixel: the window of every point
+    clipped to the image, the first point of the largest contrast, 0 if none
+  """
+  xpixels = image.shape[0]
+  best, best_score = 0, 0.
+  for point in points:
+    low = min( max( int( point + offset0 ), 0 ), xpixels )
+    high = min( max( int( point + offset1 ), low ), xpixels )
+    score = 0.
+    for x in range( low, high ):
+      for y in rows:
+        score += abs( image[x][y] - troom )
+    if score > best_score * ( 1. + 1.e-12 ):
+      best, best_score = point, score
+  return best
+
+class BestWindowTest(unittest.TestCase):
+
+  def test_brute_force(self):
+    rng = numpy.random.RandomState( 7 )
+    for itrial in range( 20 ):
+      image = 20. + rng.standard_normal( (80, 30) )
+      x0 = rng.randint( 0, 60 )
+      image[x0:x0+rng.randint( 5, 40 ),10:20] -= 10.
+      rows = list( range( rng.randint( 0, 10 ), rng.randint( 15, 30 ) ) )
+      # points beyond both ends of the image: the windows are clipped
+      points = list( rng.randint( -20, 100, rng.randint( 1, 40 ) ) )
+      offset0, offset1 = rng.uniform( -10., 5. ), rng.uniform( 5., 50. )
+      self.assertEqual( cf.BestWindow( image, points, offset0, offset1, rows ), brute_best_window( image, points, offset0, offset1, rows ) )
+
+  def test_stave_window(self):
+    image = numpy.full( (100, 20), 20. )
+    image[30:70,5:15] = -25.
+    self.assertEqual( cf.BestWindow( image, list( range( 60 ) ), 0., 40., list( range( 20 ) ) ), 30 )
+
+  def test_first_point_wins_tie(self):
+    image = numpy.full( (50, 4), 20. )
+    image[10:20,:] = 30.
+    self.assertEqual( cf.BestWindow( image, [ 12, 10, 11 ], -2., 20., [ 0, 1 ] ), 12 )
+
+  def test_no_contrast(self):
+    image = numpy.full( (50, 4), 20. )
+    self.assertEqual( cf.BestWindow( image, [ 3, 5 ], 0., 10., [ 0 ] ), 0 )
+    self.assertEqual( cf.BestWindow( image, [], 0., 10., [ 0 ] ), 0 )
+
+def make_stave(seed = 3):
+  """
+  @brief: image[x][y] of 640x480 pixels, a cold stave on columns 60-608
+    (548.2 pixels expected for 13 modules) and rows 210-261, 0.1 C noise
+  """
+  rng = numpy.random.RandomState( seed )
+  image = 20. + 0.1 * rng.standard_normal( (640, 480) )
+  image[60:609,210:262] = -25.
+  return image
+
+class ProjectionEdgesTest(unittest.TestCase):
+
+  def test_pixel_edges(self):
+    edges = cf.ProjectionEdges( make_stave(), False )
+    numpy.testing.assert_allclose( edges, (261.5, 209.5, 608.5, 59.5), atol = 0.01 )
+    # the Hough lines are the pixels just outside the stave
+    self.assertEqual( cf.ProjectionLines( make_stave(), False ), [ 262, 209, 609, 59 ] )
+
+  def test_sub_pixel_edges(self):
+    # half contrast pixels on the border move every edge by half a pixel
+    image = make_stave()
+    image[60:609,209] = image[60:609,262] = -2.5
+    image[59,210:262] = image[609,210:262] = -2.5
+    numpy.testing.assert_allclose( cf.ProjectionEdges( image, False ), (262., 209., 609., 59.), atol = 0.01 )
+
+  def test_ambiguous_step(self):
+    # a second cold band next to the stave: Hough has to decide
+    image = make_stave()
+    image[60:609,270:280] = -25.
+    self.assertEqual( cf.ProjectionEdges( image, False ), None )
+    self.assertEqual( cf.ProjectionLines( image, False ), None )
+
+  def test_stave_length(self):
+    image = make_stave()
+    image[400:609,210:262] = 20.
+    self.assertEqual( cf.ProjectionEdges( image, False ), None )
+    self.assertEqual( cf.ProjectionEdges( make_stave(), True ), None )
+
+class VerifyGeometryTest(unittest.TestCase):
+
+  def setUp(self):
+    self.image = make_stave()
+    # the Hough lines [y1, y0, x1, x0] of the stave, just outside it
+    self.lines = [ 262, 209, 609, 59 ]
+
+  def shifted(self, iedge, shift):
+    lines = list( self.lines )
+    lines[iedge] += shift
+    return lines
+
+  def test_exact(self):
+    self.assertTrue( cf.VerifyGeometry( self.image, self.lines ) )
+
+  def test_one_pixel_off(self):
+    for iedge in range( 4 ):
+      for shift in [ -1, 1 ]:
+        self.assertTrue( cf.VerifyGeometry( self.image, self.shifted( iedge, shift ) ), "edge %d by %d" % ( iedge, shift ) )
+
+  def test_two_pixels_off(self):
+    for iedge in range( 4 ):
+      for shift in [ -2, 2 ]:
+        self.assertFalse( cf.VerifyGeometry( self.image, self.shifted( iedge, shift ) ), "edge %d by %d" % ( iedge, shift ) )
+
+  def test_outside_frame(self):
+    self.assertFalse( cf.VerifyGeometry( self.image, [ 262, 209, 640, 59 ] ) )
+
+if __name__ == "__main__":
+  unittest.main()
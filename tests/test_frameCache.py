@@ -0,0 +1,111 @@
+"""
+@brief:
+  The LRU frame cache of frameCache.py with a small memory cap: eviction
+  order, entries above the cap, the disabled cache, files changed on disk
+  and memory-mapped npy arrays counted apart from the cap.
+
+  python -m pytest tests (or python -m unittest discover -s tests)
+"""
+
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+import numpy
+
+sys.path.insert( 0, os.path.join( os.path.dirname( os.path.abspath( __file__ ) ), ".." ) )
+
+import frameCache as fc
+
+MB = 1024 * 1024
+
+class FrameCacheTest(unittest.TestCase):
+
+  def setUp(self):
+    self.tmpdir = tempfile.mkdtemp()
+    self.nloads = {}
+
+  def tearDown(self):
+    shutil.rmtree( self.tmpdir, ignore_errors = True )
+
+  def make_file(self, name, values = None):
+    strFile = os.path.join( self.tmpdir, name + ".npy" )
+    numpy.save( strFile, numpy.zeros( 4 ) if values is None else values )
+    return strFile
+
+  def get(self, cache, strFile, fltMB = 0.25):
+    """
+    @brief: an array of fltMB through the cache, counting the loads
+    """
+    def load():
+      self.nloads[ strFile ] = self.nloads.get( strFile, 0 ) + 1
+      return { "values": numpy.zeros( int( fltMB * MB ) // 8 ) }
+    return cache.Get( [ strFile ], ("test",), load )
+
+  def test_evicts_least_recently_used(self):
+    cache = fc.FrameCache( 1. )
+    files = [ self.make_file( "f" + str( i ) ) for i in range( 5 ) ]
+    for strFile in files[:4]:
+      self.get( cache, strFile )
+    self.assertEqual( cache.GetStats()[ "entries" ], 4 )
+    self.assertAlmostEqual( cache.GetStats()[ "MB" ], 1. )
+    # a hit makes f0 the most recent, f1 goes first
+    self.get( cache, files[0] )
+    self.get( cache, files[4] )
+    stats = cache.GetStats()
+    self.assertEqual( ( stats[ "hits" ], stats[ "misses" ], stats[ "evictions" ], stats[ "entries" ] ), ( 1, 5, 1, 4 ) )
+    # f1 is loaded again and pushes out f2, the others stay
+    self.get( cache, files[1] )
+    for strFile in [ files[0], files[3], files[4], files[2] ]:
+      self.get( cache, strFile )
+    self.assertEqual( [ self.nloads[ strFile ] for strFile in files ], [ 1, 2, 2, 1, 1 ] )
+    self.assertTrue( cache.GetStats()[ "MB" ] <= 1. )
+
+  def test_entry_above_cap(self):
+    cache = fc.FrameCache( 1. )
+    strFile = self.make_file( "big" )
+    values = self.get( cache, strFile, 2. )
+    self.assertFalse( values[ "values" ].flags.writeable )
+    self.get( cache, strFile, 2. )
+    self.assertEqual( self.nloads[ strFile ], 2 )
+    self.assertEqual( cache.GetStats()[ "entries" ], 0 )
+
+  def test_lower_cap_and_disabled(self):
+    cache = fc.FrameCache( 1. )
+    files = [ self.make_file( "f" + str( i ) ) for i in range( 4 ) ]
+    for strFile in files:
+      self.get( cache, strFile )
+    cache.SetMaxMB( 0.5 )
+    self.assertEqual( cache.GetStats()[ "entries" ], 2 )
+    cache.SetMaxMB( 0 )
+    self.assertEqual( cache.GetStats()[ "entries" ], 0 )
+    self.get( cache, files[0] )
+    self.get( cache, files[0] )
+    self.assertEqual( self.nloads[ files[0] ], 3 )
+
+  def test_changed_file_reloaded(self):
+    cache = fc.FrameCache( 1. )
+    strFile = self.make_file( "f" )
+    self.get( cache, strFile )
+    self.make_file( "f", numpy.zeros( 8 ) )
+    self.get( cache, strFile )
+    self.assertEqual( self.nloads[ strFile ], 2 )
+
+  def test_mapped_arrays_apart(self):
+    # a memory-mapped frame does not fill the cap, a decoded copy of it does
+    cache = fc.FrameCache( 4. )
+    strFile = self.make_file( "frame", numpy.ones( (512, 512) ) )
+    mapped = cache.Get( [ strFile ], ("mapped",), lambda: { "temperature": numpy.asarray( numpy.load( strFile, mmap_mode = "r" ), dtype = float ) } )
+    stats = cache.GetStats()
+    self.assertEqual( ( stats[ "entries" ], stats[ "MB" ], stats[ "mappedMB" ] ), ( 1, 0., 2. ) )
+    self.assertEqual( mapped[ "temperature" ].sum(), 512 * 512 )
+    cache.Get( [ strFile ], ("decoded",), lambda: { "temperature": numpy.load( strFile, mmap_mode = "r" ) * 0.01 } )
+    stats = cache.GetStats()
+    self.assertEqual( ( stats[ "entries" ], stats[ "MB" ], stats[ "mappedMB" ] ), ( 2, 2., 2. ) )
+    cache.SetMaxMB( 1. )
+    stats = cache.GetStats()
+    self.assertEqual( ( stats[ "entries" ], stats[ "MB" ], stats[ "mappedMB" ] ), ( 0, 0., 0. ) )
+
+if __name__ == "__main__":
+  unittest.main()
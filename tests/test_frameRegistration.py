@@ -0,0 +1,61 @@
+"""
+@brief:
+  Accuracy of the shifts of share/frameRegistration.py on a synthetic stave
+  shifted by known sub-pixel amounts.
+
+  python -m pytest tests (or python -m unittest discover -s tests)
+"""
+
+import os
+import sys
+import unittest
+import numpy
+
+sys.path.insert( 0, os.path.join( os.path.dirname( os.path.abspath( __file__ ) ), "..", "share" ) )
+
+from frameRegistration import FrameRegistration, shift_frame
+from frameStats import expand_region
+
+def edge(u):
+  """
+  @brief: smooth 0 -> 1 step at u = 0, 0.7 pixel wide
+  """
+  return 0.5 * ( 1. + numpy.tanh( u / 1.4 ) )
+
+def stave_frame(dy = 0., dx = 0., seed = 0):
+  """
+  @brief: 640x480 frame of a cold stave with two pipes, its content moved by
+    (dy, dx) pixels, 0.05 C noise
+  """
+  y = numpy.arange( 480 )[ :, numpy.newaxis ] - dy
+  x = numpy.arange( 640 )[ numpy.newaxis, : ] - dx
+  in_y = edge( y - 222. ) - edge( y - 258. )
+  in_x = edge( x - 60. ) - edge( x - 608. )
+  temperature_2d = 20. - 40. * in_y * in_x
+  temperature_2d -= 5. * ( numpy.exp( -0.5 * ( ( y - 230. ) / 2. )**2 ) + numpy.exp( -0.5 * ( ( y - 250. ) / 2. )**2 ) ) * in_x
+  return temperature_2d + 0.05 * numpy.random.RandomState( seed ).standard_normal( temperature_2d.shape )
+
+class FrameRegistrationTest(unittest.TestCase):
+
+  def test_subpixel_shifts(self):
+    # the stave region plus the default --roi-margin, as in texttoroot.py
+    registration = FrameRegistration( stave_frame(), expand_region( (60, 222, 608, 258), 10, 640, 480 ) )
+    shifts = [ (1.5, 0.3), (2.25, -1.1), (-2.4, 0.7), (0.4, -2.6) ]
+    frames = numpy.array( [ stave_frame( dy, dx, seed = i + 1 ) for i, (dy, dx) in enumerate( shifts ) ] )
+    dy, dx = registration.estimate( frames )
+    for i, (true_dy, true_dx) in enumerate( shifts ):
+      self.assertAlmostEqual( dy[i], true_dy, delta = 0.1 )
+      self.assertAlmostEqual( dx[i], true_dx, delta = 0.1 )
+
+  def test_shift_frame_aligns(self):
+    reference_2d = stave_frame()
+    registration = FrameRegistration( reference_2d, (50, 212, 618, 268) )
+    frame_2d = stave_frame( 1.5, -0.8, seed = 5 )
+    dy, dx = registration.estimate( frame_2d[ numpy.newaxis ] )
+    aligned_2d = shift_frame( frame_2d, dy[0], dx[0] )
+    before = numpy.sqrt( numpy.mean( ( frame_2d - reference_2d )[ 200:280, 40:630 ]**2 ) )
+    after = numpy.sqrt( numpy.mean( ( aligned_2d - reference_2d )[ 200:280, 40:630 ]**2 ) )
+    self.assertLess( after, 0.2 * before )
+
+if __name__ == "__main__":
+  unittest.main()
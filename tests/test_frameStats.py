@@ -0,0 +1,182 @@
+"""
+@brief:
+  Outlier rejection, sliding-window averages, the per pixel drift and
+  transient fits of share/frameStats.py on synthetic frame sequences.
+
+  python -m pytest tests (or python -m unittest discover -s tests)
+"""
+
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+import numpy
+
+sys.path.insert( 0, os.path.join( os.path.dirname( os.path.abspath( __file__ ) ), "..", "share" ) )
+
+from frameStats import frame_statistics, read_stave_region, OutlierRejector, WindowAverager, DriftFitter, TransientFitter
+
+def run_rejector(levels, relock = 10, seed = 1, noise = None):
+  """
+  @brief: stream frames of mean temperature levels[i] (noise[i] C pixel
+    noise, default 0.05) through the rejector as texttoroot.py does, return
+    the accepted flags
+  """
+  rng = numpy.random.RandomState( seed )
+  counts = numpy.full( (20, 30), 1000 )
+  rejector = OutlierRejector( relock = relock )
+  previous_2d = None
+  accepted = []
+  for i, level in enumerate( levels ):
+    temperature_2d = level + ( 0.05 if noise is None else noise[i] ) * rng.standard_normal( counts.shape )
+    reasons = rejector.check( frame_statistics( temperature_2d, counts, 4096, None, previous_2d ) )
+    accepted.append( len( reasons ) == 0 )
+    if len( reasons ) == 0:
+      previous_2d = temperature_2d
+  return accepted, rejector
+
+class OutlierRejectorTest(unittest.TestCase):
+
+  def test_step_change_relocks(self):
+    levels = [ 20. ] * 30 + [ 23. ] * 70
+    accepted, rejector = run_rejector( levels )
+    self.assertTrue( all( accepted[:30] ) )
+    # the 9 frames after the step are rejected, the 10th restarts the baseline
+    self.assertEqual( accepted[30:40], [ False ] * 9 + [ True ] )
+    self.assertTrue( all( accepted[40:] ) )
+    self.assertEqual( rejector.level_changes, 1 )
+
+  def test_transient_stays_rejected(self):
+    levels = [ 20. ] * 30 + [ 26. ] * 3 + [ 20. ] * 30
+    accepted, rejector = run_rejector( levels )
+    self.assertEqual( accepted[30:33], [ False ] * 3 )
+    self.assertTrue( all( accepted[33:] ) )
+    self.assertEqual( rejector.level_changes, 0 )
+
+  def test_transient_after_relock(self):
+    # a noisy frame (same level, large frame to frame difference) right
+    # after the relock at frame 39 must still be rejected
+    levels = [ 20. ] * 30 + [ 23. ] * 30
+    noise = [ 0.05 ] * 60
+    noise[40] = 2.
+    accepted, rejector = run_rejector( levels, noise = noise )
+    self.assertEqual( rejector.level_changes, 1 )
+    self.assertTrue( accepted[39] )
+    self.assertFalse( accepted[40] )
+    self.assertTrue( all( accepted[41:] ) )
+
+  def test_no_relock(self):
+    levels = [ 20. ] * 30 + [ 23. ] * 70
+    accepted, rejector = run_rejector( levels, relock = 0 )
+    self.assertFalse( any( accepted[30:] ) )
+
+class WindowAveragerTest(unittest.TestCase):
+
+  def check_windows(self, nframe, window, stride):
+    # the ring buffer averages against numpy.mean over the explicit slices:
+    # one window ending at every stride-th frame once the first is full, the
+    # frames after the last of them (less than stride) are in no window
+    rng = numpy.random.RandomState( 5 )
+    frames = 20. + rng.standard_normal( (nframe, 4, 6) )
+    averager = WindowAverager( window, stride )
+    results = []
+    for i in range( nframe ):
+      result = averager.add( frames[i], i, 0.1 * i )
+      if result is not None:
+        results.append( result )
+    ends = list( range( window, nframe + 1, max( 1, stride ) ) )
+    self.assertEqual( len( results ), len( ends ) )
+    for ( average_2d, window_frames ), end in zip( results, ends ):
+      numpy.testing.assert_allclose( average_2d, numpy.mean( frames[end-window:end], axis = 0 ), rtol = 1.e-12 )
+      self.assertEqual( [ idx for idx, ftime in window_frames ], list( range( end - window, end ) ) )
+
+  def test_stride_below_window(self):
+    self.check_windows( 57, 10, 3 )
+
+  def test_stride_above_window(self):
+    self.check_windows( 40, 4, 7 )
+
+  def test_stride_one(self):
+    self.check_windows( 12, 5, 0 )
+
+  def test_fewer_frames_than_window(self):
+    self.check_windows( 6, 8, 2 )
+
+class DriftFitterTest(unittest.TestCase):
+
+  def test_linear_drift_recovered(self):
+    # 0.3 C/min on the stave (rows 2-3), -1.2 C/min elsewhere, 0.02 C noise,
+    # one frame per second for 2 minutes
+    drift = numpy.full( (6, 10), -1.2 )
+    drift[2:4,:] = 0.3
+    rng = numpy.random.RandomState( 4 )
+    fitter = DriftFitter()
+    self.assertEqual( fitter.slope(), None )
+    for i in range( 120 ):
+      fitter.add( 20. + drift * i / 60. + 0.02 * rng.standard_normal( drift.shape ), 500. + i )
+    numpy.testing.assert_allclose( fitter.slope(), drift, atol = 0.01 )
+    self.assertAlmostEqual( fitter.drift_score( (0, 2, 9, 3) ), 0.3, delta = 0.005 )
+    self.assertAlmostEqual( fitter.drift_score(), 1.2, delta = 0.005 )
+
+  def test_no_time_span(self):
+    fitter = DriftFitter()
+    for i in range( 3 ):
+      fitter.add( numpy.full( (2, 2), float( i ) ), 10. )
+    self.assertEqual( fitter.slope(), None )
+    self.assertEqual( fitter.drift_score(), None )
+
+class TransientFitterTest(unittest.TestCase):
+
+  def test_exponential_recovered(self):
+    # T(t) = Tinf + dT exp(-t/tau) in the region (columns 2-4, rows 1-2) of
+    # 5x8 frames every 0.5 s, 0.01 C noise, the last pixel has no transient
+    tau = numpy.array( [ [ 20., 40., 60. ], [ 30., 50., 45. ] ] )
+    tinf = numpy.array( [ [ -30., -28., -25. ], [ -20., -35., 20. ] ] )
+    deltat = numpy.array( [ [ 40., 45., 50. ], [ 30., 55., 0. ] ] )
+    rng = numpy.random.RandomState( 2 )
+    fitter = TransientFitter( region = (2, 1, 4, 2) )
+    for i in range( 300 ):
+      t = 0.5 * i
+      temperature_2d = numpy.full( (5, 8), 99. )
+      temperature_2d[1:3,2:5] = tinf + deltat * numpy.exp( -t / tau ) + 0.01 * rng.standard_normal( tau.shape )
+      fitter.add( temperature_2d, 1000. + t )
+    self.assertEqual( fitter.get_entries(), 300 )
+    fit_tau, fit_tinf, fit_deltat, valid = fitter.solve()
+    self.assertEqual( valid.tolist(), [ [ True, True, True ], [ True, True, False ] ] )
+    numpy.testing.assert_allclose( fit_tau[valid], tau[valid], rtol = 1.e-3 )
+    numpy.testing.assert_allclose( fit_deltat[valid], deltat[valid], rtol = 1.e-3 )
+    numpy.testing.assert_allclose( fit_tinf, tinf, atol = 0.01 )
+
+  def test_too_few_frames(self):
+    fitter = TransientFitter()
+    for i in range( 3 ):
+      fitter.add( numpy.zeros( (2, 2) ), float( i ) )
+    self.assertEqual( fitter.solve(), None )
+
+class StaveRegionTest(unittest.TestCase):
+
+  def setUp(self):
+    self.tmpdir = tempfile.mkdtemp()
+
+  def tearDown(self):
+    shutil.rmtree( self.tmpdir, ignore_errors = True )
+
+  def write_config(self, side_l, y0, y1):
+    cfg_name = os.path.join( self.tmpdir, "config_frame" )
+    f_cfg = open( cfg_name, "w" )
+    for item, val in [ ("StavePixelX0", 61), ("StavePixelX1", 608), ("StavePixelY0", y0), ("StavePixelY1", y1), ("StaveSideL", side_l) ]:
+      f_cfg.write( "%s %d\n" % (item, val) )
+    f_cfg.close()
+    return cfg_name
+
+  def test_j_side(self):
+    self.assertEqual( read_stave_region( self.write_config( 0, 210, 260 ), 640, 480 ), (61, 210, 608, 260) )
+
+  def test_l_side(self):
+    # rows 210..260 of the frame, written mirrored by configFinder.PipeRegion
+    # as |y - 480|: StavePixelY0 = 480 - 260, StavePixelY1 = 480 - 210
+    self.assertEqual( read_stave_region( self.write_config( 1, 220, 270 ), 640, 480 ), (61, 210, 608, 260) )
+
+if __name__ == "__main__":
+  unittest.main()
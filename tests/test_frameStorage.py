@@ -0,0 +1,116 @@
+"""
+@brief:
+  Round trip of the frame records of frameStorage.py through the npy
+  backend, for every storage encoding of frameEncoding.py: a single frame
+  of a region (as texttoroot.py --roi writes it) and an average with its
+  maps and frame times. The temperatures come back within the quantisation
+  of the encoding (double exact, float 1e-5 relative, centi 0.005 C).
+
+  python -m pytest tests (or python -m unittest discover -s tests)
+"""
+
+import os
+import sys
+import json
+import shutil
+import tempfile
+import unittest
+import numpy
+
+sys.path.insert( 0, os.path.join( os.path.dirname( os.path.abspath( __file__ ) ), ".." ) )
+
+import frameEncoding as fe
+import frameStorage as fs
+
+NXPIXEL, NYPIXEL = 40, 30
+FILL = -999.
+
+def make_temperature(seed = 11):
+  rng = numpy.random.RandomState( seed )
+  return rng.uniform( -40., 40., (NYPIXEL, NXPIXEL) )
+
+def make_record(temperature_2d, strEncoding, strOrder, region = None, maps = None, frames = None):
+  """
+  @brief: a frame record as share/texttoroot.py writes it
+  """
+  if region is None:
+    region = (0, 0, NXPIXEL - 1, NYPIXEL - 1)
+  x0, y0, x1, y1 = region
+  tscale, toffset = fe.GetEncoding( strEncoding )[4:6]
+  info = [ ('nxpixel', NXPIXEL, 'I'), ('nypixel', NYPIXEL, 'I'), ('second', 12.5, 'D'), ('tscale', tscale, 'D'), ('toffset', toffset, 'D') ]
+  info += [ (name, val, 'I') for name, val in zip( ['roix0', 'roiy0', 'roix1', 'roiy1'], region ) ]
+  return { "values": fe.Encode( temperature_2d[ y0:y1+1, x0:x1+1 ], strEncoding ), "region": region, "nxpixel": NXPIXEL,
+           "nypixel": NYPIXEL, "encoding": strEncoding, "order": strOrder, "info": info, "maps": maps, "frames": frames }
+
+class FrameStorageNpyTest(unittest.TestCase):
+
+  def setUp(self):
+    self.tmpdir = tempfile.mkdtemp()
+
+  def tearDown(self):
+    shutil.rmtree( self.tmpdir, ignore_errors = True )
+
+  def check_temperature(self, strEncoding, read_2d, temperature_2d):
+    if strEncoding == "double":
+      numpy.testing.assert_array_equal( read_2d, temperature_2d )
+    elif strEncoding == "float":
+      numpy.testing.assert_allclose( read_2d, temperature_2d, rtol = 1.e-5, atol = 0. )
+    else:
+      numpy.testing.assert_allclose( read_2d, temperature_2d, rtol = 0., atol = 0.005 + 1.e-9 )
+
+  def test_layouts(self):
+    self.assertEqual( fs.LAYOUTS, { "frame": 1, "average": 2 } )
+    self.assertEqual( sorted( fe.ENCODINGS ), [ "centi", "double", "float" ] )
+
+  def test_frame_region(self):
+    region = (5, 3, 31, 20)
+    x0, y0, x1, y1 = region
+    temperature_2d = make_temperature()
+    for strEncoding in sorted( fe.ENCODINGS ):
+      strBase = os.path.join( self.tmpdir, "frame_" + strEncoding )
+      self.assertTrue( fs.WriteFrame( strBase, make_record( temperature_2d, strEncoding, "frame", region ), ("npy",) ) > 0 )
+      self.assertFalse( os.path.exists( strBase + ".root" ) )
+      self.assertEqual( numpy.load( strBase + ".npy" ).dtype, numpy.dtype( fe.GetEncoding( strEncoding )[1] ) )
+
+      record = fs.ReadFrame( strBase + ".json", FILL )
+      self.assertEqual( ( record[ "region" ], record[ "nxpixel" ], record[ "nypixel" ] ), ( region, NXPIXEL, NYPIXEL ) )
+      self.assertEqual( ( record[ "encoding" ], record[ "order" ], record[ "frames" ], record[ "maps" ] ), ( strEncoding, "frame", None, {} ) )
+      self.assertEqual( record[ "temperature" ].shape, (NYPIXEL, NXPIXEL) )
+      self.check_temperature( strEncoding, record[ "temperature" ][ y0:y1+1, x0:x1+1 ], temperature_2d[ y0:y1+1, x0:x1+1 ] )
+      # the pixels outside the region are the fill value
+      outside = numpy.ones( (NYPIXEL, NXPIXEL), dtype = bool )
+      outside[ y0:y1+1, x0:x1+1 ] = False
+      self.assertTrue( numpy.all( record[ "temperature" ][ outside ] == FILL ) )
+      self.assertEqual( record[ "info" ][ "roix1" ], 31 )
+      self.assertEqual( fs.ReadInfo( strBase ), record[ "info" ] )
+
+  def test_average(self):
+    temperature_2d = make_temperature( 12 )
+    noise_2d = numpy.random.RandomState( 13 ).uniform( 0.01, 0.2, (NYPIXEL, NXPIXEL) )
+    frames = [ (0, (2017, 8, 28, 13, 22, 0.1), 1), (1, (2017, 8, 28, 13, 22, 0.2), 0) ]
+    for strEncoding in sorted( fe.ENCODINGS ):
+      strBase = os.path.join( self.tmpdir, "frame_average_" + strEncoding )
+      fs.WriteFrame( strBase, make_record( temperature_2d, strEncoding, "average", maps = { "noise": noise_2d }, frames = frames ), ("npy",) )
+      self.assertEqual( fs.FrameFiles( strBase ), [ strBase + ".json", strBase + ".npy", strBase + ".noise.npy" ] )
+      f_json = open( strBase + ".json" )
+      self.assertEqual( json.load( f_json )[ "order" ], "average" )
+      f_json.close()
+
+      record = fs.ReadFrame( strBase, FILL )
+      self.assertEqual( ( record[ "encoding" ], record[ "order" ] ), ( strEncoding, "average" ) )
+      self.check_temperature( strEncoding, record[ "temperature" ], temperature_2d )
+      # the maps are stored as float32
+      numpy.testing.assert_allclose( record[ "maps" ][ "noise" ], noise_2d, rtol = 1.e-6 )
+      self.assertEqual( record[ "frames" ], frames )
+      self.assertEqual( record[ "info" ][ "tscale" ], fe.GetEncoding( strEncoding )[4] )
+
+  def test_centi_range(self):
+    # int16 centi-degrees cover -327.68 C to 327.67 C, beyond that they clip
+    temperature_2d = numpy.full( (NYPIXEL, NXPIXEL), 25. )
+    temperature_2d[0,:3] = [ -400., 327.67, 400. ]
+    strBase = os.path.join( self.tmpdir, "frame_centi" )
+    fs.WriteFrame( strBase, make_record( temperature_2d, "centi", "frame" ), ("npy",) )
+    numpy.testing.assert_allclose( fs.ReadFrame( strBase )[ "temperature" ][0,:4], [ -327.68, 327.67, 327.67, 25. ], atol = 1.e-9 )
+
+if __name__ == "__main__":
+  unittest.main()
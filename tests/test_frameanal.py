@@ -0,0 +1,73 @@
+"""
+@brief:
+  frameanal.py -nr on a synthetic npy average frame with ROOT absent: the
+  config is found from the projections (-pj, no OpenCV), the pipe profiles
+  are fitted with numpy and written to result.npz, and ROOT is never
+  imported (lazyRoot.IsLoaded()).
+
+  python -m pytest tests (or python -m unittest discover -s tests)
+"""
+
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+import numpy
+
+sys.path.insert( 0, os.path.join( os.path.dirname( os.path.abspath( __file__ ) ), ".." ) )
+
+import lazyRoot
+import frameStorage as fs
+
+STAVE_T = -25.
+PIPE_DT = -8.
+
+def make_frame(nxpixel = 640, nypixel = 480, seed = 1):
+  """
+  @brief: a cold stave (rows 210-261, columns 60-608) with two pipes along
+    it (rows 223 and 249) on a room temperature background, frame[y][x]
+  """
+  rng = numpy.random.RandomState( seed )
+  frame = 20. + 0.2 * rng.standard_normal( (nypixel, nxpixel) )
+  y = numpy.arange( 210, 262 )[:,None]
+  frame[210:262,60:609] = STAVE_T + PIPE_DT * ( numpy.exp( -0.5 * ( ( y - 223 ) / 2.5 ) ** 2 ) + numpy.exp( -0.5 * ( ( y - 249 ) / 2.5 ) ** 2 ) )
+  return frame
+
+class NoRootTest(unittest.TestCase):
+
+  def setUp(self):
+    if lazyRoot.IsLoaded():
+      self.skipTest( "ROOT already imported in this process" )
+    #an import of ROOT fails as if it was not installed
+    self._root = sys.modules.get( "ROOT" )
+    sys.modules[ "ROOT" ] = None
+    self.outdir = tempfile.mkdtemp()
+
+  def tearDown(self):
+    if self._root is None:
+      del sys.modules[ "ROOT" ]
+    else:
+      sys.modules[ "ROOT" ] = self._root
+    shutil.rmtree( self.outdir, ignore_errors = True )
+
+  def test_noroot_profile(self):
+    import frameanal
+    frame = make_frame()
+    record = { "values": frame, "region": [ 0, 0, 639, 479 ], "nxpixel": 640, "nypixel": 480, "encoding": "double",
+               "order": "frame", "info": [], "maps": {}, "frames": None }
+    fs.WriteFrame( self.outdir + "/frame_average", record, ("npy",) )
+    plotdir = self.outdir + "/plot"
+    frameanal.main( [ self.outdir + "/frame_average.json", self.outdir + "/config_frame", plotdir, "-nr", "-pj" ] )
+
+    self.assertFalse( lazyRoot.IsLoaded() )
+    self.assertTrue( os.path.isfile( self.outdir + "/config_frame" ) )
+    self.assertFalse( os.path.exists( plotdir + "/result.root" ) )
+    result = numpy.load( plotdir + "/result.npz" )
+    for strPipe in [ "top_pipe", "bot_pipe" ]:
+      temperature = result[ strPipe + "_temperature" ]
+      self.assertEqual( len( temperature ), len( result[ "edges" ] ) - 1 )
+      self.assertTrue( numpy.all( ( temperature > STAVE_T + PIPE_DT - 0.5 ) & ( temperature < STAVE_T ) ) )
+
+if __name__ == "__main__":
+  unittest.main()
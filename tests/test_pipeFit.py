@@ -0,0 +1,154 @@
+"""
+@brief:
+  The numpy pipe profile fits of pipeFit.py (frameanal.py -ff) on synthetic
+  profiles: against a grid search of the chi2 and, where ROOT and
+  frameanal.py import, against the MINUIT fits of FrameAnalysis.fit_hist.
+  Tolerances: chi2 within 0.1% of the grid minimum (or of MINUIT), and
+  against MINUIT the temperature within 0.01 C, the mean and width within
+  0.01 pixel.
+
+  python -m pytest tests (or python -m unittest discover -s tests)
+"""
+
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+import numpy
+
+sys.path.insert( 0, os.path.join( os.path.dirname( os.path.abspath( __file__ ) ), ".." ) )
+
+import pipeFit as pf
+
+HOT_LIMITS = (0.00001, 100.)
+COLD_LIMITS = (-100., 10.)
+
+def make_profiles(nprofile, nbins, cold, seed = 3):
+  """
+  @brief: pipe profiles of nbins pixels: a gaussian on a flat stave level, as
+    the 40% of the pipe region of frameanal.py, rounded to float32 as the
+    TH1F bins, with the errors of the mean of 50 frames of 0.1 C noise
+  """
+  rng = numpy.random.RandomState( seed )
+  x = numpy.arange( nbins ) + 0.5
+  mean = rng.uniform( 0.35 * nbins, 0.65 * nbins, nprofile )
+  width = rng.uniform( 0.22 * nbins, 0.4 * nbins, nprofile )
+  if cold:
+    level, depth = rng.uniform( -22., -18., nprofile ), rng.uniform( -12., -6., nprofile )
+  else:
+    level, depth = rng.uniform( 18., 22., nprofile ), rng.uniform( 6., 12., nprofile )
+  err_2d = numpy.full( (nprofile, nbins), 0.1 / numpy.sqrt( 50. ) )
+  t_2d = level[:,None] + depth[:,None] * numpy.exp( -0.5 * ( ( x - mean[:,None] ) / width[:,None] ) ** 2 )
+  t_2d += err_2d * rng.standard_normal( t_2d.shape )
+  return t_2d.astype( numpy.float32 ).astype( float ), err_2d
+
+def grid_chi2(t_2d, err_2d, limits, npoint = 301):
+  """
+  @brief: smallest chi2 of every profile on a grid of the mean and width
+    within limits, the temperature at its best value for each grid point
+  """
+  nprofile, nbins = t_2d.shape
+  x = numpy.arange( nbins ) + 0.5
+  w2 = 1. / err_2d ** 2
+  best = numpy.full( nprofile, numpy.inf )
+  for mean in numpy.linspace( limits[1][0], limits[1][1], npoint ):
+    for iprofile in range( nprofile ):
+      lo, hi = limits[2][0][iprofile], limits[2][1][iprofile]
+      widths = numpy.linspace( max( lo, 0.05 ), hi, npoint )
+      g = numpy.exp( -0.5 * ( ( x[None,:] - mean ) / widths[:,None] ) ** 2 )
+      t = ( w2[iprofile] * t_2d[iprofile] * g ).sum( axis = 1 ) / ( w2[iprofile] * g * g ).sum( axis = 1 )
+      t = numpy.clip( t, limits[0][0], limits[0][1] )
+      chi2 = ( w2[iprofile] * ( t_2d[iprofile] - t[:,None] * g ) ** 2 ).sum( axis = 1 )
+      best[iprofile] = min( best[iprofile], chi2.min() )
+  return best
+
+def fit_limits(t_2d, err_2d, t_limits):
+  """
+  @brief: the limits of pf.FitProfiles, per profile for the width
+  """
+  nprofile, nbins = t_2d.shape
+  constant, mean, rms, valid = pf.InitGaus( t_2d, err_2d )
+  return [ t_limits, (nbins / 4., nbins * 3 / 4.),
+           (numpy.where( valid, 0., nbins / 5. ), numpy.where( valid, 10. * rms, nbins * 3 / 4. )) ]
+
+class PipeFitTest(unittest.TestCase):
+
+  def check_grid(self, cold):
+    t_2d, err_2d = make_profiles( 12, 14, cold )
+    t_limits = COLD_LIMITS if cold else HOT_LIMITS
+    temp, mean, width, chi2, ndf = pf.FitProfiles( t_2d, err_2d, t_limits )
+    best = grid_chi2( t_2d, err_2d, fit_limits( t_2d, err_2d, t_limits ) )
+    self.assertTrue( numpy.all( chi2 <= best * ( 1. + 1.e-3 ) ), "fit chi2 %s above the grid minimum %s" % ( chi2, best ) )
+    self.assertTrue( numpy.all( ndf == 14 - 3 ) )
+
+  def test_hot_profiles_grid(self):
+    self.check_grid( False )
+
+  def test_cold_profiles_grid(self):
+    self.check_grid( True )
+
+  def test_gaussian_recovered(self):
+    nbins = 14
+    x = numpy.arange( nbins ) + 0.5
+    truth = numpy.array( [ [ 30., 6.2, 3.5 ], [ 25., 7.9, 4.1 ], [ -28., 6.8, 3.9 ], [ -35., 7.3, 4.4 ] ] )
+    t_2d = truth[:,0:1] * numpy.exp( -0.5 * ( ( x - truth[:,1:2] ) / truth[:,2:3] ) ** 2 )
+    err_2d = numpy.full( t_2d.shape, 0.01 )
+    for rows, t_limits in [ ( slice( 0, 2 ), HOT_LIMITS ), ( slice( 2, 4 ), COLD_LIMITS ) ]:
+      fit = pf.FitProfiles( t_2d[rows], err_2d[rows], t_limits )
+      numpy.testing.assert_allclose( numpy.column_stack( fit[:3] ), truth[rows], atol = 1.e-4 )
+
+  def test_zero_error_bins_left_out(self):
+    t_2d, err_2d = make_profiles( 4, 14, False )
+    err_2d[:,0] = 0.
+    t_2d[:,0] = 1000.
+    temp, mean, width, chi2, ndf = pf.FitProfiles( t_2d, err_2d, HOT_LIMITS )
+    self.assertTrue( numpy.all( ndf == 14 - 1 - 3 ) )
+    self.assertTrue( numpy.all( temp < 40. ) )
+
+class PipeFitRootTest(unittest.TestCase):
+  """
+  @brief: pf.FitProfiles against FrameAnalysis.fit_hist, needs ROOT and the
+    imports of frameanal.py (OpenCV)
+  """
+
+  def setUp(self):
+    try:
+      import ROOT
+      import frameanal
+    except Exception as error:
+      self.skipTest( "ROOT or frameanal.py not importable: " + str( error ) )
+    ROOT.gROOT.SetBatch( True )
+    self.ROOT = ROOT
+    self.outdir = tempfile.mkdtemp()
+    self.analysis = frameanal.FrameAnalysis.__new__( frameanal.FrameAnalysis )
+    self.analysis._fit_outdir = self.outdir
+
+  def tearDown(self):
+    shutil.rmtree( self.outdir, ignore_errors = True )
+
+  def check_root(self, cold):
+    nbins = 14
+    t_2d, err_2d = make_profiles( 8, nbins, cold )
+    self.analysis._parameters = { "LiquidTLow": 1 if cold else 0 }
+    fast = numpy.column_stack( pf.FitProfiles( t_2d, err_2d, COLD_LIMITS if cold else HOT_LIMITS ) )
+    for iprofile in range( t_2d.shape[0] ):
+      h1 = self.ROOT.TH1F( "p" + str( iprofile ), "p" + str( iprofile ), nbins, 0., float( nbins ) )
+      for ibin in range( nbins ):
+        h1.SetBinContent( ibin + 1, t_2d[iprofile][ibin] )
+        h1.SetBinError( ibin + 1, err_2d[iprofile][ibin] )
+      temp, mean, width, chi2, ndf = self.analysis.fit_hist( h1 )
+      self.assertAlmostEqual( fast[iprofile][0], temp, delta = 0.01 )
+      self.assertAlmostEqual( fast[iprofile][1], mean, delta = 0.01 )
+      self.assertAlmostEqual( fast[iprofile][2], width, delta = 0.01 )
+      self.assertAlmostEqual( fast[iprofile][3], chi2, delta = 1.e-3 * chi2 )
+      self.assertEqual( fast[iprofile][4], ndf )
+
+  def test_hot_profiles_root(self):
+    self.check_root( False )
+
+  def test_cold_profiles_root(self):
+    self.check_root( True )
+
+if __name__ == "__main__":
+  unittest.main()